@@ -8,8 +8,15 @@ from src.github_stats_cdk_stack import GithubStatsCdkStack
 platform = platform.machine()
 
 access_token = os.environ["GITHUB_TOKEN"]
-org_name = os.environ["GITHUB_ORG_NAME"]
-team_name = os.environ["GITHUB_TEAM_NAME"]
+# Optional extra tokens, "token" or "pattern|pattern=token" entries separated by commas
+tokens = os.environ.get("GITHUB_TOKENS", "")
+# "monthly" writes packed per-month items to the github_stats_monthly table
+layout = os.environ.get("GITHUB_STATS_LAYOUT", "daily")
+# Comma separated "org/team" pairs to sweep in one run; GITHUB_ORG_NAME and
+# GITHUB_TEAM_NAME name a single team and are only needed without it
+teams = os.environ.get("GITHUB_TEAMS", "")
+org_name = os.environ["GITHUB_ORG_NAME"] if not teams else os.environ.get("GITHUB_ORG_NAME", "")
+team_name = os.environ["GITHUB_TEAM_NAME"] if not teams else os.environ.get("GITHUB_TEAM_NAME", "")
 account = os.environ["CDK_DEFAULT_ACCOUNT"]
 region = os.environ["CDK_DEFAULT_REGION"]
 
@@ -20,6 +27,9 @@ GithubStatsCdkStack(
     org_name=org_name,
     team_name=team_name,
     access_token=access_token,
+    tokens=tokens,
+    teams=teams,
+    layout=layout,
     platform=platform,
     env=Environment(account=account, region=region),
 )
@@ -7,8 +7,15 @@ APP_NAME = os.path.basename(sys.argv[0])
 FILEPATH = os.getcwd()
 DATA_DIR = "data"
 NOW = datetime.now().strftime("%d-%m-%Y-%H-%M")
-AWS_REGION = "eu-west-1"
+AWS_REGION = os.environ.get("AWS_REGION", "eu-west-1")
 DDB_TABLE_NAME = "github_stats"
+STATS_STORE = os.environ.get("GITHUB_STATS_STORE", f"dynamodb://{DDB_TABLE_NAME}")
+MONTHLY_STATS_STORE = f"dynamodb-monthly://{DDB_TABLE_NAME}_monthly"
+ARCHIVE_STORE = os.environ.get("GITHUB_STATS_ARCHIVE", f"file://{FILEPATH}/{DATA_DIR}/archive")
+ARCHIVE_HORIZON_DAYS = int(os.environ.get("GITHUB_STATS_ARCHIVE_DAYS", "400"))
 OUTPUT_FILE = f"{FILEPATH}/{DATA_DIR}/github_stats-{NOW}.pdf"
+MIRROR_FILE = f"{FILEPATH}/{DATA_DIR}/github_stats.sqlite"
 REGION = "eu-west-1"
 LAMBDA_FUNCTION_NAME = "GithubStatsFunction"
+TRENDS_DAYS = 90
+TRENDS_TOP_REPOS = 25
@@ -10,28 +10,38 @@ from queue import Queue
 from time import sleep, time
 import datetime
 
-import boto3
-import matplotlib.pyplot as plt
-import numpy as np
 from rich.console import Console
-from rich.progress import Progress, BarColumn, TextColumn
 from rich.table import Table
 
 import config
+from stats_archive import compact
+from stats_mirror import StatsMirror
+from stats_storage import open_store
+
+# boto3, matplotlib, numpy and rich.progress are imported by the functions that
+# need them, so --list doesn't pay for the plotting stack
 
 console = Console()
 
-# Create command-line argument parser and define arguments
-parser = argparse.ArgumentParser(
-    description=f"{config.APP_NAME}",
-)
 
-group = parser.add_mutually_exclusive_group(required=False)
-group.add_argument("--run", "-r", action="store_true", help="Visualise data with current statistics")
-parser.add_argument("--update", "-u", action="store_true", help="Invoke the Lambda function to update the statistics")
-group.add_argument("--list", "-l", action="store_true", help="List Repositories")
+def parse_args(argv=None):
+    # Create command-line argument parser and define arguments
+    parser = argparse.ArgumentParser(
+        description=f"{config.APP_NAME}",
+    )
+
+    group = parser.add_mutually_exclusive_group(required=False)
+    group.add_argument("--run", "-r", action="store_true", help="Visualise data with current statistics")
+    parser.add_argument("--update", "-u", action="store_true",
+                        help="Invoke the Lambda function to update the statistics")
+    group.add_argument("--list", "-l", action="store_true", help="List Repositories")
+    group.add_argument("--compact", "-c", action="store_true",
+                       help=f"Archive datapoints older than {config.ARCHIVE_HORIZON_DAYS} days")
+    parser.add_argument("--refresh", "-f", nargs="?", const="new", choices=("new", "all"),
+                        help="Refresh the local mirror first: new datapoints of known repositories (default), "
+                             "or all repositories and datapoints")
 
-args = parser.parse_args()
+    return parser.parse_args(argv)
 
 
 def invoke_lambda_function(*, function_name: str = None, payload: typing.Mapping[str, str] = None,
@@ -39,6 +49,8 @@ def invoke_lambda_function(*, function_name: str = None, payload: typing.Mapping
     if function_name is None:
         raise Exception('ERROR: functionName parameter cannot be NULL')
 
+    import boto3
+
     payload_str = json.dumps(payload)
     payload_bytes_arr = bytes(payload_str, encoding='utf8')
 
@@ -54,6 +66,8 @@ def invoke_lambda_function(*, function_name: str = None, payload: typing.Mapping
 
 
 def update_stats(invoke_lambda):
+    from rich.progress import Progress, BarColumn, TextColumn
+
     payload_obj = {"Key": "Value"}  # Dummy test payload to invoke the Lambda function
 
     # Create a queue to hold the response from the invokeLambdaFunction
@@ -94,53 +108,35 @@ def update_stats(invoke_lambda):
     response_dict = json.loads(response_payload)
     print(response_dict)
     if response_dict["statusCode"] == 200 and response_dict["body"] == "\"Stats updated successfully.\"":
-        console.print("[green]Success[/green], stats updated")
+        stats = response_dict.get("stats") or {}
+        if stats:
+            console.print(f"[green]Success[/green], stats updated: {stats['records']} datapoints of {stats['repos']} repos")
+        else:
+            console.print("[green]Success[/green], stats updated")
     else:
         console.print("[red]Issue[/red], stats not updated")
         sys.exit(1)
 
 
-def visualize_data(ddb_table_name):
-    # create the data directory if it does not exist
-    os.makedirs(config.DATA_DIR, exist_ok=True)
-
-    # initialize the dynamodb resource
-    dynamodb = boto3.resource("dynamodb", region_name=config.AWS_REGION)
-
-    # initialize the dynamodb table
-    table = dynamodb.Table(ddb_table_name)
-
-    # query the table for all items
-    response = table.scan()
-    repo_data = response["Items"]
-
-    # extract the unique repository names
-    repos = list(set(d["repo_name"] for d in repo_data))
+def visualize_data(store):
+    import matplotlib.pyplot as plt
+    import numpy as np
+    from matplotlib.backends.backend_pdf import PdfPages
 
-    # initialize empty dictionaries to store the counts and uniques for each repository
-    stat_counts = {repo: {"clones": 0, "views": 0} for repo in repos}
-    type_uniques = {repo: {"clones": 0, "views": 0} for repo in repos}
+    from analytics import StatsMatrix
 
-    # iterate over the data and aggregate the counts and uniques for each repository
-    # iterate over the data and aggregate the counts and uniques for each repository
-    for d in repo_data:
-        repo = d["repo_name"]
-        stat_type = d["stat_type"]
-
-        if "_" in stat_type:
-            _, stat_type = stat_type.split("_", 1)
-
-        count = int(d["count"])
-        uniques = int(d["uniques"])
+    # create the data directory if it does not exist
+    os.makedirs(config.DATA_DIR, exist_ok=True)
 
-        stat_counts[repo][stat_type] += count
-        type_uniques[repo][stat_type] += uniques
+    # sum the counts and uniques for each repository
+    stat_totals = store.aggregate()
+    repos = list(stat_totals)
 
     # extract the aggregated counts and uniques for each repository
-    clones_counts = [stat_counts[repo]["clones"] for repo in repos]
-    views_counts = [stat_counts[repo]["views"] for repo in repos]
-    clones_uniques = [type_uniques[repo]["clones"] for repo in repos]
-    views_uniques = [type_uniques[repo]["views"] for repo in repos]
+    clones_counts = [stat_totals[repo]["clones"]["count"] for repo in repos]
+    views_counts = [stat_totals[repo]["views"]["count"] for repo in repos]
+    clones_uniques = [stat_totals[repo]["clones"]["uniques"] for repo in repos]
+    views_uniques = [stat_totals[repo]["views"]["uniques"] for repo in repos]
 
     # set the x-axis tick labels to be the repository names
     x_labels = [repo.split("/")[1] if "/" in repo else repo for repo in repos]
@@ -206,7 +202,14 @@ def visualize_data(ddb_table_name):
     # adjust the layout to fit the legend
     # plt.subplots_adjust(right=0.85, left=0.1, bottom=0.3)
     plt.subplots_adjust(left=0.2, right=0.85, bottom=0.4, top=0.9)
-    plt.savefig(config.OUTPUT_FILE)
+
+    # load the recent daily history of every repository for the trends page
+    trends_start = (datetime.date.today() - datetime.timedelta(days=config.TRENDS_DAYS)).isoformat()
+    matrix = StatsMatrix.from_store(store, repos=repos, start=trends_start)
+
+    with PdfPages(config.OUTPUT_FILE) as pdf:
+        pdf.savefig(fig)
+        pdf.savefig(plot_trends(matrix, current_date))
 
     # open the image in the default browser
     file_uri = 'file:///' + config.OUTPUT_FILE
@@ -215,19 +218,52 @@ def visualize_data(ddb_table_name):
     webbrowser.open_new_tab(file_uri)
 
 
-def list_github_repos(ddb_table_name):
-    # initialize the dynamodb resource
-    dynamodb = boto3.resource("dynamodb", region_name=config.AWS_REGION)
+def plot_trends(matrix, current_date):
+    import matplotlib.pyplot as plt
+    import numpy as np
+
+    # pick the repositories with the most views over the last week
+    rows = sorted(matrix.summary(), key=lambda row: row["views_7d"], reverse=True)[:config.TRENDS_TOP_REPOS]
+    labels = [row["repo"].split("/")[1] if "/" in row["repo"] else row["repo"] for row in rows]
+    y_pos = np.arange(len(rows))
+    height = 0.4
+
+    # week-over-week growth as a percentage, repos without a previous week show as zero
+    views_growth = [100 * (row["views_wow"] or 0) for row in rows]
+    clones_growth = [100 * (row["clones_wow"] or 0) for row in rows]
+
+    fig, ax = plt.subplots(figsize=(20, 8))
+    ax.barh(y_pos, views_growth, height=height, color="b", alpha=0.5, label="Views")
+    ax.barh(y_pos + height, clones_growth, height=height, color="r", alpha=0.5, label="Clones")
+    ax.axvline(0, color="black", linewidth=0.8)
+
+    # mark repositories with a traffic spike in the last two weeks
+    for i, row in enumerate(rows):
+        spikes = row["views_spikes"] + row["clones_spikes"]
+        if spikes:
+            ax.annotate(f"spike {max(spikes)}", (0, i + height / 2), xytext=(5, 0),
+                        textcoords="offset points", va="center", fontsize=8, color="darkred")
+
+    ax.set_yticks(y_pos + height / 2)
+    ax.set_yticklabels(labels, fontsize=8)
+    ax.invert_yaxis()
+    ax.set_xlabel("Week-over-week growth (%)", fontsize=14, weight='bold', color='blue')
+    ax.set_title(f"Busiest Repositories, Week over Week, as of {current_date}", wrap=True, fontsize=14,
+                 weight='bold', color='blue')
+    ax.legend()
+
+    # add the percentiles of total views across all repositories
+    p50, p90, p99 = matrix.percentiles()[:, 0, 0]
+    fig.text(0.2, 0.02, f"Views per repository over the last {config.TRENDS_DAYS} days, "
+                        f"p50 / p90 / p99: {p50:.0f} / {p90:.0f} / {p99:.0f}")
 
-    # initialize the dynamodb table
-    table = dynamodb.Table(ddb_table_name)
+    plt.subplots_adjust(left=0.2, right=0.85, bottom=0.1, top=0.9)
+    return fig
 
-    # query the table for all items
-    response = table.scan()
-    repo_data = response["Items"]
 
-    # extract the unique repository names
-    repos = list(set(d["repo_name"] for d in repo_data))
+def list_github_repos(store):
+    # extract the unique repository names from the stats store
+    repos = store.list_repos()
 
     # Create a new table
     table = Table(show_header=True, header_style="bold blue")
@@ -244,12 +280,43 @@ def list_github_repos(ddb_table_name):
     console.print(table)
 
 
+def open_mirror(stats_store, refresh=None):
+    # open the local mirror, syncing it from the stats store and its archive when asked or never synced
+    mirror = StatsMirror(config.MIRROR_FILE)
+    last_synced = mirror.last_synced()
+    if refresh or last_synced is None:
+        remote = open_store(stats_store, region_name=config.AWS_REGION, archive=config.ARCHIVE_STORE)
+        with console.status(f"Refreshing the local mirror from {stats_store}..."):
+            summary = mirror.sync(remote, full=refresh == "all")
+        console.print(
+            f"[green]Refreshed[/green] {summary['repos']} repositories, {summary['records']} datapoints "
+            f"in {summary['queries']} queries"
+        )
+    else:
+        console.print(f"[dim]Using the local mirror, last refreshed {last_synced} (--refresh to update)[/dim]")
+    return mirror
+
+
+def compact_stats(stats_store):
+    # move datapoints past the retention horizon from the stats store into the archive
+    store = open_store(stats_store, region_name=config.AWS_REGION, archive=config.ARCHIVE_STORE)
+    with console.status(f"Archiving datapoints older than {config.ARCHIVE_HORIZON_DAYS} days..."):
+        summary = compact(store, store.archive, config.ARCHIVE_HORIZON_DAYS)
+
+    console.print(
+        f"[green]Archived[/green] {summary['records']} datapoints of {summary['repos']} repositories "
+        f"up to {summary['archived_through']} into {summary['objects']} objects in {config.ARCHIVE_STORE}"
+    )
+
+
 def print_usage():
     print(f"Usage: python3 {config.PROGRAM_NAME} [options]")
     print("Options:")
     print("\t--list\t\tList the GitHub repositories")
     print("\t--update\tUpdate the GitHub repository stats")
     print("\t--run\t\tRun the data visualization")
+    print("\t--compact\tArchive datapoints past the retention horizon")
+    print("\t--refresh [all]\tRefresh the local mirror, with all to rebuild it")
     print("\t--help\t\tPrint this help message")
 
 
@@ -258,11 +325,16 @@ if __name__ == "__main__":
         """
         Main function, parse command line arguments and run the appropriate function
         """
+        args = parse_args()
         if args.list:
-            list_github_repos(config.DDB_TABLE_NAME)
+            list_github_repos(open_mirror(config.STATS_STORE, args.refresh))
         elif args.update:
             update_stats(config.LAMBDA_FUNCTION_NAME)
         elif args.run:
-            visualize_data(config.DDB_TABLE_NAME)
+            visualize_data(open_mirror(config.STATS_STORE, args.refresh))
+        elif args.compact:
+            compact_stats(config.STATS_STORE)
+        elif args.refresh:
+            open_mirror(config.STATS_STORE, args.refresh)
         else:
             print_usage()
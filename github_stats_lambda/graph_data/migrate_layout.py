@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+Copies the stats from one store layout to another, by default from the daily
+items of the github_stats table to the packed monthly items of
+github_stats_monthly:
+
+    python3 migrate_layout.py
+    python3 migrate_layout.py --source dynamodb://github_stats --target dynamodb-monthly://github_stats_monthly
+
+Repos are copied one at a time, so memory stays flat, and the copy is safe
+to re-run as datapoints are replaced rather than added. The totals of both
+stores are compared at the end.
+"""
+import argparse
+import sys
+
+from rich.console import Console
+
+import config
+from stats_storage import open_store, stat_types
+
+console = Console()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Copy the GitHub stats between store layouts")
+    parser.add_argument("--source", "-s", default=config.STATS_STORE,
+                        help=f"Store to copy from (default: {config.STATS_STORE})")
+    parser.add_argument("--target", "-t", default=config.MONTHLY_STATS_STORE,
+                        help=f"Store to copy to (default: {config.MONTHLY_STATS_STORE})")
+    parser.add_argument("--no-verify", action="store_true", help="Skip comparing the totals of both stores")
+    return parser.parse_args(argv)
+
+
+def migrate(source, target):
+    # copy every repo's history, both stat types in one write
+    repos = source.list_repos()
+    copied = 0
+    for i, repo in enumerate(repos):
+        records = [record for stat_type in stat_types for record in source.read_range(repo, stat_type)]
+        target.upsert_many(records)
+        copied += len(records)
+        console.print(f"[{i + 1}/{len(repos)}] {repo}: {len(records)} datapoints")
+    return repos, copied
+
+
+def verify(source, target):
+    # compare the per repo totals of both stores
+    source_totals = source.aggregate()
+    target_totals = target.aggregate()
+    mismatched = [
+        repo for repo in set(source_totals) | set(target_totals)
+        if source_totals.get(repo) != target_totals.get(repo)
+    ]
+    for repo in sorted(mismatched):
+        console.print(f"[red]Mismatch[/red] {repo}: {source_totals.get(repo)} != {target_totals.get(repo)}")
+    return not mismatched
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    source = open_store(args.source, region_name=config.AWS_REGION)
+    target = open_store(args.target, region_name=config.AWS_REGION)
+    if hasattr(target, "create_table_if_not_exists"):
+        target.create_table_if_not_exists()
+
+    repos, copied = migrate(source, target)
+    console.print(f"[green]Copied[/green] {copied} datapoints of {len(repos)} repositories to {args.target}")
+
+    if not args.no_verify:
+        if not verify(source, target):
+            sys.exit(1)
+        console.print("[green]Verified[/green], the totals of both stores match")
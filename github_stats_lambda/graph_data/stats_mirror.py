@@ -0,0 +1,84 @@
+"""
+Local incremental mirror of the stats table for the graph_data CLI
+
+The mirror is a SQLite database under config.DATA_DIR holding the full daily
+history of every repo, from the hot table and its archive alike, so reports
+and listings read a local file without touching the network. A refresh only
+queries each repo for the dates from its high-water mark on: the sort keys
+are "<date>_<stat_type>", so that is a key-range query rather than a scan.
+"""
+from datetime import date, datetime, timedelta, timezone
+
+from stats_storage import SqliteStore, stat_types
+
+# The Lambda re-fetches the GitHub traffic API's 14 day window every hour and
+# updates those items in place, so a refresh re-reads them too
+lookback_days = 14
+
+
+class StatsMirror(SqliteStore):
+    """
+    SQLite copy of a remote stats store, with the sync state of every series
+    """
+
+    schema = SqliteStore.schema + """;
+        CREATE TABLE IF NOT EXISTS sync_state (
+            repo_name TEXT NOT NULL,
+            stat_type TEXT NOT NULL,
+            high_water_mark TEXT NOT NULL,
+            synced_at TEXT NOT NULL,
+            PRIMARY KEY (repo_name, stat_type)
+        ) WITHOUT ROWID
+    """
+
+    def high_water_marks(self):
+        """
+        Returns {(repo_name, stat_type): date} of the newest datapoint synced for each series
+        """
+        rows = self.connect().execute("SELECT repo_name, stat_type, high_water_mark FROM sync_state")
+        return {(repo_name, stat_type): mark for repo_name, stat_type, mark in rows}
+
+    def last_synced(self):
+        """
+        Returns when the mirror was last refreshed, or None if it never was
+        """
+        return self.connect().execute("SELECT MAX(synced_at) FROM sync_state").fetchone()[0]
+
+    def sync(self, remote, full=False):
+        """
+        Pulls the new datapoints of every mirrored repo from the remote store; a full
+        sync rebuilds the mirror from a listing of the remote, picking up new repos
+        """
+        connection = self.connect()
+        marks = {} if full else self.high_water_marks()
+        if marks:
+            repos = sorted(set(repo_name for repo_name, _ in marks))
+        else:
+            repos = remote.list_repos()
+            with connection:
+                connection.execute("DELETE FROM stats")
+                connection.execute("DELETE FROM sync_state")
+
+        synced_at = datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+        summary = {"repos": len(repos), "queries": 0, "records": 0}
+        for repo_name in repos:
+            for stat_type in stat_types:
+                mark = marks.get((repo_name, stat_type))
+                start = None
+                if mark:
+                    start = (date.fromisoformat(mark) - timedelta(days=lookback_days)).isoformat()
+
+                records = remote.read_range(repo_name, stat_type, start=start)
+                summary["queries"] += 1
+                summary["records"] += len(records)
+                if records:
+                    mark = max(mark or "", records[-1]["date"])
+                self.upsert_many(records)
+
+                if mark:
+                    with connection:
+                        connection.execute(
+                            "INSERT OR REPLACE INTO sync_state VALUES (?, ?, ?, ?)",
+                            (repo_name, stat_type, mark, synced_at),
+                        )
+        return summary
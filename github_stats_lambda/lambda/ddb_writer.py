@@ -0,0 +1,182 @@
+"""
+Rate-limited, adaptive batch writes to DynamoDB
+
+BatchWriteItem requests are paced by a token bucket refilled at the table's
+write capacity and holding its 5 minute burst allowance. Every request asks
+for ReturnConsumedCapacity, so the bucket is charged what DynamoDB actually
+consumed rather than an estimate. Unprocessed items and throttling errors
+shrink the batch size and are retried with exponential backoff and jitter;
+clean batches grow it back towards the 25-item maximum.
+"""
+import logging
+import random
+import time
+
+logger = logging.getLogger("GitHubStats")
+
+# Errors DynamoDB raises when a request exceeds the table's throughput
+throttling_errors = (
+    "ProvisionedThroughputExceededException",
+    "ThrottlingException",
+    "RequestLimitExceeded",
+)
+
+
+class TokenBucket:
+    """
+    Token bucket refilled at rate tokens per second, holding at most capacity tokens;
+    a rate of None disables pacing
+    """
+
+    def __init__(self, rate, capacity=None, clock=time.monotonic, sleep=time.sleep):
+        self.rate = rate
+        self.max_rate = rate
+        self.capacity = capacity or rate
+        self.tokens = self.capacity or 0
+        self.clock = clock
+        self.sleep = sleep
+        self.updated = clock()
+
+    def refill(self):
+        now = self.clock()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self, tokens):
+        """
+        Waits until the bucket holds at least tokens (or is full) before a request
+        """
+        if self.rate is None:
+            return
+        self.refill()
+        needed = min(tokens, self.capacity)
+        if self.tokens < needed:
+            self.sleep((needed - self.tokens) / self.rate)
+            self.refill()
+
+    def charge(self, tokens):
+        """
+        Deducts what a request consumed; the balance may go negative, delaying the next request
+        """
+        if self.rate is None:
+            return
+        self.refill()
+        self.tokens -= tokens
+
+    def slow_down(self, factor=0.8, minimum=1.0):
+        """
+        Lowers the refill rate after throttling, the table sustains less than configured
+        """
+        if self.rate is not None:
+            self.rate = max(minimum, self.rate * factor)
+
+    def speed_up(self, step=1.0):
+        """
+        Raises the refill rate back towards the configured rate after clean requests
+        """
+        if self.rate is not None:
+            self.rate = min(self.max_rate, self.rate + step)
+
+
+class BatchWriteScheduler:
+    """
+    Writes items to one table in adaptive batches at the table's sustainable rate
+    """
+
+    max_batch_size = 25
+    # DynamoDB banks up to 5 minutes of unused provisioned capacity as burst
+    # credits, which an hourly run on an otherwise idle table can spend
+    burst_seconds = 300
+
+    def __init__(self, dynamodb_resource, table_name, write_rate=None, max_retries=8,
+                 base_delay=0.05, max_delay=5.0, clock=time.monotonic, sleep=time.sleep):
+        self.dynamodb_resource = dynamodb_resource
+        self.table_name = table_name
+        capacity = write_rate * self.burst_seconds if write_rate else None
+        self.bucket = TokenBucket(write_rate, capacity=capacity, clock=clock, sleep=sleep)
+        self.batch_size = self.max_batch_size
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.sleep = sleep
+        self.stats = {}
+
+    @classmethod
+    def for_table(cls, dynamodb_resource, table_name, write_rate=None, **kwargs):
+        """
+        Creates a scheduler paced at the table's provisioned write capacity, or
+        unpaced for on-demand tables, unless write_rate is given
+        """
+        if write_rate is None:
+            table = dynamodb_resource.Table(table_name)
+            billing_mode = (table.billing_mode_summary or {}).get("BillingMode")
+            if billing_mode != "PAY_PER_REQUEST":
+                write_rate = table.provisioned_throughput.get("WriteCapacityUnits") or None
+        return cls(dynamodb_resource, table_name, write_rate=write_rate, **kwargs)
+
+    def backoff(self, attempt):
+        """
+        Sleeps for an exponentially growing, fully jittered delay
+        """
+        self.sleep(random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt)))
+
+    def write(self, items):
+        """
+        Puts all items, retrying unprocessed ones; raises once a batch exhausts its retries
+        """
+        from botocore.exceptions import ClientError
+
+        self.stats = {"items": 0, "requests": 0, "consumed": 0.0, "unprocessed": 0, "throttled": 0}
+        pending = [{"PutRequest": {"Item": item}} for item in items]
+        attempt = 0
+
+        while pending:
+            batch, pending = pending[:self.batch_size], pending[self.batch_size:]
+            # Items under 1KB cost one write unit each
+            self.bucket.acquire(len(batch))
+
+            try:
+                response = self.dynamodb_resource.batch_write_item(
+                    RequestItems={self.table_name: batch},
+                    ReturnConsumedCapacity="TOTAL",
+                )
+            except ClientError as e:
+                if e.response["Error"]["Code"] not in throttling_errors:
+                    raise
+                self.stats["throttled"] += 1
+                unprocessed = batch
+                consumed = 0.0
+            else:
+                self.stats["requests"] += 1
+                unprocessed = response.get("UnprocessedItems", {}).get(self.table_name, [])
+                consumed = sum(c.get("CapacityUnits", 0) for c in response.get("ConsumedCapacity", []))
+
+            self.bucket.charge(consumed)
+            self.stats["consumed"] += consumed
+            self.stats["items"] += len(batch) - len(unprocessed)
+
+            if unprocessed:
+                # Multiplicative decrease: smaller batches and a slower rate
+                self.stats["unprocessed"] += len(unprocessed)
+                self.batch_size = max(1, self.batch_size // 2)
+                self.bucket.slow_down()
+                attempt += 1
+                if attempt > self.max_retries:
+                    raise RuntimeError(
+                        f"{len(unprocessed) + len(pending)} items not written to "
+                        f"{self.table_name} after {self.max_retries} retries"
+                    )
+                self.backoff(attempt)
+                pending = unprocessed + pending
+            else:
+                # Additive increase back towards full batches and the full rate
+                attempt = 0
+                self.batch_size = min(self.max_batch_size, self.batch_size + 1)
+                self.bucket.speed_up()
+
+        logger.info(
+            f"Wrote {self.stats['items']} items to {self.table_name} in {self.stats['requests']} "
+            f"requests, {self.stats['consumed']:.0f} WCU consumed, "
+            f"{self.stats['unprocessed']} unprocessed and {self.stats['throttled']} throttled"
+        )
+        return self.stats
@@ -0,0 +1,180 @@
+"""
+Pipelined ingestion of GitHub traffic stats
+
+Fetching from GitHub, turning the merged traffic of each repo (see
+repo_traffic) into batches of storage records and writing the batches to the
+store run as concurrent stages joined by bounded queues:
+
+    repos -> fetchers (threads) -> transformer -> batched writer
+
+so network time to GitHub and to DynamoDB overlap and a run takes about as
+long as the slower of the two. Full queues block the stage feeding them,
+which bounds memory to a few batches however many repos there are, and a
+failure in any stage stops the others.
+"""
+import logging
+import queue
+import threading
+import time
+
+from stats_storage import traffic_popular, traffic_records
+
+logger = logging.getLogger("GitHubStats")
+
+# Marks the end of a stage's output
+done = object()
+
+
+class PipelineStopped(Exception):
+    """
+    Raised in a stage when another stage failed
+    """
+
+
+class IngestPipeline:
+    """
+    Fetches the traffic of many repos concurrently and writes it in batches as it arrives
+
+    fetch(repo) returns the repo's merged traffic record; a batch holds the
+    storage records and popular snapshots of whole repos, closed once it has
+    batch_size datapoints.
+    """
+
+    def __init__(self, fetch, store, fetchers=8, batch_size=100, queue_size=None, accumulate=True):
+        self.fetch = fetch
+        self.store = store
+        self.fetchers = fetchers
+        self.batch_size = batch_size
+        self.accumulate = accumulate
+        queue_size = queue_size or 2 * fetchers
+        self.tasks = queue.Queue(maxsize=queue_size)
+        self.fetched = queue.Queue(maxsize=queue_size)
+        self.batches = queue.Queue(maxsize=4)
+        self.stop = threading.Event()
+        self.errors = []
+        self.lock = threading.Lock()
+        self.stats = {}
+
+    def put(self, target, item):
+        """
+        Blocks until the queue has room, giving up if another stage failed
+        """
+        while True:
+            if self.stop.is_set():
+                raise PipelineStopped()
+            try:
+                target.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+
+    def get(self, source):
+        while True:
+            if self.stop.is_set():
+                raise PipelineStopped()
+            try:
+                return source.get(timeout=0.1)
+            except queue.Empty:
+                pass
+
+    def stage(self, target):
+        """
+        Wraps a stage so an exception stops the whole pipeline
+        """
+
+        def run():
+            try:
+                target()
+            except PipelineStopped:
+                pass
+            except Exception as e:
+                self.errors.append(e)
+                self.stop.set()
+
+        return threading.Thread(target=run, name=target.__name__, daemon=True)
+
+    def add_stat(self, key, value):
+        with self.lock:
+            self.stats[key] += value
+
+    def feed(self, repos):
+        for repo in repos:
+            self.add_stat("repos", 1)
+            self.put(self.tasks, repo)
+        for _ in range(self.fetchers):
+            self.put(self.tasks, done)
+
+    def fetch_stats(self):
+        while True:
+            repo = self.get(self.tasks)
+            if repo is done:
+                break
+            start = time.monotonic()
+            traffic = self.fetch(repo)
+            self.add_stat("fetch_seconds", time.monotonic() - start)
+            self.put(self.fetched, traffic)
+        self.put(self.fetched, done)
+
+    def transform(self):
+        # Parse the fetched traffic into records here, so the writer only writes
+        records = []
+        popular = {}
+        finished = 0
+        while finished < self.fetchers:
+            traffic = self.get(self.fetched)
+            if traffic is done:
+                finished += 1
+                continue
+            records.extend(traffic_records(traffic))
+            popular.update(traffic_popular([traffic]))
+            if len(records) >= self.batch_size:
+                self.put(self.batches, (records, popular))
+                records = []
+                popular = {}
+        if records or popular:
+            self.put(self.batches, (records, popular))
+        self.put(self.batches, done)
+
+    def run(self, repos):
+        """
+        Ingests the stats of the repos, writing from the calling thread; returns the run's stats
+        """
+        self.stats = {"repos": 0, "records": 0, "batches": 0, "fetch_seconds": 0.0, "write_seconds": 0.0}
+        start = time.monotonic()
+        threads = [self.stage(lambda: self.feed(repos))]
+        threads += [self.stage(self.fetch_stats) for _ in range(self.fetchers)]
+        threads.append(self.stage(self.transform))
+        for thread in threads:
+            thread.start()
+
+        try:
+            while True:
+                item = self.get(self.batches)
+                if item is done:
+                    break
+                records, popular = item
+                write_start = time.monotonic()
+                self.store.upsert_records(records, popular, accumulate=self.accumulate)
+                self.stats["write_seconds"] += time.monotonic() - write_start
+                self.stats["batches"] += 1
+                self.stats["records"] += len(records)
+        except PipelineStopped:
+            pass
+        except Exception:
+            self.stop.set()
+            raise
+        finally:
+            for thread in threads:
+                thread.join()
+
+        if self.errors:
+            raise self.errors[0]
+
+        self.stats["wall_seconds"] = time.monotonic() - start
+        logger.info(
+            f"Ingested {self.stats['records']} datapoints of {self.stats['repos']} repos in "
+            f"{self.stats['batches']} batches: {self.stats['wall_seconds']:.1f}s wall, "
+            f"{self.stats['fetch_seconds']:.1f}s fetching across {self.fetchers} fetchers, "
+            f"{self.stats['write_seconds']:.1f}s writing"
+        )
+        return self.stats
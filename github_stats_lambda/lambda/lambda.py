@@ -1,150 +1,80 @@
 import json
 import logging
 import os
-from datetime import datetime
-from decimal import Decimal
 
 import requests
-from boto3 import resource
-from botocore.exceptions import ClientError
-from github import Github
+
+from ingest_pipeline import IngestPipeline
+from repo_traffic import fetch_repo_traffic
+from run_lease import DynamoDBLease
+from stats_storage import DynamoDBStore, open_store
+from team_sweep import parse_teams, resolve_teams
+from token_pool import TokenPool
 
 logging.basicConfig()
 logger = logging.getLogger("GitHubStats")
 logger.setLevel(logging.INFO)
 
 
-def create_table_if_not_exists(dynamodb_resource, table_name):
-    try:
-        table = dynamodb_resource.create_table(
-            TableName=table_name,
-            KeySchema=[
-                {"AttributeName": "repo_name", "KeyType": "HASH"},
-                {"AttributeName": "stat_type", "KeyType": "RANGE"},
-            ],
-            AttributeDefinitions=[
-                {"AttributeName": "repo_name", "AttributeType": "S"},
-                {"AttributeName": "stat_type", "AttributeType": "S"},
-            ],
-            ProvisionedThroughput={
-                "ReadCapacityUnits": 5,
-                "WriteCapacityUnits": 5,
-            },
-        )
-        table.wait_until_exists()
-    except ClientError as e:
-        if e.response["Error"]["Code"] != "ResourceInUseException":
-            raise
-        table = dynamodb_resource.Table(table_name)
-    return table
-
 def lambda_handler(event, context):
-    date_today = datetime.today().strftime("%Y-%m-%d")
-
     table_name = os.environ["TABLE_NAME"]
-    access_token = os.environ["GITHUB_TOKEN"]
-    team_name = os.environ["TEAM_NAME"]
-    org_name = os.environ["ORG_NAME"]
-
-    # Get DynamoDB table resource
-    dynamodb_resource = resource("dynamodb", region_name="eu-west-1")
-
-    try:
-        table = dynamodb_resource.Table(table_name)
-        table.load()
-    except ClientError as e:
-        if e.response["Error"]["Code"] == "ResourceNotFoundException":
-            table = create_table_if_not_exists(dynamodb_resource, table_name)
-        else:
-            raise
-
-    # Get all repos in a team
-    repos = get_all_repos(access_token, team_name, org_name)
-
-    for repo in repos:
-        logger.info(f"Fetching data for {repo}...")
-
-        views_data = fetch_traffic_stats(repo, "views", access_token)
-        clones_data = fetch_traffic_stats(repo, "clones", access_token)
-
-        # Write stats to DynamoDB
-        for data in [views_data, clones_data]:
-            if data:
-                for item in data:
-                    item["repo_name"] = repo
-                    item["stat_type"] = item["type"]
-                    item["date"] = datetime.strptime(
-                        item["timestamp"], "%Y-%m-%dT%H:%M:%SZ"
-                    ).strftime("%Y-%m-%d")
-
-                    # Check if item already exists in the DynamoDB table
-                    existing_item = table.get_item(
-                        Key={
-                            "repo_name": item["repo_name"],
-                            "stat_type": f"{item['date']}_{item['stat_type']}"
-                        }
-                    ).get("Item")
-
-                    if existing_item:
-                        # Update existing item in the DynamoDB table
-                        table.update_item(
-                            Key={
-                                "repo_name": item["repo_name"],
-                                "stat_type": f"{item['date']}_{item['stat_type']}"
-                            },
-                            UpdateExpression="SET #count = #count + :count, #uniques = #uniques + :uniques",
-                            ExpressionAttributeNames={
-                                "#count": "count",
-                                "#uniques": "uniques"
-                            },
-                            ExpressionAttributeValues={
-                                ":count": Decimal(str(item["count"])),
-                                ":uniques": Decimal(str(item["uniques"]))
-                            },
-                            ReturnValues="UPDATED_NEW"
-                        )
-                    else:
-                        # Put new item in the DynamoDB table
-                        table.put_item(Item=item)
-
+    # GITHUB_TOKENS spreads the requests over several tokens, GITHUB_TOKEN is the single token fallback
+    tokens = TokenPool.from_env(os.environ)
+    if not tokens:
+        raise KeyError("GITHUB_TOKENS or GITHUB_TOKEN must be set")
+    # TEAMS lists the "org/team" pairs to sweep, ORG_NAME and TEAM_NAME the single team fallback
+    teams = parse_teams((os.environ.get("TEAMS") or "").split(","))
+    if not teams:
+        teams = [(os.environ["ORG_NAME"], os.environ["TEAM_NAME"])]
+
+    # The Lambda runtime sets AWS_REGION to the function's own region; writes
+    # are paced at the table's capacity unless WRITE_CAPACITY_RATE overrides it.
+    # GITHUB_STATS_STORE selects another layout, e.g. dynamodb-monthly://github_stats_monthly
+    write_rate = os.environ.get("WRITE_CAPACITY_RATE")
+    store = open_store(
+        os.environ.get("GITHUB_STATS_STORE") or f"dynamodb://{table_name}",
+        region_name=os.environ.get("AWS_REGION"),
+        write_rate=float(write_rate) if write_rate else None,
+    )
+    if isinstance(store, DynamoDBStore):
+        store.create_table_if_not_exists()
+
+    # Only one run ingests at a time, counts are added to what is stored; a run
+    # triggered while another is in flight waits for it and returns its result
+    lease = DynamoDBLease(
+        "ingest",
+        os.environ.get("LEASE_TABLE_NAME") or f"{table_name}_leases",
+        region_name=os.environ.get("AWS_REGION"),
+    )
+    lease.create_table_if_not_exists()
+    timeout = None
+    if context is not None:
+        timeout = max(context.get_remaining_time_in_millis() / 1000 - 10, 0)
+    stats = lease.run(lambda: ingest(store, tokens, teams), timeout=timeout)
+
+    # The body stays fixed for the callers that match it, the run's counts go alongside
     return {
         "statusCode": 200,
         "body": json.dumps("Stats updated successfully."),
+        "stats": stats,
     }
 
 
+def ingest(store, tokens, teams):
+    # Get the repos of all the teams, each once however many teams share it
+    repos = list(resolve_teams(tokens, teams))
+
+    # Fetch concurrently over pooled connections while earlier repos are
+    # written, adding to any existing counts; FETCH_POPULAR=true also fetches
+    # each repo's popular referrers and paths
+    fetchers = int(os.environ.get("FETCH_CONCURRENCY", "8"))
+    popular = os.environ.get("FETCH_POPULAR", "").lower() in ("1", "true", "yes")
+    session = requests.Session()
+    session.mount("https://", requests.adapters.HTTPAdapter(pool_maxsize=fetchers))
+    pipeline = IngestPipeline(
+        lambda repo: fetch_repo_traffic(repo, tokens, session, popular=popular),
+        store,
+        fetchers=fetchers,
+    )
+    return pipeline.run(repos)
 
-# Function to get all repos in a team
-def get_all_repos(access_token, team_name, org_name):
-    repo_list = []
-
-    g = Github(access_token)
-    org = g.get_organization(org_name)
-    team = org.get_team_by_slug(team_name)
-    repos = team.get_repos()
-
-    for repo in repos:
-        if repo.archived or repo.private:
-            continue
-        repo_list.append(repo.full_name)
-
-    return repo_list
-
-
-# Function to fetch traffic stats from GitHub API
-def fetch_traffic_stats(repo, stat_type, access_token):
-    url = f"https://api.github.com/repos/{repo}/traffic/{stat_type}"
-    headers = {"Authorization": f"token {access_token}"}
-
-    try:
-        response = requests.get(url, headers=headers)
-        response.raise_for_status()
-        data = response.json()
-
-        for item in data[stat_type]:
-            item["type"] = stat_type
-
-        return data[stat_type]
-    except requests.exceptions.RequestException as e:
-        logger.info(f"Error fetching {stat_type} data for {repo}: {e}")
-        return None
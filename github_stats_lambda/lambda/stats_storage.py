@@ -0,0 +1,989 @@
+"""
+Storage backends for GitHub traffic stats
+
+Every backend stores daily datapoints as records of the form:
+
+    {"repo_name": "org/repo", "stat_type": "views", "date": "2023-04-01",
+     "timestamp": "2023-04-01T00:00:00Z", "count": 10, "uniques": 2}
+
+and supports bulk upserts, date-range reads and per-repo aggregates, so the
+standalone app, the Lambda function and the graph_data CLI share one batched
+write path regardless of where the data lives. Older datapoints can be moved
+to a compressed archive tier, see stats_archive.
+
+Next to the daily series, each repo can have a snapshot of its popular
+referrers and paths (GitHub's rolling top 10s), of which only the latest is
+kept. upsert_traffic writes both from the merged per-repo records built by
+repo_traffic, in one batch; upsert_records does the same for records and
+snapshots already extracted from them.
+"""
+import json
+import os
+import random
+import struct
+import time
+from array import array
+from collections import defaultdict
+from datetime import datetime
+
+stat_types = ("views", "clones")
+# The popular referrers and paths endpoints, kept as a per-repo snapshot
+popular_types = ("referrers", "paths")
+timestamp_format = "%Y-%m-%dT%H:%M:%SZ"
+
+
+def make_record(repo_name, stat_type, item):
+    """
+    Converts a datapoint from the GitHub traffic API into a storage record
+    """
+    return {
+        "repo_name": repo_name,
+        "stat_type": stat_type,
+        "date": datetime.strptime(item["timestamp"], timestamp_format).strftime("%Y-%m-%d"),
+        "timestamp": item["timestamp"],
+        "count": int(item["count"]),
+        "uniques": int(item["uniques"]),
+    }
+
+
+def traffic_records(traffic):
+    """
+    Converts the daily views and clones of a repo's merged traffic record into storage records
+    """
+    return [
+        make_record(traffic["repo_name"], stat_type, item)
+        for stat_type in stat_types
+        for item in traffic.get(stat_type) or []
+    ]
+
+
+def traffic_popular(traffic):
+    """
+    Returns {repo_name: snapshot} of the merged traffic records that have a popular snapshot
+    """
+    return {repo["repo_name"]: repo["popular"] for repo in traffic if repo.get("popular")}
+
+
+def in_range(date, start=None, end=None):
+    """
+    Checks an ISO date string against an optional inclusive date range
+    """
+    return not ((start and date < start) or (end and date > end))
+
+
+class StatsAccumulator:
+    """
+    Sums counts and uniques per repo and stat type into flat integer arrays,
+    indexed by an interned repo ID, so memory grows with repos rather than datapoints
+    """
+
+    def __init__(self):
+        self.repo_index = {}
+        self.repo_names = []
+        # Two slots per repo: 2 * index for views, 2 * index + 1 for clones
+        self.counts = array("q")
+        self.uniques = array("q")
+
+    def add_repo(self, repo_name):
+        index = len(self.repo_names)
+        self.repo_index[repo_name] = index
+        self.repo_names.append(repo_name)
+        self.counts.extend((0, 0))
+        self.uniques.extend((0, 0))
+        return index
+
+    def add(self, repo_name, stat_type, count, uniques):
+        index = self.repo_index.get(repo_name)
+        if index is None:
+            index = self.add_repo(repo_name)
+        slot = 2 * index + stat_types.index(stat_type)
+        self.counts[slot] += count
+        self.uniques[slot] += uniques
+
+    def totals(self):
+        """
+        Returns the sums in the StatsStore.aggregate format
+        """
+        return {
+            repo_name: {
+                stat_type: {
+                    "count": self.counts[2 * index + offset],
+                    "uniques": self.uniques[2 * index + offset],
+                }
+                for offset, stat_type in enumerate(stat_types)
+            }
+            for index, repo_name in enumerate(self.repo_names)
+        }
+
+
+class StatsStore:
+    """
+    Interface shared by all storage backends
+    """
+
+    def upsert_many(self, records, accumulate=False):
+        """
+        Writes records in bulk; with accumulate, counts are added to existing datapoints
+        """
+        raise NotImplementedError
+
+    def expire_many(self, records):
+        """
+        Removes archived records from the store; they are no longer returned by reads
+        """
+        raise NotImplementedError
+
+    def upsert_traffic(self, traffic, accumulate=False):
+        """
+        Writes the merged traffic records of one or more repos: their daily views
+        and clones as with upsert_many, and their popular snapshots
+        """
+        records = [record for repo in traffic for record in traffic_records(repo)]
+        self.upsert_records(records, traffic_popular(traffic), accumulate=accumulate)
+
+    def upsert_records(self, records, popular=None, accumulate=False):
+        """
+        Writes records as with upsert_many and popular snapshots as with put_popular,
+        in one batch where the backend can
+        """
+        self.upsert_many(records, accumulate=accumulate)
+        if popular:
+            self.put_popular(popular)
+
+    def put_popular(self, popular):
+        """
+        Stores {repo_name: {"date": ..., "referrers": [...], "paths": [...]}}, replacing earlier snapshots
+        """
+        raise NotImplementedError
+
+    def read_popular(self, repo_name):
+        """
+        Returns the latest popular referrers and paths snapshot of a repo, or None
+        """
+        return None
+
+    def read_range(self, repo_name, stat_type, start=None, end=None):
+        """
+        Returns the records of one repo and stat type in the date range, oldest first
+        """
+        raise NotImplementedError
+
+    def aggregate(self, start=None, end=None):
+        """
+        Returns {repo_name: {stat_type: {"count": n, "uniques": n}}} summed over the date range
+        """
+        totals = StatsAccumulator()
+        for repo_name in self.list_repos():
+            totals.add_repo(repo_name)
+            for stat_type in stat_types:
+                for record in self.read_range(repo_name, stat_type, start, end):
+                    totals.add(repo_name, stat_type, record["count"], record["uniques"])
+        return totals.totals()
+
+    def list_repos(self):
+        """
+        Returns the sorted names of all repos with stored data
+        """
+        raise NotImplementedError
+
+    def fingerprint(self, repo_name, stat_type):
+        """
+        Returns a token that changes whenever the stored series changes, or None if unknown
+        """
+        return None
+
+
+class MemoryStore(StatsStore):
+    """
+    Keeps everything in nested dicts, for tests, benchmarks and short-lived runs
+    """
+
+    def __init__(self):
+        self.data = defaultdict(lambda: defaultdict(dict))
+        self.versions = defaultdict(int)
+        self.popular = {}
+
+    def upsert_many(self, records, accumulate=False):
+        for record in records:
+            series = self.data[record["repo_name"]][record["stat_type"]]
+            existing = series.get(record["date"])
+            if accumulate and existing:
+                existing["count"] += record["count"]
+                existing["uniques"] += record["uniques"]
+            else:
+                series[record["date"]] = dict(record)
+            self.versions[(record["repo_name"], record["stat_type"])] += 1
+
+    def expire_many(self, records):
+        for record in records:
+            self.data[record["repo_name"]][record["stat_type"]].pop(record["date"], None)
+            self.versions[(record["repo_name"], record["stat_type"])] += 1
+
+    def put_popular(self, popular):
+        self.popular.update((repo_name, json.loads(json.dumps(snapshot))) for repo_name, snapshot in popular.items())
+
+    def read_popular(self, repo_name):
+        return self.popular.get(repo_name)
+
+    def read_range(self, repo_name, stat_type, start=None, end=None):
+        series = self.data.get(repo_name, {}).get(stat_type, {})
+        return [
+            dict(series[date]) for date in sorted(series) if in_range(date, start, end)
+        ]
+
+    def list_repos(self):
+        return sorted(self.data)
+
+    def fingerprint(self, repo_name, stat_type):
+        return str(self.versions[(repo_name, stat_type)])
+
+
+class JsonFileStore(StatsStore):
+    """
+    Stores one JSON file per repo and stat type, in the standalone app's format
+    """
+
+    def __init__(self, data_directory):
+        self.data_directory = data_directory
+
+    def file_path(self, repo_name, stat_type):
+        return os.path.join(self.data_directory, f"{repo_name}_{stat_type}.json")
+
+    def load_series(self, repo_name, stat_type):
+        """
+        Loads a stats file into a {timestamp: {"count": n, "uniques": n}} dict
+        """
+        path = self.file_path(repo_name, stat_type)
+        if not os.path.exists(path) or os.path.getsize(path) == 0:
+            return {}
+
+        with open(path, "r") as f:
+            loaded_data = json.load(f)
+
+        return {
+            item["timestamp"]: {"count": item["count"], "uniques": item["uniques"]}
+            for item in loaded_data.get(stat_type, [])
+        }
+
+    def save_series(self, repo_name, stat_type, series):
+        """
+        Atomically rewrites a stats file from a {timestamp: {...}} dict
+        """
+        path = self.file_path(repo_name, stat_type)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        output_data = {
+            stat_type: [
+                {"timestamp": k, "count": v["count"], "uniques": v["uniques"]}
+                for k, v in series.items()
+            ]
+        }
+        self.write_json(path, output_data)
+
+    @staticmethod
+    def write_json(path, data):
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(data, f)
+        os.replace(tmp_path, path)
+
+    def upsert_many(self, records, accumulate=False):
+        # Group by file so each file is read and written once per batch
+        grouped = defaultdict(list)
+        for record in records:
+            grouped[(record["repo_name"], record["stat_type"])].append(record)
+
+        for (repo_name, stat_type), file_records in grouped.items():
+            series = self.load_series(repo_name, stat_type)
+            for record in file_records:
+                existing = series.get(record["timestamp"])
+                if accumulate and existing:
+                    existing["count"] += record["count"]
+                    existing["uniques"] += record["uniques"]
+                else:
+                    series[record["timestamp"]] = {
+                        "count": record["count"],
+                        "uniques": record["uniques"],
+                    }
+            self.save_series(repo_name, stat_type, series)
+
+    def expire_many(self, records):
+        grouped = defaultdict(list)
+        for record in records:
+            grouped[(record["repo_name"], record["stat_type"])].append(record)
+
+        for (repo_name, stat_type), file_records in grouped.items():
+            series = self.load_series(repo_name, stat_type)
+            for record in file_records:
+                series.pop(record["timestamp"], None)
+            self.save_series(repo_name, stat_type, series)
+
+    def put_popular(self, popular):
+        # One small file per repo next to its series, <repo>_popular.json
+        for repo_name, snapshot in popular.items():
+            path = self.file_path(repo_name, "popular")
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            self.write_json(path, snapshot)
+
+    def read_popular(self, repo_name):
+        try:
+            with open(self.file_path(repo_name, "popular")) as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def read_range(self, repo_name, stat_type, start=None, end=None):
+        series = self.load_series(repo_name, stat_type)
+        records = []
+        for timestamp in sorted(series):
+            date = timestamp[:10]
+            if in_range(date, start, end):
+                records.append({
+                    "repo_name": repo_name,
+                    "stat_type": stat_type,
+                    "date": date,
+                    "timestamp": timestamp,
+                    **series[timestamp],
+                })
+        return records
+
+    def list_repos(self):
+        repos = set()
+        for root, _, files in os.walk(self.data_directory):
+            owner = os.path.relpath(root, self.data_directory)
+            for file in files:
+                name, _, suffix = file.rpartition("_")
+                if owner != "." and suffix in ("views.json", "clones.json"):
+                    repos.add(f"{owner}/{name}")
+        return sorted(repos)
+
+    def fingerprint(self, repo_name, stat_type):
+        try:
+            stat = os.stat(self.file_path(repo_name, stat_type))
+        except FileNotFoundError:
+            return "missing"
+        return f"{stat.st_mtime_ns}-{stat.st_size}"
+
+
+class SqliteStore(StatsStore):
+    """
+    Stores one row per repo, stat type and date in a local SQLite database
+    """
+
+    schema = """
+        CREATE TABLE IF NOT EXISTS stats (
+            repo_name TEXT NOT NULL,
+            stat_type TEXT NOT NULL,
+            date TEXT NOT NULL,
+            timestamp TEXT NOT NULL,
+            count INTEGER NOT NULL,
+            uniques INTEGER NOT NULL,
+            PRIMARY KEY (repo_name, stat_type, date)
+        ) WITHOUT ROWID;
+        CREATE TABLE IF NOT EXISTS popular (
+            repo_name TEXT NOT NULL PRIMARY KEY,
+            snapshot TEXT NOT NULL
+        ) WITHOUT ROWID
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.pid = None
+        self.connection = None
+
+    def connect(self):
+        """
+        Returns the connection, reopened after a fork as SQLite connections can't be shared
+        """
+        import sqlite3
+
+        if self.pid != os.getpid():
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self.connection = sqlite3.connect(self.path, check_same_thread=False)
+            self.connection.executescript(self.schema)
+            self.pid = os.getpid()
+        return self.connection
+
+    @staticmethod
+    def write_records(connection, records, accumulate):
+        update = (
+            "count = count + excluded.count, uniques = uniques + excluded.uniques"
+            if accumulate
+            else "timestamp = excluded.timestamp, count = excluded.count, uniques = excluded.uniques"
+        )
+        connection.executemany(
+            "INSERT INTO stats VALUES (:repo_name, :stat_type, :date, :timestamp, :count, :uniques) "
+            f"ON CONFLICT (repo_name, stat_type, date) DO UPDATE SET {update}",
+            records,
+        )
+
+    @staticmethod
+    def write_popular(connection, popular):
+        connection.executemany(
+            "INSERT OR REPLACE INTO popular VALUES (?, ?)",
+            ((repo_name, json.dumps(snapshot)) for repo_name, snapshot in popular.items()),
+        )
+
+    def upsert_many(self, records, accumulate=False):
+        connection = self.connect()
+        with connection:
+            self.write_records(connection, records, accumulate)
+
+    def upsert_records(self, records, popular=None, accumulate=False):
+        # Both tables in one transaction
+        connection = self.connect()
+        with connection:
+            self.write_records(connection, records, accumulate)
+            self.write_popular(connection, popular or {})
+
+    def put_popular(self, popular):
+        connection = self.connect()
+        with connection:
+            self.write_popular(connection, popular)
+
+    def read_popular(self, repo_name):
+        row = self.connect().execute("SELECT snapshot FROM popular WHERE repo_name = ?", (repo_name,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def expire_many(self, records):
+        connection = self.connect()
+        with connection:
+            connection.executemany(
+                "DELETE FROM stats WHERE repo_name = ? AND stat_type = ? AND date = ?",
+                ((r["repo_name"], r["stat_type"], r["date"]) for r in records),
+            )
+
+    def read_range(self, repo_name, stat_type, start=None, end=None):
+        rows = self.connect().execute(
+            "SELECT date, timestamp, count, uniques FROM stats "
+            "WHERE repo_name = ? AND stat_type = ? AND date BETWEEN ? AND ? ORDER BY date",
+            (repo_name, stat_type, start or "0000", end or "9999"),
+        )
+        return [
+            {
+                "repo_name": repo_name,
+                "stat_type": stat_type,
+                "date": date,
+                "timestamp": timestamp,
+                "count": count,
+                "uniques": uniques,
+            }
+            for date, timestamp, count, uniques in rows
+        ]
+
+    def aggregate(self, start=None, end=None):
+        totals = StatsAccumulator()
+        rows = self.connect().execute(
+            "SELECT repo_name, stat_type, SUM(count), SUM(uniques) FROM stats "
+            "WHERE date BETWEEN ? AND ? GROUP BY repo_name, stat_type ORDER BY repo_name",
+            (start or "0000", end or "9999"),
+        )
+        for repo_name, stat_type, count, uniques in rows:
+            totals.add(repo_name, stat_type, count, uniques)
+        return totals.totals()
+
+    def list_repos(self):
+        rows = self.connect().execute("SELECT DISTINCT repo_name FROM stats ORDER BY repo_name")
+        return [repo_name for repo_name, in rows]
+
+    def fingerprint(self, repo_name, stat_type):
+        # A primary key range read, no datapoints are decoded
+        row = self.connect().execute(
+            "SELECT COUNT(*), MAX(date), COALESCE(SUM(count), 0), COALESCE(SUM(uniques), 0) FROM stats "
+            "WHERE repo_name = ? AND stat_type = ?",
+            (repo_name, stat_type),
+        ).fetchone()
+        return "-".join(str(value) for value in row)
+
+
+class DynamoDBStore(StatsStore):
+    """
+    Stores one item per repo, date and stat type in the github_stats DynamoDB table
+    """
+
+    # BatchGetItem and BatchWriteItem request size limits
+    batch_get_size = 100
+    # TTL attribute set on archived items, DynamoDB deletes them in the background
+    ttl_attribute = "expires_at"
+    # Sort key of a repo's popular referrers and paths item, outside every date range
+    popular_key = "popular"
+
+    def __init__(self, table_name, region_name=None, write_rate=None):
+        self.table_name = table_name
+        self.region_name = region_name
+        self.write_rate = write_rate
+        self.pid = None
+        self.connections = None
+        self.writer = None
+
+    def connect(self):
+        """
+        Returns the boto3 resource, table and client, recreated after a fork as
+        their connection pools can't be shared between processes
+        """
+        connections = self.connections
+        if self.pid != os.getpid():
+            from boto3.session import Session
+
+            # A session per process, boto3's default session isn't safe to share either
+            session = Session(region_name=self.region_name)
+            dynamodb_resource = session.resource("dynamodb")
+            # Plain client for hot read paths, returns raw attribute values without Decimals
+            connections = (dynamodb_resource, dynamodb_resource.Table(self.table_name), session.client("dynamodb"))
+            self.connections = connections
+            self.writer = None
+            self.pid = os.getpid()
+        return connections
+
+    @property
+    def dynamodb_resource(self):
+        return self.connect()[0]
+
+    @property
+    def table(self):
+        return self.connect()[1]
+
+    @property
+    def client(self):
+        return self.connect()[2]
+
+    @staticmethod
+    def item_key(record):
+        return {
+            "repo_name": record["repo_name"],
+            "stat_type": f"{record['date']}_{record['stat_type']}",
+        }
+
+    @classmethod
+    def record_to_item(cls, record):
+        return {
+            **cls.item_key(record),
+            "date": record["date"],
+            "timestamp": record["timestamp"],
+            "type": record["stat_type"],
+            "count": record["count"],
+            "uniques": record["uniques"],
+        }
+
+    @staticmethod
+    def item_to_record(item):
+        """
+        Decodes a table item, including legacy items keyed by the bare stat type
+        """
+        date, _, stat_type = item["stat_type"].rpartition("_")
+        date = date or item.get("date", "")
+        return {
+            "repo_name": item["repo_name"],
+            "stat_type": stat_type,
+            "date": date,
+            "timestamp": item.get("timestamp", f"{date}T00:00:00Z"),
+            "count": int(item["count"]),
+            "uniques": int(item["uniques"]),
+        }
+
+    def create_table_if_not_exists(self):
+        """
+        Creates the stats table on first use
+        """
+        from botocore.exceptions import ClientError
+
+        try:
+            self.table.load()
+            return self.table
+        except ClientError as e:
+            if e.response["Error"]["Code"] != "ResourceNotFoundException":
+                raise
+
+        try:
+            table = self.dynamodb_resource.create_table(
+                TableName=self.table_name,
+                KeySchema=[
+                    {"AttributeName": "repo_name", "KeyType": "HASH"},
+                    {"AttributeName": "stat_type", "KeyType": "RANGE"},
+                ],
+                AttributeDefinitions=[
+                    {"AttributeName": "repo_name", "AttributeType": "S"},
+                    {"AttributeName": "stat_type", "AttributeType": "S"},
+                ],
+                ProvisionedThroughput={
+                    "ReadCapacityUnits": 5,
+                    "WriteCapacityUnits": 5,
+                },
+            )
+            table.wait_until_exists()
+            self.client.update_time_to_live(
+                TableName=self.table_name,
+                TimeToLiveSpecification={"Enabled": True, "AttributeName": self.ttl_attribute},
+            )
+        except ClientError as e:
+            if e.response["Error"]["Code"] != "ResourceInUseException":
+                raise
+        return self.table
+
+    def get_existing(self, keys):
+        """
+        Fetches existing items for the given keys with BatchGetItem
+        """
+        existing = {}
+        for i in range(0, len(keys), self.batch_get_size):
+            request = {self.table_name: {"Keys": keys[i:i + self.batch_get_size]}}
+            attempt = 0
+            while request:
+                response = self.dynamodb_resource.batch_get_item(RequestItems=request)
+                for item in response["Responses"].get(self.table_name, []):
+                    existing[(item["repo_name"], item["stat_type"])] = item
+                request = response.get("UnprocessedKeys")
+                if request:
+                    # Unprocessed keys mean the reads were throttled, back off before retrying
+                    attempt += 1
+                    time.sleep(random.uniform(0, min(5.0, 0.05 * 2 ** attempt)))
+        return existing
+
+    def record_items(self, records, accumulate=False):
+        """
+        Returns the table items that upsert the records
+        """
+        # Collapse duplicate keys first, BatchWriteItem rejects them
+        items = {}
+        for record in records:
+            item = self.record_to_item(record)
+            item_id = (item["repo_name"], item["stat_type"])
+            if item_id in items and accumulate:
+                items[item_id]["count"] += record["count"]
+                items[item_id]["uniques"] += record["uniques"]
+            else:
+                items[item_id] = item
+
+        if accumulate and items:
+            existing = self.get_existing(
+                [{"repo_name": r, "stat_type": s} for r, s in items]
+            )
+            for item_id, item in existing.items():
+                # An expired item's counts are in the archive, adding them back would
+                # rewrite them without the TTL and return archived days to the hot tier
+                if self.ttl_attribute in item:
+                    continue
+                items[item_id]["count"] += int(item["count"])
+                items[item_id]["uniques"] += int(item["uniques"])
+        return list(items.values())
+
+    def popular_items(self, popular):
+        return [
+            {
+                "repo_name": repo_name,
+                "stat_type": self.popular_key,
+                "date": snapshot["date"],
+                **{kind: json.dumps(snapshot.get(kind) or []) for kind in popular_types},
+            }
+            for repo_name, snapshot in popular.items()
+        ]
+
+    def upsert_many(self, records, accumulate=False):
+        self.get_writer().write(self.record_items(records, accumulate))
+
+    def upsert_records(self, records, popular=None, accumulate=False):
+        # The datapoints and popular snapshots of every repo go out in the same batched write
+        self.get_writer().write(self.record_items(records, accumulate) + self.popular_items(popular or {}))
+
+    def put_popular(self, popular):
+        self.get_writer().write(self.popular_items(popular))
+
+    def read_popular(self, repo_name):
+        item = self.table.get_item(Key={"repo_name": repo_name, "stat_type": self.popular_key}).get("Item")
+        if item is None:
+            return None
+        return {"date": item["date"], **{kind: json.loads(item[kind]) for kind in popular_types}}
+
+    def expire_many(self, records):
+        # Rewrite the items with a TTL of now rather than deleting them, which
+        # costs nothing when DynamoDB eventually removes them
+        expires_at = int(time.time())
+        items = {}
+        for record in records:
+            item = self.record_to_item(record)
+            item[self.ttl_attribute] = expires_at
+            items[(item["repo_name"], item["stat_type"])] = item
+        self.get_writer().write(list(items.values()))
+
+    def get_writer(self):
+        """
+        Returns the table's write scheduler, created on first write so it can read the table's capacity
+        """
+        if self.writer is None:
+            from ddb_writer import BatchWriteScheduler
+
+            self.writer = BatchWriteScheduler.for_table(
+                self.dynamodb_resource, self.table_name, write_rate=self.write_rate
+            )
+        return self.writer
+
+    def read_range(self, repo_name, stat_type, start=None, end=None):
+        from boto3.dynamodb.conditions import Key
+
+        # Sort keys are "<date>_<stat_type>", so a date range is a key range
+        key_condition = Key("repo_name").eq(repo_name) & Key("stat_type").between(
+            start or "0000", f"{end or '9999'}_~"
+        )
+        query = {"KeyConditionExpression": key_condition}
+
+        records = []
+        while True:
+            response = self.table.query(**query)
+            for item in response["Items"]:
+                if self.ttl_attribute in item:
+                    # Archived and awaiting TTL deletion
+                    continue
+                record = self.item_to_record(item)
+                if record["stat_type"] == stat_type and in_range(record["date"], start, end):
+                    records.append(record)
+            if "LastEvaluatedKey" not in response:
+                break
+            query["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+        return records
+
+    def scan_items(self, **kwargs):
+        """
+        Yields every item of the table, following scan pagination
+        """
+        while True:
+            response = self.table.scan(**kwargs)
+            yield from response["Items"]
+            if "LastEvaluatedKey" not in response:
+                break
+            kwargs["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+
+    def aggregate(self, start=None, end=None):
+        # Stream the scan through the low-level client: numbers arrive as strings
+        # and go straight to int, skipping the Decimal round trip of the resource
+        # API, and each page is folded into the totals and dropped
+        paginator = self.client.get_paginator("scan")
+        pages = paginator.paginate(
+            TableName=self.table_name,
+            ProjectionExpression=f"repo_name, stat_type, #date, #count, uniques, {self.ttl_attribute}",
+            ExpressionAttributeNames={"#date": "date", "#count": "count"},
+        )
+
+        totals = StatsAccumulator()
+        repo_index = totals.repo_index
+        add_repo = totals.add_repo
+        counts = totals.counts
+        uniques = totals.uniques
+        filtered = bool(start or end)
+
+        for page in pages:
+            for item in page["Items"]:
+                if self.ttl_attribute in item:
+                    continue
+                repo_name = item["repo_name"]["S"]
+                sort_key = item["stat_type"]["S"]
+                if sort_key == self.popular_key:
+                    continue
+                if filtered:
+                    date = sort_key[:10] if "_" in sort_key else item.get("date", {}).get("S", "")
+                    if (start and date < start) or (end and date > end):
+                        continue
+
+                index = repo_index.get(repo_name)
+                if index is None:
+                    index = add_repo(repo_name)
+                # Sort keys are "<date>_views" or "<date>_clones" (or a bare legacy stat type)
+                slot = 2 * index + (sort_key[-6:] == "clones")
+                counts[slot] += int(item["count"]["N"])
+                uniques[slot] += int(item["uniques"]["N"])
+
+        return totals.totals()
+
+    def list_repos(self):
+        return sorted(
+            set(item["repo_name"] for item in self.scan_items(ProjectionExpression="repo_name"))
+        )
+
+
+class MonthlyDynamoDBStore(DynamoDBStore):
+    """
+    Stores one item per repo, stat type and month, with the daily counts and
+    uniques packed into binary arrays, so reads touch ~30x fewer items
+    """
+
+    # Items are keyed "<YYYY-MM>_<stat_type>" and hold a bitmask of the days
+    # present plus one little-endian uint32 per day of the month
+    days_per_item = 31
+
+    @staticmethod
+    def item_key(record):
+        return {
+            "repo_name": record["repo_name"],
+            "stat_type": f"{record['date'][:7]}_{record['stat_type']}",
+        }
+
+    @classmethod
+    def pack(cls, values):
+        return struct.pack(f"<{cls.days_per_item}I", *values)
+
+    @classmethod
+    def unpack(cls, data):
+        # The resource API wraps binary values, the client returns raw bytes
+        return list(struct.unpack(f"<{cls.days_per_item}I", getattr(data, "value", data)))
+
+    def month_item(self, repo_name, sort_key, days, counts, uniques):
+        month, _, stat_type = sort_key.rpartition("_")
+        return {
+            "repo_name": repo_name,
+            "stat_type": sort_key,
+            "month": month,
+            "type": stat_type,
+            "days": days,
+            "count": self.pack(counts),
+            "uniques": self.pack(uniques),
+        }
+
+    def decode_item(self, item):
+        """
+        Returns the (days bitmask, counts, uniques) of a month item, empty for a missing or expired one
+        """
+        if item is None or self.ttl_attribute in item:
+            return 0, [0] * self.days_per_item, [0] * self.days_per_item
+        return int(item["days"]), self.unpack(item["count"]), self.unpack(item["uniques"])
+
+    def item_to_records(self, item):
+        month, _, stat_type = item["stat_type"].rpartition("_")
+        days, counts, uniques = self.decode_item(item)
+        for day in range(self.days_per_item):
+            if days >> day & 1:
+                date = f"{month}-{day + 1:02d}"
+                yield {
+                    "repo_name": item["repo_name"],
+                    "stat_type": stat_type,
+                    "date": date,
+                    "timestamp": f"{date}T00:00:00Z",
+                    "count": counts[day],
+                    "uniques": uniques[day],
+                }
+
+    def load_months(self, records):
+        """
+        Groups records by month item and fetches the existing items in batches
+        """
+        grouped = defaultdict(list)
+        for record in records:
+            key = self.item_key(record)
+            grouped[(key["repo_name"], key["stat_type"])].append(record)
+        existing = {}
+        if grouped:
+            existing = self.get_existing([{"repo_name": r, "stat_type": s} for r, s in grouped])
+        return grouped, existing
+
+    def record_items(self, records, accumulate=False):
+        # Each month item is read, updated in place and written back whole
+        grouped, existing = self.load_months(records)
+        items = []
+        for (repo_name, sort_key), month_records in grouped.items():
+            days, counts, uniques = self.decode_item(existing.get((repo_name, sort_key)))
+            for record in month_records:
+                day = int(record["date"][8:10]) - 1
+                if accumulate and days >> day & 1:
+                    counts[day] += record["count"]
+                    uniques[day] += record["uniques"]
+                else:
+                    counts[day] = record["count"]
+                    uniques[day] = record["uniques"]
+                days |= 1 << day
+            items.append(self.month_item(repo_name, sort_key, days, counts, uniques))
+        return items
+
+    def expire_many(self, records):
+        # Archived days are cleared; a month with no days left expires through the TTL
+        grouped, existing = self.load_months(records)
+        expires_at = int(time.time())
+        items = []
+        for (repo_name, sort_key), month_records in grouped.items():
+            days, counts, uniques = self.decode_item(existing.get((repo_name, sort_key)))
+            for record in month_records:
+                day = int(record["date"][8:10]) - 1
+                days &= ~(1 << day)
+                counts[day] = uniques[day] = 0
+            item = self.month_item(repo_name, sort_key, days, counts, uniques)
+            if not days:
+                item[self.ttl_attribute] = expires_at
+            items.append(item)
+        self.get_writer().write(items)
+
+    def read_range(self, repo_name, stat_type, start=None, end=None):
+        from boto3.dynamodb.conditions import Key
+
+        # Sort keys are "<month>_<stat_type>", so a month range is a key range
+        key_condition = Key("repo_name").eq(repo_name) & Key("stat_type").between(
+            (start or "0000")[:7], f"{(end or '9999')[:7]}_~"
+        )
+        query = {"KeyConditionExpression": key_condition}
+
+        records = []
+        while True:
+            response = self.table.query(**query)
+            for item in response["Items"]:
+                if item["stat_type"].endswith(f"_{stat_type}"):
+                    records.extend(
+                        r for r in self.item_to_records(item) if in_range(r["date"], start, end)
+                    )
+            if "LastEvaluatedKey" not in response:
+                break
+            query["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+        return records
+
+    def aggregate(self, start=None, end=None):
+        paginator = self.client.get_paginator("scan")
+        pages = paginator.paginate(
+            TableName=self.table_name,
+            ProjectionExpression=f"repo_name, stat_type, days, #count, uniques, {self.ttl_attribute}",
+            ExpressionAttributeNames={"#count": "count"},
+        )
+
+        totals = StatsAccumulator()
+        filtered = bool(start or end)
+        for page in pages:
+            for item in page["Items"]:
+                if self.ttl_attribute in item or item["stat_type"]["S"] == self.popular_key:
+                    continue
+                repo_name = item["repo_name"]["S"]
+                month, _, stat_type = item["stat_type"]["S"].rpartition("_")
+                counts = self.unpack(item["count"]["B"])
+                uniques = self.unpack(item["uniques"]["B"])
+                if filtered:
+                    if (start and start[:7] > month) or (end and end[:7] < month):
+                        continue
+                    # Absent days are stored as zeros, so only the range within the month matters
+                    first = 1 if not start or start[:7] < month else int(start[8:10])
+                    last = self.days_per_item if not end or end[:7] > month else int(end[8:10])
+                    counts = counts[first - 1:last]
+                    uniques = uniques[first - 1:last]
+                totals.add(repo_name, stat_type, sum(counts), sum(uniques))
+        return totals.totals()
+
+
+def open_store(spec, region_name=None, write_rate=None, archive=None):
+    """
+    Opens a store from a spec such as "memory://", "file://./traffic_stats", "sqlite://./stats.sqlite",
+    "dynamodb://github_stats" or "dynamodb-monthly://github_stats_monthly";
+    with an archive spec such as "file://./archive" or "s3://bucket/prefix", reads also cover the archive tier
+    """
+    scheme, _, location = spec.partition("://")
+    if scheme == "memory":
+        store = MemoryStore()
+    elif scheme == "file":
+        store = JsonFileStore(location)
+    elif scheme == "sqlite":
+        store = SqliteStore(location)
+    elif scheme == "dynamodb":
+        store = DynamoDBStore(location, region_name=region_name, write_rate=write_rate)
+    elif scheme == "dynamodb-monthly":
+        store = MonthlyDynamoDBStore(location, region_name=region_name, write_rate=write_rate)
+    else:
+        raise ValueError(f"Unknown stats store: {spec}")
+
+    if archive:
+        from stats_archive import TieredStore, open_archive
+
+        store = TieredStore(store, open_archive(archive, region_name=region_name))
+    return store
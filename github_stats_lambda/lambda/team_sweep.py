@@ -0,0 +1,65 @@
+"""
+Resolution of many GitHub org/team pairs into one repo set
+
+A sweep covers any number of teams, across orgs. Each team's repos are listed
+once and merged by full name, so a repo shared by several teams is fetched
+once per sweep, and the teams it belongs to are kept as its membership:
+
+    {"my-org/api": ["my-org/platform", "my-org/sre"], "my-org/docs": ["my-org/docs"]}
+
+Teams are configured as "org/team" strings (comma separated in the
+environment) or {"org": ..., "team": ...} entries.
+"""
+import logging
+
+logger = logging.getLogger("GitHubStats")
+
+
+def parse_teams(entries):
+    """
+    Returns the (org, team) pairs of "org/team" strings or {"org", "team"} entries, without duplicates
+    """
+    teams = []
+    for entry in entries:
+        if isinstance(entry, dict):
+            org_name, team_name = entry.get("org"), entry.get("team")
+        else:
+            org_name, _, team_name = str(entry).strip().partition("/")
+        if not org_name or not team_name:
+            if entry:
+                raise ValueError(f"Invalid team, expected org/team: {entry}")
+            continue
+        if (org_name, team_name) not in teams:
+            teams.append((org_name, team_name))
+    return teams
+
+
+def resolve_teams(tokens, teams):
+    """
+    Returns {repo full name: ["org/team", ...]} for the public, unarchived repos of all the teams
+    """
+    from github import Github
+
+    membership = {}
+    for org_name, team_name in teams:
+        if not any(t.matches(f"{org_name}/") for t in tokens.tokens):
+            raise ValueError(f"No GitHub token configured for {org_name}, one is needed to list team {team_name}")
+        token = tokens.acquire(f"{org_name}/")
+        try:
+            g = Github(token.token)
+            org = g.get_organization(org_name)
+            team = org.get_team_by_slug(team_name)
+
+            for repo in team.get_repos():
+                if repo.archived or repo.private:
+                    continue
+                membership.setdefault(repo.full_name, []).append(f"{org_name}/{team_name}")
+
+            remaining, limit = g.rate_limiting
+            tokens.update(token, remaining=remaining, reset=g.rate_limiting_resettime, limit=limit)
+        finally:
+            tokens.release(token)
+
+    shared = sum(len(repo_teams) > 1 for repo_teams in membership.values())
+    logger.info(f"Resolved {len(teams)} teams into {len(membership)} repos, {shared} shared by several teams")
+    return membership
@@ -15,7 +15,7 @@ logger = logging.getLogger(__name__)
 
 class GithubStatsCdkStack(Stack):
     def __init__(self, scope: Construct, construct_id: str, org_name: str, team_name: str, access_token: str,
-                 platform: str, **kwargs) -> None:
+                 platform: str, tokens: str = "", teams: str = "", layout: str = "daily", **kwargs) -> None:
         super().__init__(scope, construct_id, **kwargs)
 
         # Create DynamoDB table to store stats
@@ -29,6 +29,37 @@ class GithubStatsCdkStack(Stack):
                 name="stat_type", type=dynamodb.AttributeType.STRING
             ),
             table_name="github_stats",
+            # Archived datapoints are marked with an expiry time and deleted by DynamoDB
+            time_to_live_attribute="expires_at",
+        )
+
+        environment = {}
+        if layout == "monthly":
+            # Packed per-month items go to their own table, see migrate_layout.py
+            table = dynamodb.Table(
+                self,
+                "MonthlyStatsTable",
+                partition_key=dynamodb.Attribute(
+                    name="repo_name", type=dynamodb.AttributeType.STRING
+                ),
+                sort_key=dynamodb.Attribute(
+                    name="stat_type", type=dynamodb.AttributeType.STRING
+                ),
+                table_name="github_stats_monthly",
+                time_to_live_attribute="expires_at",
+            )
+            environment["GITHUB_STATS_STORE"] = "dynamodb-monthly://github_stats_monthly"
+
+        # Single-flight lease, so overlapping runs never ingest the same stats twice
+        lease_table = dynamodb.Table(
+            self,
+            "LeaseTable",
+            partition_key=dynamodb.Attribute(
+                name="lease", type=dynamodb.AttributeType.STRING
+            ),
+            table_name="github_stats_leases",
+            billing_mode=dynamodb.BillingMode.PAY_PER_REQUEST,
+            time_to_live_attribute="expires_at",
         )
 
         func = _lambda.DockerImageFunction(
@@ -39,9 +70,13 @@ class GithubStatsCdkStack(Stack):
             architecture=_lambda.Architecture.ARM_64 if platform == "arm64" else _lambda.Architecture.X86_64,
             environment={
                 "TABLE_NAME": table.table_name,
+                "LEASE_TABLE_NAME": lease_table.table_name,
                 "GITHUB_TOKEN": access_token,
+                "GITHUB_TOKENS": tokens,
                 "ORG_NAME": org_name,
                 "TEAM_NAME": team_name,
+                "TEAMS": teams,
+                **environment,
             },
             timeout=Duration.minutes(5),
         )
@@ -58,6 +93,7 @@ class GithubStatsCdkStack(Stack):
 
         # Add permission for Lambda to access DynamoDB table
         table.grant_read_write_data(func)
+        lease_table.grant_read_write_data(func)
 
         # Create CloudWatch Events rule to trigger Lambda every hour
         rule = _events.Rule(
@@ -0,0 +1,31 @@
+"""
+Shared fixtures for the tests of the Lambda function's modules
+
+The modules in ../lambda and ../graph_data are flat scripts rather than a
+package, so their directories are put on the path the same way the Lambda
+runtime and the graph_data CLI do; the Lambda modules come first.
+"""
+import os
+import sys
+
+import pytest
+
+base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [os.path.join(base_dir, "lambda"), os.path.join(base_dir, "graph_data")]
+
+
+@pytest.fixture
+def aws(monkeypatch):
+    """
+    Mocks AWS with moto, with fake credentials so nothing can reach a real account
+    """
+    moto = pytest.importorskip("moto")
+    for name, value in (
+        ("AWS_ACCESS_KEY_ID", "testing"),
+        ("AWS_SECRET_ACCESS_KEY", "testing"),
+        ("AWS_SESSION_TOKEN", "testing"),
+        ("AWS_DEFAULT_REGION", "eu-west-1"),
+    ):
+        monkeypatch.setenv(name, value)
+    with moto.mock_aws():
+        yield
@@ -0,0 +1,140 @@
+"""
+Token bucket pacing and adaptive retries of the DynamoDB batch writer, on a fake clock
+"""
+import pytest
+from botocore.exceptions import ClientError
+
+from ddb_writer import BatchWriteScheduler, TokenBucket
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+        self.slept = 0.0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.slept += seconds
+        self.now += seconds
+
+
+class FakeResource:
+    """
+    Answers BatchWriteItem from a script of outcomes: an int leaves that many items
+    unprocessed, an error code raises it; the requests are recorded
+    """
+
+    def __init__(self, table_name, outcomes=()):
+        self.table_name = table_name
+        self.outcomes = list(outcomes)
+        self.requests = []
+
+    def batch_write_item(self, RequestItems, ReturnConsumedCapacity):
+        batch = RequestItems[self.table_name]
+        self.requests.append(len(batch))
+        outcome = self.outcomes.pop(0) if self.outcomes else 0
+        if isinstance(outcome, str):
+            raise ClientError({"Error": {"Code": outcome, "Message": outcome}}, "BatchWriteItem")
+        written = len(batch) - outcome
+        return {
+            "UnprocessedItems": {self.table_name: batch[written:]} if outcome else {},
+            "ConsumedCapacity": [{"TableName": self.table_name, "CapacityUnits": float(written)}],
+        }
+
+
+def items(n):
+    return [{"repo_name": "org/a", "stat_type": f"{i:05d}_views"} for i in range(n)]
+
+
+def scheduler(resource, write_rate, clock, **kwargs):
+    return BatchWriteScheduler(
+        resource, resource.table_name, write_rate=write_rate, base_delay=0.01, clock=clock, sleep=clock.sleep, **kwargs
+    )
+
+
+def test_bucket_waits_for_refill():
+    clock = FakeClock()
+    bucket = TokenBucket(10, clock=clock, sleep=clock.sleep)
+    bucket.acquire(10)
+    bucket.charge(10)
+    bucket.acquire(5)
+    assert clock.slept == pytest.approx(0.5)
+
+
+def test_bucket_without_rate_never_waits():
+    clock = FakeClock()
+    bucket = TokenBucket(None, clock=clock, sleep=clock.sleep)
+    for _ in range(100):
+        bucket.acquire(25)
+        bucket.charge(25)
+    assert clock.slept == 0
+
+
+def test_burst_allowance_is_spent_before_pacing():
+    clock = FakeClock()
+    resource = FakeResource("github_stats")
+    writer = scheduler(resource, 5, clock)
+
+    # 5 WCU banks 1500 units over 5 minutes, an hourly run's 1400 items need no waiting
+    assert writer.write(items(1400))["items"] == 1400
+    assert clock.slept == 0
+
+    # Past the burst, writes are paced at the provisioned rate: the last 100
+    # units cover 4 batches, the next 4 wait 5 seconds each
+    writer.write(items(200))
+    assert clock.slept == pytest.approx(20)
+
+
+def test_unprocessed_items_are_retried_in_smaller_batches():
+    clock = FakeClock()
+    resource = FakeResource("github_stats", outcomes=[0, 10])
+    stats = scheduler(resource, None, clock).write(items(60))
+
+    assert stats["items"] == 60
+    assert stats["unprocessed"] == 10
+    # The batch after the partial write is halved
+    assert resource.requests[:3] == [25, 25, 12]
+    assert sum(resource.requests) == 70
+
+
+def test_throttling_slows_the_rate_and_retries():
+    clock = FakeClock()
+    resource = FakeResource("github_stats", outcomes=["ProvisionedThroughputExceededException"])
+    writer = scheduler(resource, 100, clock)
+    stats = writer.write(items(25))
+
+    assert stats["items"] == 25 and stats["throttled"] == 1
+    # Slowed to 80%, then a step back up for each clean batch of the retry
+    assert resource.requests == [25, 12, 13]
+    assert writer.bucket.rate == pytest.approx(82)
+
+
+def test_other_errors_are_raised():
+    resource = FakeResource("github_stats", outcomes=["ValidationException"])
+    with pytest.raises(ClientError):
+        scheduler(resource, None, FakeClock()).write(items(5))
+
+
+def test_gives_up_after_max_retries():
+    resource = FakeResource("github_stats", outcomes=["ThrottlingException"] * 10)
+    with pytest.raises(RuntimeError):
+        scheduler(resource, None, FakeClock(), max_retries=3).write(items(5))
+
+
+def test_for_table_reads_the_write_capacity(aws):
+    from boto3 import resource
+
+    dynamodb = resource("dynamodb", region_name="eu-west-1")
+    key = {
+        "KeySchema": [{"AttributeName": "repo_name", "KeyType": "HASH"}],
+        "AttributeDefinitions": [{"AttributeName": "repo_name", "AttributeType": "S"}],
+    }
+    dynamodb.create_table(TableName="provisioned", ProvisionedThroughput={"ReadCapacityUnits": 5, "WriteCapacityUnits": 7}, **key)
+    dynamodb.create_table(TableName="on_demand", BillingMode="PAY_PER_REQUEST", **key)
+
+    assert BatchWriteScheduler.for_table(dynamodb, "provisioned").bucket.rate == 7
+    assert BatchWriteScheduler.for_table(dynamodb, "provisioned").bucket.capacity == 7 * 300
+    assert BatchWriteScheduler.for_table(dynamodb, "on_demand").bucket.rate is None
+    assert BatchWriteScheduler.for_table(dynamodb, "on_demand", write_rate=50).bucket.rate == 50
@@ -0,0 +1,127 @@
+"""
+IngestPipeline writes every repo once and stops all stages when one fails
+"""
+import threading
+
+import pytest
+
+from ingest_pipeline import IngestPipeline
+from stats_storage import MemoryStore
+
+repos = [f"org/repo-{i}" for i in range(20)]
+
+
+def traffic(repo, days=3):
+    series = [{"timestamp": f"2023-04-{day:02d}T00:00:00Z", "count": day, "uniques": 1} for day in range(1, days + 1)]
+    return {"repo_name": repo, "views": series, "clones": series}
+
+
+class FailingStore(MemoryStore):
+    def __init__(self, fail_on):
+        super().__init__()
+        self.fail_on = fail_on
+        self.writes = 0
+
+    def upsert_records(self, records, popular=None, accumulate=False):
+        self.writes += 1
+        if self.writes == self.fail_on:
+            raise ConnectionError("DynamoDB is unreachable")
+        super().upsert_records(records, popular, accumulate=accumulate)
+
+
+def run_in_thread(pipeline, repos):
+    # Runs the pipeline with a deadline, so a stage that hangs fails the test instead of the suite
+    outcome = {}
+
+    def run():
+        try:
+            outcome["stats"] = pipeline.run(repos)
+        except Exception as e:
+            outcome["error"] = e
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    thread.join(30)
+    assert not thread.is_alive(), "the pipeline did not stop"
+    return outcome
+
+
+def test_every_repo_is_written_once():
+    store = MemoryStore()
+    pipeline = IngestPipeline(traffic, store, fetchers=4, batch_size=10)
+    stats = run_in_thread(pipeline, repos)["stats"]
+
+    assert stats["repos"] == len(repos)
+    assert stats["records"] == len(repos) * 6
+    assert stats["batches"] > 1
+    assert store.list_repos() == sorted(repos)
+    assert store.aggregate()["org/repo-7"]["views"] == {"count": 6, "uniques": 3}
+
+
+def test_writer_gets_finished_records_and_snapshots():
+    class RecordingStore(MemoryStore):
+        batches = []
+
+        def upsert_records(self, records, popular=None, accumulate=False):
+            self.batches.append((records, popular))
+            super().upsert_records(records, popular, accumulate=accumulate)
+
+    def fetch(repo):
+        return {**traffic(repo), "popular": {"date": "2023-04-14", "referrers": [], "paths": []}}
+
+    store = RecordingStore()
+    run_in_thread(IngestPipeline(fetch, store, fetchers=2, batch_size=12), repos[:4])
+
+    assert sum(len(records) for records, _ in store.batches) == 4 * 6
+    assert all(len(records) == 12 for records, _ in store.batches)
+    assert store.batches[0][0][0]["date"] == "2023-04-01"
+    assert sorted(repo for _, popular in store.batches for repo in popular) == sorted(repos[:4])
+    assert store.read_popular("org/repo-2")["date"] == "2023-04-14"
+
+
+def test_transform_error_is_raised_by_run():
+    def fetch(repo):
+        return {"repo_name": repo, "views": [{"timestamp": "yesterday", "count": 1, "uniques": 1}]}
+
+    outcome = run_in_thread(IngestPipeline(fetch, MemoryStore(), fetchers=2), repos)
+    assert isinstance(outcome.get("error"), ValueError)
+
+
+def test_runs_accumulate_by_default():
+    store = MemoryStore()
+    for _ in range(2):
+        run_in_thread(IngestPipeline(traffic, store, fetchers=2), repos[:2])
+    assert store.aggregate()["org/repo-0"]["clones"] == {"count": 12, "uniques": 6}
+
+
+def test_fetch_error_is_raised_by_run():
+    def fetch(repo):
+        if repo == "org/repo-5":
+            raise ValueError(f"bad response for {repo}")
+        return traffic(repo)
+
+    outcome = run_in_thread(IngestPipeline(fetch, MemoryStore(), fetchers=4, batch_size=6), repos)
+    assert isinstance(outcome.get("error"), ValueError)
+    assert "org/repo-5" in str(outcome["error"])
+
+
+def test_write_error_stops_the_fetchers():
+    fetched = []
+
+    def fetch(repo):
+        fetched.append(repo)
+        return traffic(repo)
+
+    many_repos = [f"org/repo-{i}" for i in range(500)]
+    store = FailingStore(fail_on=2)
+    outcome = run_in_thread(IngestPipeline(fetch, store, fetchers=2, batch_size=6, queue_size=2), many_repos)
+
+    assert isinstance(outcome.get("error"), ConnectionError)
+    # The bounded queues stop the fetchers soon after the writer fails
+    assert len(fetched) < len(many_repos)
+
+
+@pytest.mark.parametrize("fetchers", [1, 8])
+def test_empty_run(fetchers):
+    stats = run_in_thread(IngestPipeline(traffic, MemoryStore(), fetchers=fetchers), [])["stats"]
+    assert stats["repos"] == 0 and stats["records"] == 0 and stats["batches"] == 0
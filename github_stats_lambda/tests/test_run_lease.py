@@ -0,0 +1,129 @@
+"""
+Single-flight runs and takeover of RunLease, with the file and DynamoDB records
+"""
+import threading
+import time
+
+import pytest
+
+from run_lease import DynamoDBLease, FileLease, LeaseHeld
+
+
+class FakeClock:
+    """
+    A clock that only moves when the lease sleeps
+    """
+
+    def __init__(self, now=1_700_000_000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+@pytest.fixture(params=["file", "dynamodb"])
+def make_lease(request, tmp_path):
+    if request.param == "file":
+        return lambda **kwargs: FileLease("ingest", str(tmp_path / "update.lease"), **kwargs)
+
+    request.getfixturevalue("aws")
+    DynamoDBLease("ingest", "github_stats_leases", region_name="eu-west-1").create_table_if_not_exists()
+    return lambda **kwargs: DynamoDBLease("ingest", "github_stats_leases", region_name="eu-west-1", **kwargs)
+
+
+def hold(lease, run_id, expires_at, state="running"):
+    # A lease record written by another, possibly dead, run
+    record = lease.record(run_id, state, started_at=0)
+    record["owner"] = "other-host:1"
+    record["expires_at"] = int(expires_at)
+    assert lease.put_if_free(record, lease.clock())
+
+
+def test_run_returns_the_result_and_frees_the_lease(make_lease):
+    lease = make_lease()
+    assert lease.run(lambda: {"records": 3}) == {"records": 3}
+    current = lease.load()
+    assert current["state"] == "done"
+    assert lease.is_free(current, time.time())
+    # The next run does its own work
+    assert lease.run(lambda: {"records": 5}) == {"records": 5}
+
+
+def test_concurrent_run_waits_for_the_result_of_the_run_in_flight(make_lease):
+    started = threading.Event()
+    finish = threading.Event()
+    waiting = threading.Event()
+    calls = []
+
+    def work():
+        calls.append(threading.current_thread().name)
+        started.set()
+        assert finish.wait(10)
+        return {"records": 42}
+
+    def waiter_sleep(seconds):
+        waiting.set()
+        time.sleep(seconds)
+
+    results = {}
+    holder = threading.Thread(target=lambda: results.update(holder=make_lease().run(work)), name="holder")
+    late = threading.Thread(
+        target=lambda: results.update(late=make_lease(poll_interval=0.05, sleep=waiter_sleep).run(work, timeout=10)),
+        name="late",
+    )
+    holder.start()
+    assert started.wait(10)
+    late.start()
+    assert waiting.wait(10)
+    finish.set()
+    holder.join(10)
+    late.join(10)
+
+    assert calls == ["holder"]
+    assert results == {"holder": {"records": 42}, "late": {"records": 42}}
+
+
+def test_expired_lease_is_taken_over(make_lease):
+    clock = FakeClock()
+    lease = make_lease(clock=clock, sleep=clock.sleep)
+    hold(lease, "dead-run", clock() - 1)
+
+    assert lease.run(lambda: "mine") == "mine"
+    assert lease.load()["owner"] == lease.owner
+
+
+def test_waiter_takes_over_when_the_holder_stops_heartbeating(make_lease):
+    clock = FakeClock()
+    lease = make_lease(clock=clock, sleep=clock.sleep, poll_interval=5)
+    start = clock()
+    hold(lease, "dying-run", start + 30)
+
+    calls = []
+    assert lease.run(lambda: calls.append(clock()) or "taken over", timeout=120) == "taken over"
+    # The work only ran once the holder's lease had expired
+    assert len(calls) == 1 and calls[0] > start + 30
+
+
+def test_failed_run_lets_the_next_run_do_the_work(make_lease):
+    lease = make_lease()
+
+    def fail():
+        raise RuntimeError("GitHub is down")
+
+    with pytest.raises(RuntimeError):
+        lease.run(fail)
+    assert lease.load()["state"] == "failed"
+    assert lease.run(lambda: "retried") == "retried"
+
+
+def test_waiter_gives_up_after_its_timeout(make_lease):
+    clock = FakeClock()
+    lease = make_lease(clock=clock, sleep=clock.sleep, poll_interval=5)
+    hold(lease, "long-run", clock() + 600)
+
+    with pytest.raises(LeaseHeld):
+        lease.run(lambda: "never", timeout=20)
+    assert lease.load()["run_id"] == "long-run"
@@ -0,0 +1,33 @@
+"""
+The standalone app and graph_data carry copies of modules whose originals are in
+lambda (and graph_data for analytics), so each directory runs on its own; the
+copies must not drift from the originals
+"""
+import os
+
+import pytest
+
+base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+standalone_dir = os.path.join(os.path.dirname(base_dir), "github_stats_standalone")
+
+lambda_modules = ["ddb_writer", "repo_traffic", "run_lease", "stats_archive", "stats_storage", "team_sweep", "token_pool"]
+copies = [
+    *[(os.path.join(base_dir, "lambda", f"{m}.py"), os.path.join(standalone_dir, f"{m}.py")) for m in lambda_modules],
+    *[
+        (os.path.join(base_dir, "lambda", f"{m}.py"), os.path.join(base_dir, "graph_data", f"{m}.py"))
+        for m in ("ddb_writer", "stats_archive", "stats_storage")
+    ],
+    (os.path.join(base_dir, "graph_data", "analytics.py"), os.path.join(standalone_dir, "analytics.py")),
+]
+
+
+def read(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+
+@pytest.mark.parametrize("original, copy", copies, ids=[os.path.relpath(c, os.path.dirname(base_dir)) for _, c in copies])
+def test_copy_matches_its_original(original, copy):
+    if not os.path.exists(copy):
+        pytest.skip(f"{copy} is not checked out next to this directory")
+    assert read(copy) == read(original), f"{copy} differs from {original}, copy the original over it"
@@ -0,0 +1,128 @@
+"""
+Compaction into the archive tier and reads across both tiers
+"""
+from datetime import date, timedelta
+
+import pytest
+
+from stats_archive import LocalArchive, StatsArchive, TieredStore, compact, decode_year, encode_year
+from stats_storage import open_store, stat_types
+
+today = date(2024, 6, 1)
+
+
+def days_ago(days):
+    return (today - timedelta(days=days)).isoformat()
+
+
+def record(repo_name, stat_type, day, count, uniques=1):
+    return {
+        "repo_name": repo_name,
+        "stat_type": stat_type,
+        "date": day,
+        "timestamp": f"{day}T00:00:00Z",
+        "count": count,
+        "uniques": uniques,
+    }
+
+
+def history(repo_name, days):
+    # One datapoint per stat type and day, counting up with age
+    return [record(repo_name, stat_type, days_ago(age), age + 1) for age in range(days) for stat_type in stat_types]
+
+
+def series_totals(store, repo_name):
+    return {
+        stat_type: {
+            "count": sum(r["count"] for r in store.read_range(repo_name, stat_type)),
+            "uniques": sum(r["uniques"] for r in store.read_range(repo_name, stat_type)),
+        }
+        for stat_type in stat_types
+    }
+
+
+@pytest.fixture
+def archive(tmp_path):
+    return StatsArchive(LocalArchive(str(tmp_path / "archive")))
+
+
+@pytest.fixture
+def tiered(archive):
+    hot = open_store("memory://")
+    hot.upsert_many(history("org/a", 500) + history("org/b", 30))
+    return TieredStore(hot, archive)
+
+
+def test_encode_decode_round_trip():
+    series = {"views": {"2023-01-01": (3, 1), "2023-12-31": (5, 2)}, "clones": {"2023-02-03": (1, 1)}}
+    assert decode_year(encode_year("org/a", 2023, series)) == series
+
+
+def test_compact_moves_old_days_to_the_archive(tiered, archive):
+    before = tiered.aggregate()
+    summary = compact(tiered, archive, horizon_days=400, today=today)
+
+    assert summary["repos"] == 1
+    assert summary["records"] == 2 * 99
+    assert summary["archived_through"] == days_ago(401)
+    assert archive.list_repos() == ["org/a"]
+    # The hot store keeps only the horizon, reads still cover the full history
+    assert tiered.hot.read_range("org/a", "views")[0]["date"] == days_ago(400)
+    assert len(tiered.read_range("org/a", "views")) == 500
+    assert tiered.aggregate() == before
+
+
+def test_compact_is_safe_to_rerun(tiered, archive):
+    before = tiered.aggregate()
+    compact(tiered, archive, horizon_days=400, today=today)
+    assert compact(tiered, archive, horizon_days=400, today=today)["records"] == 0
+    assert tiered.aggregate() == before
+
+
+def test_compact_keeps_the_fetch_window(tiered, archive):
+    with pytest.raises(ValueError):
+        compact(tiered, archive, horizon_days=14, today=today)
+
+
+def test_read_range_spans_both_tiers(tiered, archive):
+    compact(tiered, archive, horizon_days=400, today=today)
+    records = tiered.read_range("org/a", "views", start=days_ago(405), end=days_ago(395))
+    assert [r["date"] for r in records] == [days_ago(age) for age in range(405, 394, -1)]
+
+
+def test_interrupted_compaction_counts_each_day_once(tiered, archive):
+    # The archive was written but the hot items were never expired
+    old = [r for r in tiered.hot.read_range("org/a", "views", end=days_ago(401))]
+    old += tiered.hot.read_range("org/a", "clones", end=days_ago(401))
+    archive.merge_records(old)
+
+    assert tiered.aggregate()["org/a"] == series_totals(tiered, "org/a")
+    assert tiered.aggregate()["org/a"] == tiered.hot.aggregate()["org/a"]
+
+
+def test_hot_day_wins_over_its_archived_copy(tiered, archive):
+    compact(tiered, archive, horizon_days=400, today=today)
+    # A late rewrite of an archived day in the hot store
+    tiered.upsert_many([record("org/a", "views", days_ago(450), 1000, 7)])
+
+    (merged,) = tiered.read_range("org/a", "views", days_ago(450), days_ago(450))
+    assert (merged["count"], merged["uniques"]) == (1000, 7)
+    assert tiered.aggregate()["org/a"] == series_totals(tiered, "org/a")
+
+
+def test_aggregate_over_a_date_range(tiered, archive):
+    compact(tiered, archive, horizon_days=400, today=today)
+    totals = tiered.aggregate(start=days_ago(410), end=days_ago(391))
+    assert totals["org/a"]["views"]["count"] == sum(age + 1 for age in range(391, 411))
+
+
+def test_accumulate_does_not_revive_expired_dynamodb_items(aws):
+    store = open_store("dynamodb://github_stats", region_name="eu-west-1", write_rate=1000)
+    store.create_table_if_not_exists()
+    archived = record("org/a", "views", "2023-01-01", 10, 2)
+    store.upsert_many([archived])
+    store.expire_many([archived])
+
+    store.upsert_many([record("org/a", "views", "2023-01-01", 1, 1)], accumulate=True)
+    item = store.table.get_item(Key={"repo_name": "org/a", "stat_type": "2023-01-01_views"})["Item"]
+    assert (int(item["count"]), int(item["uniques"])) == (1, 1)
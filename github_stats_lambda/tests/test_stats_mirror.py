@@ -0,0 +1,113 @@
+"""
+StatsMirror syncs the full history once, then only the recent window of each series
+"""
+import pytest
+
+from stats_mirror import StatsMirror
+from stats_storage import MemoryStore
+
+
+def record(repo_name, stat_type, date, count, uniques=1):
+    return {
+        "repo_name": repo_name,
+        "stat_type": stat_type,
+        "date": date,
+        "timestamp": f"{date}T00:00:00Z",
+        "count": count,
+        "uniques": uniques,
+    }
+
+
+def points(records):
+    return [(r["date"], r["count"]) for r in records]
+
+
+class RecordingStore(MemoryStore):
+    """
+    A remote store that records the start date of every range query
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.starts = []
+
+    def read_range(self, repo_name, stat_type, start=None, end=None):
+        self.starts.append((repo_name, stat_type, start))
+        return super().read_range(repo_name, stat_type, start, end)
+
+
+@pytest.fixture
+def remote():
+    remote = RecordingStore()
+    remote.upsert_many([
+        record("org/a", "views", "2023-01-01", 1),
+        record("org/a", "views", "2023-03-01", 2),
+        record("org/a", "clones", "2023-03-01", 3),
+        record("org/b", "views", "2023-02-01", 4),
+    ])
+    return remote
+
+
+@pytest.fixture
+def mirror(tmp_path):
+    return StatsMirror(str(tmp_path / "mirror.sqlite"))
+
+
+def test_first_sync_copies_everything(mirror, remote):
+    assert mirror.last_synced() is None
+    summary = mirror.sync(remote)
+
+    assert summary == {"repos": 2, "queries": 4, "records": 4}
+    assert mirror.aggregate() == remote.aggregate()
+    assert mirror.high_water_marks() == {
+        ("org/a", "views"): "2023-03-01",
+        ("org/a", "clones"): "2023-03-01",
+        ("org/b", "views"): "2023-02-01",
+    }
+    assert mirror.last_synced() is not None
+
+
+def test_refresh_reads_from_the_high_water_mark(mirror, remote):
+    mirror.sync(remote)
+    remote.starts.clear()
+    # A new day, and a revision of a day inside the window the Lambda re-fetches
+    remote.upsert_many([
+        record("org/a", "views", "2023-03-02", 5),
+        record("org/a", "views", "2023-02-20", 6),
+    ])
+
+    summary = mirror.sync(remote)
+    assert ("org/a", "views", "2023-02-15") in remote.starts
+    assert ("org/b", "views", "2023-01-18") in remote.starts
+    # A series never seen is read in full
+    assert ("org/b", "clones", None) in remote.starts
+    # Only the datapoints inside each series' window are read again
+    assert summary["records"] == 5
+    assert points(mirror.read_range("org/a", "views")) == [
+        ("2023-01-01", 1),
+        ("2023-02-20", 6),
+        ("2023-03-01", 2),
+        ("2023-03-02", 5),
+    ]
+    assert mirror.high_water_marks()[("org/a", "views")] == "2023-03-02"
+
+
+def test_refresh_keeps_to_known_repos(mirror, remote):
+    mirror.sync(remote)
+    remote.upsert_many([record("org/c", "views", "2023-03-01", 1)])
+
+    assert mirror.sync(remote)["repos"] == 2
+    assert mirror.list_repos() == ["org/a", "org/b"]
+    assert mirror.sync(remote, full=True)["repos"] == 3
+    assert mirror.list_repos() == ["org/a", "org/b", "org/c"]
+
+
+def test_full_sync_rebuilds_the_mirror(mirror, remote):
+    mirror.sync(remote)
+    fresh = RecordingStore()
+    fresh.upsert_many([record("org/b", "views", "2023-02-01", 9)])
+
+    mirror.sync(fresh, full=True)
+    assert mirror.list_repos() == ["org/b"]
+    assert set(mirror.high_water_marks()) == {("org/b", "views")}
+    assert points(mirror.read_range("org/b", "views")) == [("2023-02-01", 9)]
@@ -0,0 +1,127 @@
+"""
+The StatsStore contract, run against every backend
+"""
+import pytest
+
+from stats_storage import open_store
+
+
+def record(repo_name, stat_type, date, count, uniques=1):
+    return {
+        "repo_name": repo_name,
+        "stat_type": stat_type,
+        "date": date,
+        "timestamp": f"{date}T00:00:00Z",
+        "count": count,
+        "uniques": uniques,
+    }
+
+
+def points(records):
+    return [(r["date"], r["count"], r["uniques"]) for r in records]
+
+
+@pytest.fixture(params=["memory", "file", "sqlite", "dynamodb", "dynamodb-monthly"])
+def store(request, tmp_path):
+    backend = request.param
+    if backend == "memory":
+        return open_store("memory://")
+    if backend == "file":
+        return open_store(f"file://{tmp_path}/traffic_stats")
+    if backend == "sqlite":
+        return open_store(f"sqlite://{tmp_path}/stats.sqlite")
+
+    request.getfixturevalue("aws")
+    store = open_store(f"{backend}://github_stats", region_name="eu-west-1", write_rate=1000)
+    store.create_table_if_not_exists()
+    return store
+
+
+@pytest.fixture
+def filled(store):
+    store.upsert_many([
+        record("org/a", "views", "2023-03-30", 5, 2),
+        record("org/a", "views", "2023-04-01", 10, 3),
+        record("org/a", "views", "2023-04-02", 7, 1),
+        record("org/a", "clones", "2023-04-01", 2, 1),
+        record("org/b", "views", "2023-04-02", 4, 4),
+    ])
+    return store
+
+
+def test_read_range_returns_oldest_first(filled):
+    assert points(filled.read_range("org/a", "views")) == [
+        ("2023-03-30", 5, 2),
+        ("2023-04-01", 10, 3),
+        ("2023-04-02", 7, 1),
+    ]
+    assert points(filled.read_range("org/a", "clones")) == [("2023-04-01", 2, 1)]
+
+
+def test_read_range_bounds_are_inclusive(filled):
+    assert points(filled.read_range("org/a", "views", start="2023-04-01")) == [
+        ("2023-04-01", 10, 3),
+        ("2023-04-02", 7, 1),
+    ]
+    assert points(filled.read_range("org/a", "views", end="2023-04-01")) == [
+        ("2023-03-30", 5, 2),
+        ("2023-04-01", 10, 3),
+    ]
+    assert points(filled.read_range("org/a", "views", "2023-04-01", "2023-04-01")) == [("2023-04-01", 10, 3)]
+    assert filled.read_range("org/a", "views", "2023-05-01") == []
+
+
+def test_read_range_of_unknown_repo_is_empty(filled):
+    assert filled.read_range("org/missing", "views") == []
+
+
+def test_upsert_replaces_datapoints(filled):
+    filled.upsert_many([record("org/a", "views", "2023-04-01", 1, 1)])
+    assert points(filled.read_range("org/a", "views", "2023-04-01", "2023-04-01")) == [("2023-04-01", 1, 1)]
+
+
+def test_upsert_accumulate_adds_to_datapoints(filled):
+    filled.upsert_many(
+        [record("org/a", "views", "2023-04-01", 1, 1), record("org/a", "views", "2023-04-03", 6, 2)],
+        accumulate=True,
+    )
+    assert points(filled.read_range("org/a", "views", start="2023-04-01")) == [
+        ("2023-04-01", 11, 4),
+        ("2023-04-02", 7, 1),
+        ("2023-04-03", 6, 2),
+    ]
+
+
+def test_list_repos_is_sorted(filled):
+    assert filled.list_repos() == ["org/a", "org/b"]
+
+
+def test_aggregate(filled):
+    assert filled.aggregate() == {
+        "org/a": {"views": {"count": 22, "uniques": 6}, "clones": {"count": 2, "uniques": 1}},
+        "org/b": {"views": {"count": 4, "uniques": 4}, "clones": {"count": 0, "uniques": 0}},
+    }
+
+
+def test_aggregate_over_date_range(filled):
+    totals = filled.aggregate(start="2023-04-01", end="2023-04-01")
+    assert totals["org/a"]["views"] == {"count": 10, "uniques": 3}
+    assert totals["org/a"]["clones"] == {"count": 2, "uniques": 1}
+
+
+def test_upsert_traffic_writes_series_and_popular(store):
+    snapshot = {"date": "2023-04-14", "referrers": [{"referrer": "github.com", "count": 3}], "paths": []}
+    store.upsert_traffic([
+        {
+            "repo_name": "org/a",
+            "views": [{"timestamp": "2023-04-01T00:00:00Z", "count": 3, "uniques": 2}],
+            "clones": [{"timestamp": "2023-04-01T00:00:00Z", "count": 1, "uniques": 1}],
+            "popular": snapshot,
+        },
+    ])
+    assert points(store.read_range("org/a", "views")) == [("2023-04-01", 3, 2)]
+    assert points(store.read_range("org/a", "clones")) == [("2023-04-01", 1, 1)]
+    assert store.read_popular("org/a") == snapshot
+    # The popular snapshot is not a repo's datapoint
+    assert store.aggregate()["org/a"]["views"] == {"count": 3, "uniques": 2}
+    assert store.list_repos() == ["org/a"]
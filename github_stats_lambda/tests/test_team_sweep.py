@@ -0,0 +1,88 @@
+"""
+Team parsing and the merge of several teams' repos, against a fake PyGithub
+"""
+from types import SimpleNamespace
+
+import pytest
+
+github = pytest.importorskip("github")
+
+from team_sweep import parse_teams, resolve_teams
+from token_pool import PooledToken, TokenPool
+
+teams = {
+    ("org-a", "platform"): ["org-a/api", "org-a/infra", "org-a/old"],
+    ("org-a", "sre"): ["org-a/api", "org-a/secret"],
+    ("org-b", "docs"): ["org-b/site"],
+}
+archived = {"org-a/old"}
+private = {"org-a/secret"}
+
+
+class FakeGithub:
+    """
+    Serves the teams above, recording the token used for each org
+    """
+
+    calls = []
+
+    def __init__(self, token):
+        self.token = token
+        self.rate_limiting = (4000, 5000)
+        self.rate_limiting_resettime = 2_000_000_000
+
+    def get_organization(self, org_name):
+        self.calls.append((self.token, org_name))
+        return SimpleNamespace(get_team_by_slug=lambda team_name: SimpleNamespace(
+            get_repos=lambda: [
+                SimpleNamespace(full_name=name, archived=name in archived, private=name in private)
+                for name in teams[(org_name, team_name)]
+            ]
+        ))
+
+
+@pytest.fixture
+def fake_github(monkeypatch):
+    monkeypatch.setattr(github, "Github", FakeGithub)
+    monkeypatch.setattr(FakeGithub, "calls", [])
+    return FakeGithub
+
+
+def test_parse_teams():
+    assert parse_teams([" org-a/platform", {"org": "org-b", "team": "docs"}, "org-a/platform", ""]) == [
+        ("org-a", "platform"),
+        ("org-b", "docs"),
+    ]
+
+
+@pytest.mark.parametrize("entry", ["platform", "org-a/", {"org": "org-a"}])
+def test_parse_teams_rejects_incomplete_entries(entry):
+    with pytest.raises(ValueError):
+        parse_teams([entry])
+
+
+def test_shared_repos_are_listed_once_with_their_teams(fake_github):
+    pool = TokenPool([PooledToken("token-1")])
+    membership = resolve_teams(pool, [("org-a", "platform"), ("org-a", "sre"), ("org-b", "docs")])
+
+    assert membership == {
+        "org-a/api": ["org-a/platform", "org-a/sre"],
+        "org-a/infra": ["org-a/platform"],
+        "org-b/site": ["org-b/docs"],
+    }
+    # The token's budget is updated and it is released after each team
+    (token,) = pool.tokens
+    assert (token.remaining, token.limit, token.in_flight) == (4000, 5000, 0)
+
+
+def test_each_org_uses_its_own_token(fake_github):
+    pool = TokenPool([PooledToken("token-a", ["org-a/*"]), PooledToken("token-b", ["org-b/site"])])
+    resolve_teams(pool, [("org-a", "platform"), ("org-b", "docs")])
+    assert fake_github.calls == [("token-a", "org-a"), ("token-b", "org-b")]
+
+
+def test_org_without_a_token_is_an_error(fake_github):
+    pool = TokenPool([PooledToken("token-a", ["org-a/*"])])
+    with pytest.raises(ValueError, match="org-b"):
+        resolve_teams(pool, [("org-b", "docs")])
+    assert fake_github.calls == []
@@ -0,0 +1,140 @@
+"""
+TokenPool routing, failover and scoping, against a fake GitHub session
+"""
+import pytest
+
+from token_pool import PooledToken, RateLimitExhausted, TokenPool
+
+
+class FakeResponse:
+    def __init__(self, status_code=200, remaining=4000, reset=0, **headers):
+        self.status_code = status_code
+        self.headers = {"X-RateLimit-Remaining": str(remaining), "X-RateLimit-Reset": str(reset), **headers}
+
+
+class FakeSession:
+    """
+    Answers with the response queued for each token, recording which token each request used
+    """
+
+    def __init__(self, responses):
+        self.responses = responses
+        self.used = []
+
+    def get(self, url, headers=None, **kwargs):
+        token = headers["Authorization"].split()[-1]
+        self.used.append(token)
+        queued = self.responses.get(token, [])
+        return queued.pop(0) if queued else FakeResponse()
+
+
+class FakeClock:
+    def __init__(self, now=1_000.0):
+        self.now = now
+        self.slept = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.slept.append(seconds)
+        self.now += seconds
+
+
+def test_from_env_reads_scoped_tokens():
+    pool = TokenPool.from_env({"GITHUB_TOKENS": "aaaa, my-org/platform-*|my-org/sre=bbbb", "GITHUB_TOKEN": "cccc"})
+    assert [(t.token, t.repos) for t in pool.tokens] == [
+        ("aaaa", ("*",)),
+        ("bbbb", ("my-org/platform-*", "my-org/sre")),
+    ]
+    assert [t.token for t in TokenPool.from_env({"GITHUB_TOKEN": "cccc"}).tokens] == ["cccc"]
+    assert not TokenPool.from_env({})
+
+
+def test_requests_go_to_the_token_with_most_headroom():
+    clock = FakeClock()
+    pool = TokenPool([PooledToken("aaaa"), PooledToken("bbbb")], clock=clock, sleep=clock.sleep)
+    reset = clock() + 3600
+    session = FakeSession({
+        "aaaa": [FakeResponse(remaining=10, reset=reset)] * 3,
+        "bbbb": [FakeResponse(remaining=3000, reset=reset)] * 3,
+    })
+    for _ in range(4):
+        pool.get(session, "https://api.github.com/repos/org/a/traffic/views", "org/a")
+    # Both start at the default budget; once reported, the busier token is avoided
+    assert sorted(session.used[:2]) == ["aaaa", "bbbb"]
+    assert session.used[2:] == ["bbbb", "bbbb"]
+    assert pool.tokens[0].remaining == 10 and pool.tokens[1].remaining == 3000
+
+
+def test_rate_limited_token_fails_over():
+    clock = FakeClock()
+    pool = TokenPool([PooledToken("aaaa"), PooledToken("bbbb")], clock=clock, sleep=clock.sleep)
+    pool.tokens[1].remaining = 100
+    pool.tokens[1].reset = clock() + 3600
+    session = FakeSession({"aaaa": [FakeResponse(403, remaining=0, reset=clock() + 3600)]})
+
+    response = pool.get(session, "https://api.github.com/repos/org/a/traffic/views", "org/a")
+    assert response.status_code == 200
+    assert session.used == ["aaaa", "bbbb"]
+    assert pool.tokens[0].remaining == 0
+
+
+def test_refused_token_fails_over_to_one_with_access():
+    # With equal budgets the first token is tried first
+    pool = TokenPool([PooledToken("aaaa"), PooledToken("bbbb")])
+    session = FakeSession({"aaaa": [FakeResponse(403, remaining=4000)]})
+
+    assert pool.get(session, "https://api.github.com/repos/org/a/traffic/views", "org/a").status_code == 200
+    assert session.used == ["aaaa", "bbbb"]
+
+
+def test_refused_by_every_token_returns_the_last_response():
+    pool = TokenPool([PooledToken("aaaa"), PooledToken("bbbb")])
+    session = FakeSession({"aaaa": [FakeResponse(404)], "bbbb": [FakeResponse(404)]})
+
+    assert pool.get(session, "https://api.github.com/repos/org/a/traffic/views", "org/a").status_code == 404
+    assert sorted(session.used) == ["aaaa", "bbbb"]
+
+
+def test_secondary_rate_limit_backs_off_the_token():
+    clock = FakeClock()
+    pool = TokenPool([PooledToken("aaaa"), PooledToken("bbbb")], clock=clock, sleep=clock.sleep)
+    session = FakeSession({"aaaa": [FakeResponse(429, **{"Retry-After": "60"})]})
+
+    assert pool.get(session, "https://api.github.com/repos/org/a/traffic/views", "org/a").status_code == 200
+    assert pool.tokens[0].remaining == 0 and pool.tokens[0].reset == clock() + 60
+
+
+def test_exhausted_pool_waits_for_the_reset():
+    clock = FakeClock()
+    pool = TokenPool([PooledToken("aaaa")], max_wait=60, clock=clock, sleep=clock.sleep)
+    pool.update(pool.tokens[0], remaining=0, reset=clock() + 30)
+
+    token = pool.acquire("org/a")
+    assert token is pool.tokens[0]
+    assert clock.slept == [30]
+
+
+def test_exhausted_pool_gives_up_past_max_wait():
+    clock = FakeClock()
+    pool = TokenPool([PooledToken("aaaa")], max_wait=60, clock=clock, sleep=clock.sleep)
+    pool.update(pool.tokens[0], remaining=0, reset=clock() + 3600)
+
+    with pytest.raises(RateLimitExhausted):
+        pool.acquire("org/a")
+
+
+def test_scoped_tokens_only_serve_their_repos():
+    pool = TokenPool([PooledToken("aaaa", ["my-org/platform-*"]), PooledToken("bbbb", ["other/*"])])
+    assert pool.acquire("my-org/platform-api").token == "aaaa"
+    assert pool.acquire("other/docs").token == "bbbb"
+    with pytest.raises(ValueError):
+        pool.acquire("my-org/docs")
+
+
+def test_org_requests_use_tokens_scoped_to_the_org():
+    pool = TokenPool([PooledToken("aaaa", ["my-org/platform-*"])])
+    assert pool.acquire("my-org/").token == "aaaa"
+    with pytest.raises(ValueError):
+        pool.acquire("other/")
@@ -0,0 +1,197 @@
+"""
+Repo x day matrix analytics for GitHub traffic stats
+
+Loads every repo into one dense NumPy array of shape
+(repos, days, stat types, metrics), with stat types (views, clones) and
+metrics (count, uniques), so rolling averages, week-over-week growth, spike
+detection and percentiles are computed for the whole org in a single
+vectorised pass.
+"""
+import numpy as np
+
+stat_types = ("views", "clones")
+metrics = ("count", "uniques")
+
+
+class StatsMatrix:
+    """
+    Dense daily traffic matrix with the analytics computed over it
+    """
+
+    def __init__(self, repos, start_date, values):
+        self.repos = list(repos)
+        self.start_date = np.datetime64(start_date, "D")
+        self.values = values
+
+    @classmethod
+    def from_records(cls, records, repos=None, start=None, end=None):
+        """
+        Builds the matrix from storage records, optionally limited to a date range;
+        repos not listed up front are added in the order they appear
+        """
+        repo_index = {repo: i for i, repo in enumerate(repos or [])}
+        repo_ids, dates, slots, counts, uniques = [], [], [], [], []
+
+        for record in records:
+            date = record["date"]
+            if (start and date < start) or (end and date > end):
+                continue
+            index = repo_index.get(record["repo_name"])
+            if index is None:
+                index = repo_index[record["repo_name"]] = len(repo_index)
+            repo_ids.append(index)
+            dates.append(date)
+            slots.append(stat_types.index(record["stat_type"]))
+            counts.append(record["count"])
+            uniques.append(record["uniques"])
+
+        days = np.array(dates, dtype="datetime64[D]")
+        if start:
+            first = np.datetime64(start, "D")
+        elif len(days):
+            first = days.min()
+        else:
+            first = np.datetime64("today", "D")
+        if end:
+            last = np.datetime64(end, "D")
+        elif len(days):
+            last = days.max()
+        else:
+            last = first
+
+        values = np.zeros(
+            (len(repo_index), int((last - first).astype(int)) + 1, len(stat_types), len(metrics)),
+            dtype=np.int32,
+        )
+        if len(days):
+            day_ids = (days - first).astype(np.int64)
+            repo_ids = np.array(repo_ids, dtype=np.int64)
+            slots = np.array(slots, dtype=np.int64)
+            # add.at rather than assignment, so duplicate datapoints are summed
+            np.add.at(values, (repo_ids, day_ids, slots, 0), np.array(counts, dtype=np.int32))
+            np.add.at(values, (repo_ids, day_ids, slots, 1), np.array(uniques, dtype=np.int32))
+
+        ordered_repos = sorted(repo_index, key=repo_index.get)
+        return cls(ordered_repos, first, values)
+
+    @classmethod
+    def from_store(cls, store, repos=None, start=None, end=None):
+        """
+        Builds the matrix from a stats store
+        """
+        repos = list(repos) if repos is not None else store.list_repos()
+        records = (
+            record
+            for repo in repos
+            for stat_type in stat_types
+            for record in store.read_range(repo, stat_type, start, end)
+        )
+        return cls.from_records(records, repos=repos, start=start, end=end)
+
+    @property
+    def dates(self):
+        return self.start_date + np.arange(self.values.shape[1])
+
+    def totals(self):
+        """
+        Returns the (repos, stat types, metrics) sums over all days
+        """
+        return self.values.sum(axis=1, dtype=np.int64)
+
+    def trailing_sums(self, window):
+        """
+        Returns the sum of the window days up to and including each day
+        """
+        sums = np.cumsum(self.values, axis=1, dtype=np.int64)
+        sums[:, window:] -= sums[:, :-window].copy()
+        return sums
+
+    def rolling_mean(self, window=7):
+        """
+        Returns the trailing window-day average for every repo and day; the first
+        days of the matrix average over the days available
+        """
+        divisor = np.minimum(np.arange(1, self.values.shape[1] + 1), window).astype(np.float32)
+        means = self.trailing_sums(window).astype(np.float32)
+        means /= divisor[None, :, None, None]
+        return means
+
+    def week_over_week(self):
+        """
+        Returns the growth of the last 7 days over the 7 days before, as a fraction;
+        NaN where the previous week had no traffic
+        """
+        last_week = self.values[:, -7:].sum(axis=1, dtype=np.int64)
+        previous_week = self.values[:, -14:-7].sum(axis=1, dtype=np.int64)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            growth = (last_week - previous_week) / previous_week
+        growth[previous_week == 0] = np.nan
+        return growth
+
+    def spikes(self, metric="count", window=28, threshold=3.0, min_count=10, min_history=7,
+               last_days=None):
+        """
+        Returns a (repos, days, stat types) mask of days whose metric is more than
+        threshold standard deviations above the mean of the preceding window days;
+        with last_days, only the most recent days are evaluated (and returned)
+        """
+        values = self.values[..., metrics.index(metric)]
+        if last_days is not None:
+            values = values[:, -(last_days + window):]
+        values = values.astype(np.int64)
+        days = values.shape[1]
+
+        # Exact integer sums of x and x^2 over the (up to) window days before
+        # each day, from prefix sums: sum[d] = prefix[d] - prefix[d - window]
+        prefix = np.zeros((values.shape[0], days + 1) + values.shape[2:], dtype=np.int64)
+        np.cumsum(values, axis=1, out=prefix[:, 1:])
+        window_sum = prefix[:, :days].copy()
+        if days > window:
+            window_sum[:, window:] -= prefix[:, :days - window]
+
+        np.cumsum(values * values, axis=1, out=prefix[:, 1:])
+        window_sq = prefix[:, :days].copy()
+        if days > window:
+            window_sq[:, window:] -= prefix[:, :days - window]
+
+        # (x - mean) > threshold * max(std, 1), multiplied through by the history
+        # length n so it stays in integers: n*x - sum > threshold * max(sqrt(n*sq - sum^2), n)
+        history = np.minimum(np.arange(days), window)[None, :, None]
+        deviation = history * values - window_sum
+        spread = np.maximum(history * window_sq - window_sum * window_sum, history * history)
+        flagged = (
+            (history >= min_history)
+            & (values >= min_count)
+            & (deviation > 0)
+            & (deviation * deviation > threshold * threshold * spread)
+        )
+        if last_days is not None:
+            flagged = flagged[:, -last_days:]
+        return flagged
+
+    def percentiles(self, q=(50, 90, 99)):
+        """
+        Returns the (len(q), stat types, metrics) percentiles of the per-repo totals
+        """
+        if not self.repos:
+            return np.zeros((len(q), len(stat_types), len(metrics)))
+        return np.percentile(self.totals(), q, axis=0)
+
+    def summary(self, recent_days=14):
+        """
+        Returns a per-repo summary of last-week traffic, growth and recent spikes
+        """
+        last_week = self.values[:, -7:].sum(axis=1, dtype=np.int64)
+        growth = self.week_over_week()
+        spikes = self.spikes(last_days=recent_days)
+        recent_dates = self.dates[-recent_days:]
+
+        rows = []
+        for i, repo in enumerate(self.repos):
+            row = {"repo": repo}
+            for s, stat_type in enumerate(stat_types):
+                row[f"{stat_type}_7d"] = int(last_week[i, s, 0])
+                row[f"{stat_type}_wow"] = None if np.isnan(growth[i, s, 0]) else float(growth[i, s, 0])
+                row[f"{stat_type}_spikes"] = [str(d) for d in recent_dates[spikes[i, :, s]]]
+            rows.append(row)
+        return rows
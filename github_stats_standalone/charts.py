@@ -0,0 +1,156 @@
+"""
+Plotly figures shared by the Dash app and the static site export
+"""
+from datetime import datetime, timedelta
+
+import plotly.graph_objs as go
+
+
+# Bucket sizes in days, the finest one that fits the point budget is used
+resolutions = (("day", 1), ("week", 7), ("month", 31))
+# Plotly periods that centre each aggregated bar on its week or month
+bar_periods = {"week": 7 * 24 * 60 * 60 * 1000, "month": "M1"}
+
+
+def series_points(data, stat_type):
+    """
+    Returns the (timestamp, count, uniques) points of a series, skipping items without a valid timestamp
+    """
+    points = []
+    for item in data[stat_type]:
+        if "timestamp" in item:
+            try:
+                timestamp = datetime.strptime(item["timestamp"], "%Y-%m-%dT%H:%M:%SZ")
+                points.append((timestamp, item["count"], item["uniques"]))
+            except ValueError:
+                print(f"Invalid timestamp format for item: {item}")
+        else:
+            print(f"Timestamp key not found for item: {item}")
+    return points
+
+
+def visible_range(relayout):
+    """
+    Returns the x range of a chart's relayoutData, None when it was reset to the
+    full history, or False when the event didn't touch the x axis
+    """
+    relayout = relayout or {}
+    if relayout.get("xaxis.autorange"):
+        return None
+    if "xaxis.range[0]" in relayout and "xaxis.range[1]" in relayout:
+        bounds = [relayout["xaxis.range[0]"], relayout["xaxis.range[1]"]]
+    elif "xaxis.range" in relayout:
+        bounds = relayout["xaxis.range"]
+    else:
+        return False
+    # Plotly sends "YYYY-MM-DD HH:MM:SS.ffff", the seconds are plenty
+    return [datetime.fromisoformat(str(bound)[:19]) for bound in bounds]
+
+
+def choose_resolution(x_range, max_points):
+    """
+    Returns the finest resolution showing the range in at most max_points bars
+    """
+    days = (x_range[1] - x_range[0]).days + 1
+    if not max_points:
+        return "day"
+    for resolution, days_per_bucket in resolutions:
+        if days / days_per_bucket <= max_points:
+            return resolution
+    return resolutions[-1][0]
+
+
+def downsample(points, resolution):
+    """
+    Sums the daily points into weekly or monthly buckets, keyed by the bucket's first day
+    """
+    if resolution == "day":
+        return points
+    buckets = {}
+    for timestamp, count, uniques in points:
+        if resolution == "week":
+            start = timestamp - timedelta(days=timestamp.weekday())
+        else:
+            start = timestamp.replace(day=1)
+        totals = buckets.setdefault(start, [0, 0])
+        totals[0] += count
+        totals[1] += uniques
+    return [(start, count, uniques) for start, (count, uniques) in sorted(buckets.items())]
+
+
+def create_trace(name, color, timestamps, values, resolution, webgl):
+    if webgl:
+        # Dense series are drawn as WebGL step areas, which stay responsive with many points
+        return go.Scattergl(
+            x=timestamps,
+            y=values,
+            name=name,
+            mode="lines",
+            line=dict(color=f"rgba({color}, 1)", width=1, shape="hv"),
+            fill="tozeroy",
+            fillcolor=f"rgba({color}, 0.5)",
+        )
+
+    period = {}
+    if resolution in bar_periods and timestamps:
+        period = dict(xperiod=bar_periods[resolution], xperiod0=timestamps[0], xperiodalignment="middle")
+    return go.Bar(
+        x=timestamps,
+        y=values,
+        name=name,
+        marker_color=f"rgba({color}, 0.5)",
+        marker_line_color=f"rgba({color}, 1)",
+        marker_line_width=1,
+        **period,
+    )
+
+
+def create_figure(repo, stat_type, data, x_range=None, max_points=None, webgl_points=None):
+    """
+    Creates the bar chart figure for the given repo and stat type
+
+    With max_points, the visible range (the full history unless x_range is given)
+    is summed into weekly or monthly bars when its days don't fit, and only the
+    points around the visible range are included; traces with more than
+    webgl_points points are drawn with WebGL.
+    """
+    points = series_points(data, stat_type)
+
+    # Calculate dynamic x-axis range based on data
+    full_range = None
+    if points:
+        full_range = [points[0][0], points[0][0]]
+        for timestamp, _, _ in points:
+            full_range = [min(full_range[0], timestamp), max(full_range[1], timestamp)]
+        full_range = [full_range[0] - timedelta(days=1), full_range[1] + timedelta(days=1)]
+
+    resolution = "day"
+    if max_points and points:
+        visible = x_range or full_range
+        resolution = choose_resolution(visible, max_points)
+        if x_range:
+            # Keep one visible width either side, so a pan has data to show straight away
+            margin = visible[1] - visible[0]
+            points = [p for p in points if visible[0] - margin <= p[0] <= visible[1] + margin]
+        points = downsample(points, resolution)
+
+    timestamps = [timestamp for timestamp, _, _ in points]
+    counts = [count for _, count, _ in points]
+    uniques = [unique for _, _, unique in points]
+    webgl = bool(webgl_points) and len(points) > webgl_points
+
+    chart = create_trace("Total", "75, 192, 192", timestamps, counts, resolution, webgl)
+    unique_chart = create_trace("Unique", "255, 99, 132", timestamps, uniques, resolution, webgl)
+
+    title = f"{repo} - {stat_type}"
+    if resolution != "day":
+        title = f"{title} ({resolution}ly totals)"
+
+    layout = go.Layout(
+        title=title,
+        xaxis=dict(title="Date", type="date", range=x_range or full_range),
+        yaxis=dict(title="Count", rangemode="tozero"),
+        barmode="group",
+    )
+
+    return go.Figure(data=[chart, unique_chart], layout=layout)
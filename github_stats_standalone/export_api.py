@@ -0,0 +1,233 @@
+"""
+Read-only HTTP export API for the stored traffic stats
+
+Responses are streamed row by row as NDJSON or CSV, gzip-compressed when the
+client accepts it, and carry an ETag derived from the store's fingerprints so
+that repeated polls can be answered with a 304 without reading any data.
+"""
+import csv
+import hashlib
+import io
+import json
+import zlib
+from datetime import datetime
+
+from flask import Blueprint, Response, abort, request, stream_with_context
+
+from stats_storage import popular_types, stat_types
+
+export_formats = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+}
+series_fields = ["repo", "stat_type", "date", "timestamp", "count", "uniques"]
+aggregate_fields = ["repo", "stat_type", "start", "end", "days", "count", "uniques"]
+popular_fields = {
+    "referrers": ["repo", "date", "referrer", "count", "uniques"],
+    "paths": ["repo", "date", "path", "title", "count", "uniques"],
+}
+
+
+def create_export_blueprint(repos, store):
+    """
+    Creates the /api blueprint serving the repos listed in the repo YAML file
+    """
+    api = Blueprint("export_api", __name__, url_prefix="/api")
+    known_repos = set(repos)
+
+    @api.route("/repos")
+    def list_repos():
+        series = [(repo, stat_type) for repo in repos for stat_type in stat_types]
+        rows = ({"repo": repo} for repo in repos)
+        return export_response(rows, ["repo"], store, series)
+
+    @api.route("/stats/<owner>/<name>/<stat_type>")
+    def repo_series(owner, name, stat_type):
+        repo = f"{owner}/{name}"
+        if repo not in known_repos:
+            abort(404, description=f"Unknown repo: {repo}")
+        check_stat_type(stat_type)
+        start, end = parse_date_range()
+
+        rows = (
+            export_row(record)
+            for record in store.read_range(repo, stat_type, start, end)
+        )
+        return export_response(rows, series_fields, store, [(repo, stat_type)])
+
+    @api.route("/popular/<owner>/<name>/<kind>")
+    def repo_popular(owner, name, kind):
+        repo = f"{owner}/{name}"
+        if repo not in known_repos:
+            abort(404, description=f"Unknown repo: {repo}")
+        if kind not in popular_types:
+            abort(404, description=f"Unknown popular type: {kind}")
+
+        snapshot = store.read_popular(repo) or {}
+        rows = ({"repo": repo, "date": snapshot["date"], **item} for item in snapshot.get(kind, []))
+        # Snapshots have no fingerprint, so these responses carry no ETag
+        return export_response(rows, popular_fields[kind], store, None)
+
+    @api.route("/aggregates")
+    def aggregates():
+        requested = request.args.get("stat_type")
+        if requested:
+            check_stat_type(requested)
+        selected_types = [requested] if requested else list(stat_types)
+        start, end = parse_date_range()
+
+        series = [(repo, stat_type) for repo in repos for stat_type in selected_types]
+
+        def generate_rows():
+            # One series is read at a time, so memory stays flat across the org
+            for repo, stat_type in series:
+                row = {
+                    "repo": repo,
+                    "stat_type": stat_type,
+                    "start": None,
+                    "end": None,
+                    "days": 0,
+                    "count": 0,
+                    "uniques": 0,
+                }
+                for item in store.read_range(repo, stat_type, start, end):
+                    row["start"] = min(row["start"] or item["date"], item["date"])
+                    row["end"] = max(row["end"] or item["date"], item["date"])
+                    row["days"] += 1
+                    row["count"] += item["count"]
+                    row["uniques"] += item["uniques"]
+                yield row
+
+        return export_response(generate_rows(), aggregate_fields, store, series)
+
+    return api
+
+
+# Helper functions
+def export_row(record):
+    """
+    Maps a storage record onto the exported series fields
+    """
+    return {
+        "repo": record["repo_name"],
+        "stat_type": record["stat_type"],
+        "date": record["date"],
+        "timestamp": record["timestamp"],
+        "count": record["count"],
+        "uniques": record["uniques"],
+    }
+
+
+def check_stat_type(stat_type):
+    """
+    Aborts with a 404 for anything other than a known stat type
+    """
+    if stat_type not in stat_types:
+        abort(404, description=f"Unknown stat type: {stat_type}")
+
+
+def parse_date_range():
+    """
+    Parses the optional start and end (YYYY-MM-DD) query parameters
+    """
+    dates = []
+    for key in ("start", "end"):
+        value = request.args.get(key)
+        if value:
+            try:
+                datetime.strptime(value, "%Y-%m-%d")
+            except ValueError:
+                abort(400, description=f"Invalid {key} date, expected YYYY-MM-DD: {value}")
+        dates.append(value or None)
+    return tuple(dates)
+
+
+def store_etag(store, series, export_format):
+    """
+    Builds a weak ETag from the request and the store fingerprints of the series,
+    or returns None when the store cannot fingerprint them cheaply
+    """
+    if series is None:
+        return None
+    digest = hashlib.sha1(f"{request.full_path}|{export_format}".encode())
+    for repo, stat_type in series:
+        fingerprint = store.fingerprint(repo, stat_type)
+        if fingerprint is None:
+            return None
+        digest.update(f"{repo}:{stat_type}:{fingerprint};".encode())
+    return digest.hexdigest()
+
+
+def negotiate_format():
+    """
+    Picks the export format from the format parameter or the Accept header
+    """
+    export_format = request.args.get("format")
+    if export_format is None:
+        best = request.accept_mimetypes.best_match(
+            list(export_formats.values()), default=export_formats["ndjson"]
+        )
+        export_format = next(k for k, v in export_formats.items() if v == best)
+    if export_format not in export_formats:
+        abort(400, description=f"Unsupported format: {export_format}")
+    return export_format
+
+
+def encode_rows(rows, fields, export_format):
+    """
+    Serialises rows one at a time as NDJSON lines or CSV records
+    """
+    if export_format == "ndjson":
+        for row in rows:
+            yield json.dumps(row, separators=(",", ":")) + "\n"
+        return
+
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=fields, extrasaction="ignore")
+    writer.writeheader()
+    for row in rows:
+        writer.writerow(row)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue()
+
+
+def gzip_chunks(chunks):
+    """
+    Compresses a stream of text chunks into a single gzip member
+    """
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode())
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def export_response(rows, fields, store, series):
+    """
+    Streams the rows in the negotiated format, honouring If-None-Match and gzip
+    """
+    export_format = negotiate_format()
+    etag = store_etag(store, series, export_format)
+
+    if etag and request.if_none_match.contains_weak(etag):
+        response = Response(status=304)
+        response.set_etag(etag, weak=True)
+        return response
+
+    body = encode_rows(rows, fields, export_format)
+    headers = {"Vary": "Accept, Accept-Encoding", "Cache-Control": "no-cache"}
+    if "gzip" in request.accept_encodings:
+        body = gzip_chunks(body)
+        headers["Content-Encoding"] = "gzip"
+
+    response = Response(
+        stream_with_context(body),
+        mimetype=export_formats[export_format],
+        headers=headers,
+    )
+    if etag:
+        response.set_etag(etag, weak=True)
+    return response
@@ -1,132 +1,319 @@
 #!/usr/bin/env python3
 import argparse
-import json
+import functools
 import os
 import subprocess
 import sys
 import time
-import logging
-import webbrowser
-from datetime import datetime, timedelta
-
-import dash
-import dash_bootstrap_components as dbc
-import gunicorn.app.base
-import plotly.graph_objs as go
-import psutil
-import requests
+
 import yaml
-from dash import dcc, html
-from flask import Flask
-from github import Github
-from werkzeug.middleware.proxy_fix import ProxyFix
+
+from stats_storage import make_record, open_store, stat_types
+
+# dash, plotly, flask, gunicorn, PyGithub, requests and psutil are imported by
+# the functions that need them, so light commands such as --list and --shutdown
+# start quickly and run without GitHub credentials
 
 app_name = "GitHub Stats App"
 
-access_token = os.environ["GITHUB_TOKEN"]
-org_name = os.environ["GITHUB_ORG_NAME"]
-team_name = os.environ["GITHUB_TEAM_NAME"]
+# GitHub org and team, read when a command first talks to GitHub unless
+# github.teams in config.yaml or GITHUB_TEAMS list several; the tokens come
+# from github.tokens in config.yaml, GITHUB_TOKENS or GITHUB_TOKEN
+credential_variables = ("GITHUB_ORG_NAME", "GITHUB_TEAM_NAME")
 
-base_url = "https://api.github.com/repos/"
 base_dir = os.path.dirname(os.path.realpath(__file__))
-repo_yaml_file = f"{base_dir}/repo.yaml"
+repo_yaml_file = os.environ.get("GITHUB_STATS_REPO_FILE", f"{base_dir}/repo.yaml")
 log_dir = f"{base_dir}/logs"
 data_directory = "./traffic_stats"
+static_site_directory = "./static_site"
+stats_store = os.environ.get("GITHUB_STATS_STORE", f"file://{data_directory}")
+archive_store = os.environ.get("GITHUB_STATS_ARCHIVE")
+config_file = f"{base_dir}/config.yaml"
 pid_file = f"{log_dir}/app.pid"
+# Held by the running --update, so concurrent updates don't add the same stats twice
+update_lease_file = f"{log_dir}/update.lease"
+startup_timeout = 60
 access_log = f"{log_dir}/access.log"
 error_log = f"{log_dir}/error.log"
 
 directory_list = [log_dir, data_directory]
+
+# Flask server defaults, overridden by the server section of config.yaml
+default_server_options = {
+    "bind": "0.0.0.0:8050",
+    "workers": None,
+    "worker_class": "gthread",
+    "preload_app": True,
+    "loglevel": "info",
+    "timeout": 30,
+}
+# Seconds between checks of the store for new data in the running dashboard,
+# overridden by dashboard.reload_interval in config.yaml (0 disables live reload)
+default_reload_interval = 10
+# Threads per gthread worker; sync workers get one, as gunicorn quietly turns
+# any worker class into gthread when threads > 1
+default_threads = 4
+# Most bars per chart trace before the visible range is summed into weeks or
+# months, and the points above which traces are drawn with WebGL; overridden
+# by dashboard.chart_points and dashboard.webgl_points (0 disables either)
+default_chart_points = 400
+default_webgl_points = 1000
 debug = True
 
-# Create command-line argument parser and define arguments
-parser = argparse.ArgumentParser(
-    description=f"{app_name}",
-)
-
-action_group = parser.add_mutually_exclusive_group(required=False)
-action_group.add_argument(
-    "--create", "-c", action="store_true", help="Create a repo list YAML file"
-)
-action_group.add_argument(
-    "--run", "-r", action="store_true", help="Run Flask App and open browser"
-)
-action_group.add_argument(
-    "--update", "-u", action="store_true", help="Update repo list and stats"
-)
-action_group.add_argument(
-    "--shutdown", "-s", action="store_true", help="Shutdown Flask App"
-)
-action_group.add_argument("--list", "-l", action="store_true", help="List Repos")
-
-control_group = parser.add_argument_group("control options")
-control_group.add_argument(
-    "--daemon", "-d", action="store_true", help="Run as a daemon"
-)
-
-
-args = parser.parse_args()
-
-
-class StandaloneApplication(gunicorn.app.base.BaseApplication):
-    def __init__(self, app, options=None):
-        self.options = options or {}
-        self.application = app
-        super().__init__()
-
-    def load_config(self):
-        config = {
-            key: value
-            for key, value in self.options.items()
-            if key in self.cfg.settings and value is not None
-        }
-        for key, value in config.items():
-            self.cfg.set(key.lower(), value)
 
-    def load(self):
-        return self.application
+def parse_args(argv=None):
+    """
+    Parses the command line arguments
+    """
+    parser = argparse.ArgumentParser(
+        description=f"{app_name}",
+    )
+
+    action_group = parser.add_mutually_exclusive_group(required=False)
+    action_group.add_argument(
+        "--create", "-c", action="store_true", help="Create a repo list YAML file"
+    )
+    action_group.add_argument(
+        "--run", "-r", action="store_true", help="Run Flask App and open browser"
+    )
+    action_group.add_argument(
+        "--update", "-u", action="store_true", help="Update repo list and stats"
+    )
+    action_group.add_argument(
+        "--shutdown", "-s", action="store_true", help="Shutdown Flask App"
+    )
+    action_group.add_argument("--list", "-l", action="store_true", help="List Repos")
+    action_group.add_argument(
+        "--export-static",
+        "-e",
+        nargs="?",
+        const=static_site_directory,
+        metavar="DIR",
+        help=f"Export the dashboard as a static site (default: {static_site_directory})",
+    )
+
+    control_group = parser.add_argument_group("control options")
+    control_group.add_argument(
+        "--daemon", "-d", action="store_true", help="Run as a daemon"
+    )
+
+    return parser.parse_args(argv)
 
 
 def create_app(repos_config):
-    repos = parse_repo_config_file(repos_config)
+    import dash
+    import dash_bootstrap_components as dbc
+    from dash import ALL, MATCH, Input, Output, State, dcc, html, no_update
+    from dash.exceptions import PreventUpdate
+    from flask import Flask
+
+    from analytics import StatsMatrix
+    from charts import create_figure, visible_range
+    from export_api import create_export_blueprint
+    from live_reload import StoreWatcher
+
+    membership = load_repo_teams(repos_config)
+    repos = list(membership)
+    teams = sorted({team for repo_teams in membership.values() for team in repo_teams})
     flask_app = Flask(__name__)
     # dash_app = dash.Dash(__name__, external_stylesheets=[dbc.themes.BOOTSTRAP])
     dash_app = dash.Dash(__name__, server=flask_app, url_base_pathname="/")
 
-    dash_app.layout = html.Div(
-        [
-            html.H1(f"{app_name}", style={"textAlign": "center", "color": "#2986cc"}),
-            dbc.Container(
-                [
-                    html.Div(
-                        [
-                            create_chart(
-                                repo, "views", fetch_traffic_stats(repo, "views")
-                            )
-                        ]
-                    )
-                    for repo in repos
-                ]
-            ),
-            dbc.Container(
-                [
-                    html.Div(
-                        [
-                            create_chart(
-                                repo, "clones", fetch_traffic_stats(repo, "clones")
-                            )
-                        ]
-                    )
-                    for repo in repos
-                ]
-            ),
-        ]
+    # Read-only export API over the stored stats
+    flask_app.register_blueprint(create_export_blueprint(repos, get_store()))
+
+    # Readiness probe, only reachable once the layout has been built
+    @flask_app.route("/healthz")
+    def healthz():
+        return {"status": "ok", "app": app_name, "pid": os.getpid(), "repos": len(repos)}
+
+    keys = [(repo, stat_type) for stat_type in stat_types for repo in repos]
+    series = {}
+    charts = {}
+    state = {}
+
+    def reload_series(changed):
+        # Only the changed series are reloaded and their charts rebuilt; the
+        # trends need every repo, so the matrix is rebuilt from memory
+        for key in changed:
+            series[key] = load_traffic_stats(*key)
+            charts[key] = create_chart(*key, series[key])
+        state["matrix"] = StatsMatrix.from_records(series_records(series), repos=repos)
+
+    # Fingerprint the store before loading, so writes during startup are picked up
+    watcher = StoreWatcher(get_store(), keys, reload_series, poll_interval=get_reload_interval())
+
+    # Load every series once; the charts and the trends analytics share it
+    for key in keys:
+        series[key] = stored_traffic_stats(*key)
+        charts[key] = create_chart(*key, series[key])
+    state["matrix"] = StatsMatrix.from_records(series_records(series), repos=repos)
+
+    def repo_chart(repo, stat_type):
+        # Wrapped so the team filter can hide the repo's charts
+        return html.Div(
+            [charts[(repo, stat_type)]],
+            id={"type": "repo-chart", "repo": repo, "stat_type": stat_type},
+        )
+
+    def build_layout():
+        team_filter = []
+        if len(teams) > 1:
+            team_filter = [
+                dbc.Container(
+                    [dcc.Dropdown(id="team-filter", options=teams, placeholder="All teams", clearable=True)]
+                )
+            ]
+        live_reload = []
+        if watcher.enabled:
+            live_reload = [
+                dcc.Interval(id="live-reload", interval=int(watcher.poll_interval * 1000)),
+                dcc.Store(id="series-fingerprints", data=watcher.client_fingerprints()),
+            ]
+        return html.Div(
+            [
+                html.H1(f"{app_name}", style={"textAlign": "center", "color": "#2986cc"}),
+                *team_filter,
+                dbc.Container([create_trends_table(state["matrix"])], id="trends"),
+                dbc.Container(
+                    [repo_chart(repo, "views") for repo in repos]
+                ),
+                dbc.Container(
+                    [repo_chart(repo, "clones") for repo in repos]
+                ),
+                *live_reload,
+            ]
+        )
+
+    dash_app.layout = build_layout()
+
+    if watcher.enabled:
+        chart_ids = {"type": "traffic-chart", "repo": ALL, "stat_type": ALL}
+
+        @dash_app.callback(
+            Output(chart_ids, "figure"),
+            Output("trends", "children"),
+            Output("series-fingerprints", "data"),
+            Input("live-reload", "n_intervals"),
+            State("series-fingerprints", "data"),
+            State(chart_ids, "id"),
+            prevent_initial_call=True,
+        )
+        def reload_changed_charts(_, seen, ids):
+            # Send the browser only the figures whose series changed since it last looked
+            watcher.poll()
+            current = watcher.client_fingerprints()
+            if current == seen:
+                raise PreventUpdate
+            figures = [
+                charts[(i["repo"], i["stat_type"])].figure
+                if seen.get(f"{i['repo']}|{i['stat_type']}") != current.get(f"{i['repo']}|{i['stat_type']}")
+                else no_update
+                for i in ids
+            ]
+            return figures, [create_trends_table(state["matrix"])], current
+
+    if len(teams) > 1:
+        repo_chart_ids = {"type": "repo-chart", "repo": ALL, "stat_type": ALL}
+
+        @dash_app.callback(
+            Output(repo_chart_ids, "style"),
+            Input("team-filter", "value"),
+            State(repo_chart_ids, "id"),
+            prevent_initial_call=True,
+        )
+        def filter_by_team(team, ids):
+            # Team membership comes from the repo YAML file, so this needs no GitHub calls
+            return [
+                None if not team or team in membership[i["repo"]] else {"display": "none"}
+                for i in ids
+            ]
+
+    chart_id = {"type": "traffic-chart", "repo": MATCH, "stat_type": MATCH}
+
+    @dash_app.callback(
+        Output(chart_id, "figure", allow_duplicate=True),
+        Input(chart_id, "relayoutData"),
+        State(chart_id, "id"),
+        prevent_initial_call=True,
     )
+    def rescale_chart(relayout, chart):
+        # Re-render a zoomed or panned chart at the resolution its visible range
+        # needs, from the full series held server side
+        x_range = visible_range(relayout)
+        if x_range is False:
+            raise PreventUpdate
+        key = (chart["repo"], chart["stat_type"])
+        return create_figure(*key, series[key], x_range=x_range, **get_chart_options())
+
+    # Serialise the layout once, and again only after the watcher reloads data
+    cache_layout_response(flask_app, dash_app, build_layout, watcher)
 
     return flask_app, dash_app
 
 
 # Helper functions
+def github_credentials():
+    """
+    Returns the GitHub token pool and the (org, team) pairs to sweep, exiting if either is not set
+    """
+    tokens = get_token_pool()
+    teams = get_teams()
+    missing = [] if tokens else ["GITHUB_TOKEN"]
+    if not teams:
+        missing.extend(name for name in credential_variables if not os.environ.get(name))
+    if missing:
+        sys.exit(f"Missing environment variables: {', '.join(missing)}")
+    return tokens, teams
+
+
+def get_teams():
+    """
+    Returns the (org, team) pairs from github.teams in config.yaml, GITHUB_TEAMS,
+    or GITHUB_ORG_NAME and GITHUB_TEAM_NAME
+    """
+    from team_sweep import parse_teams
+
+    entries = (load_config().get("github") or {}).get("teams")
+    if not entries:
+        entries = (os.environ.get("GITHUB_TEAMS") or "").split(",")
+    teams = parse_teams(entries)
+    if not teams and all(os.environ.get(name) for name in credential_variables):
+        teams = [tuple(os.environ[name] for name in credential_variables)]
+    return teams
+
+
+@functools.lru_cache(maxsize=None)
+def get_token_pool():
+    """
+    Builds the GitHub token pool from github.tokens in config.yaml, or GITHUB_TOKENS / GITHUB_TOKEN
+    """
+    from token_pool import PooledToken, TokenPool
+
+    entries = (load_config().get("github") or {}).get("tokens")
+    if not entries:
+        return TokenPool.from_env(os.environ)
+
+    tokens = []
+    for entry in entries:
+        if isinstance(entry, str):
+            entry = {"token": entry}
+        # Entries can name an environment variable rather than hold the token
+        token = entry.get("token") or os.environ.get(entry.get("env", ""))
+        if token:
+            tokens.append(PooledToken(token, entry.get("repos") or ("*",)))
+    return TokenPool(tokens)
+
+
+@functools.lru_cache(maxsize=None)
+def get_store():
+    """
+    Opens the stats store configured by GITHUB_STATS_STORE (local JSON files by default),
+    reading through the GITHUB_STATS_ARCHIVE tier when one is set
+    """
+    return open_store(stats_store, archive=archive_store)
+
+
 def create_path_if_missing(path):
     """
     Creates any missing directories or files in the given path
@@ -146,25 +333,25 @@ def create_path_if_missing(path):
 # Functions to read and write to the repo_yaml_file
 def create_repo_list(repo_config):
     """
-    Creates a YAML file containing a list of all repos in the org
+    Creates a YAML file listing the repos of all the teams, with the teams each belongs to
     """
-    repos = get_all_repos()
+    membership = get_all_repos()
     repo_dict = {}
 
-    for repo in repos:
+    for repo, teams in membership.items():
         key, value = repo.split("/")
         if key not in repo_dict:
-            repo_dict[key] = []
-        repo_dict[key].append(value)
+            repo_dict[key] = {}
+        repo_dict[key][value] = sorted(teams)
 
-    repo_dict_sorted = {k: sorted(v) for k, v in repo_dict.items()}
-    yaml_doc = yaml.dump(repo_dict_sorted, sort_keys=True)
+    # owner: {repo: [org/team, ...]}, with the team lists inline
+    yaml_doc = yaml.dump(repo_dict, sort_keys=True, default_flow_style=None)
 
     with open(repo_config, "w") as f:
         f.write("---\n")
         f.write(yaml_doc)
 
-    print(f"Created {repo_config}")
+    print(f"Created {repo_config} with {len(membership)} repos")
 
     return yaml_doc
 
@@ -173,109 +360,138 @@ def parse_repo_config_file(repo_config_file):
     """
     Read and parse the repo_yaml_file
     """
+    return list(load_repo_teams(repo_config_file))
+
+
+def load_repo_teams(repo_config_file):
+    """
+    Reads the repo_yaml_file into {repo: [org/team, ...]}; plain lists of repos have no teams
+    """
     with open(repo_config_file) as file:
         repos_yaml = yaml.safe_load(file)
 
-    parsed_repo_list = []
-    for key in repos_yaml.keys():
-        for repo in repos_yaml[key]:
-            parsed_repo_list.append(f"{key}/{repo}")
+    membership = {}
+    for key, repos in repos_yaml.items():
+        entries = repos.items() if isinstance(repos, dict) else ((repo, []) for repo in repos)
+        for repo, teams in entries:
+            membership[f"{key}/{repo}"] = list(teams or [])
 
-    return parsed_repo_list
+    return membership
 
 
-# Function to get all repos in a team
+# Function to get all repos of the teams
 def get_all_repos():
     """
-    Fetches a list of all repos in the org
+    Fetches the repos of all the configured teams, each once, with the teams it belongs to
     """
-    repo_list = []
-
-    g = Github(access_token)
-    org = g.get_organization(org_name)
-    team = org.get_team_by_slug(team_name)
-    repos = team.get_repos()
-
-    for repo in repos:
-        if repo.archived or repo.private:
-            continue
-        repo_list.append(repo.full_name)
+    from team_sweep import resolve_teams
 
-    return repo_list
+    tokens, teams = github_credentials()
+    return resolve_teams(tokens, teams)
 
 
 def list_github_repos(repo_config_file):
     """
     Prints a list of all repos in the repo_yaml_file
     """
-    repos = parse_repo_config_file(repo_config_file)
-    for repo in repos:
-        print(repo)
+    for repo, teams in load_repo_teams(repo_config_file).items():
+        print(f"{repo}  ({', '.join(teams)})" if teams else repo)
 
 
 # Function to fetch traffic stats from GitHub API
-def fetch_traffic_stats(repo, stat_type):
+def fetch_traffic_records(repo, stat_type):
     """
-    Fetch stats for the stat type from the repo's GitHub API endpoint
-    """
-    url = f"{base_url}{repo}/traffic/{stat_type}"
-    headers = {"Authorization": f"token {access_token}"}
-
-    data_file_path = os.path.join(data_directory, f"{repo}_{stat_type}.json")
-    create_path_if_missing(data_file_path)
-
-    if os.path.exists(data_file_path) and os.path.getsize(data_file_path) > 0:
-        with open(data_file_path, "r") as f:
-            loaded_data = json.load(f)
-            data = {
-                stat_type: {
-                    item["timestamp"]: {
-                        "count": item["count"],
-                        "uniques": item["uniques"],
-                    }
-                    for item in loaded_data[stat_type]
-                }
-            }
-    else:
-        data = {}
+    Fetch stats for the stat type from the repo's GitHub API endpoint as storage records
+    """
+    import requests
+
+    from repo_traffic import fetch_endpoint
+    from token_pool import RateLimitExhausted
+
+    tokens = github_credentials()[0]
 
     try:
-        response = requests.get(url, headers=headers)
-        response.raise_for_status()
-        new_data = response.json()
-
-        if stat_type not in data:
-            data[stat_type] = {
-                item["timestamp"]: {"count": item["count"], "uniques": item["uniques"]}
-                for item in new_data[stat_type]
+        new_data = fetch_endpoint(repo, f"traffic/{stat_type}", tokens, requests)
+    except (requests.exceptions.RequestException, RateLimitExhausted, ValueError) as e:
+        print(f"Error fetching {stat_type} data for {repo}: {e}")
+        return None
+
+    return [make_record(repo, stat_type, item) for item in new_data[stat_type]]
+
+
+def load_traffic_stats(repo, stat_type):
+    """
+    Reads the stored stats for the repo and stat type
+    """
+    return {
+        stat_type: [
+            {"timestamp": r["timestamp"], "count": r["count"], "uniques": r["uniques"]}
+            for r in get_store().read_range(repo, stat_type)
+        ]
+    }
+
+
+def fetch_traffic_stats(repo, stat_type):
+    """
+    Fetch the latest stats, add them to the stored stats and return the result
+    """
+    records = fetch_traffic_records(repo, stat_type)
+    if records:
+        get_store().upsert_many(records, accumulate=True)
+
+    return load_traffic_stats(repo, stat_type)
+
+
+def cache_layout_response(flask_app, dash_app, build_layout, watcher):
+    """
+    Replaces Dash's layout view with one serving the layout JSON serialised up front,
+    rebuilt only when the watcher has reloaded changed series
+    """
+    import threading
+
+    from flask import Response
+    from plotly.io.json import to_json_plotly
+
+    cache = {"version": watcher.version, "json": to_json_plotly(dash_app.layout).encode()}
+    lock = threading.Lock()
+
+    def layout_response():
+        watcher.poll()
+        with lock:
+            if cache["version"] != watcher.version:
+                dash_app.layout = build_layout()
+                cache["json"] = to_json_plotly(dash_app.layout).encode()
+                cache["version"] = watcher.version
+        return Response(cache["json"], mimetype="application/json")
+
+    for rule in flask_app.url_map.iter_rules():
+        if rule.rule.endswith("/_dash-layout"):
+            flask_app.view_functions[rule.endpoint] = layout_response
+
+
+def series_records(series):
+    """
+    Converts loaded chart data back into storage records for the analytics matrix
+    """
+    for (repo, stat_type), data in series.items():
+        for item in data[stat_type]:
+            yield {
+                "repo_name": repo,
+                "stat_type": stat_type,
+                "date": item["timestamp"][:10],
+                "count": item["count"],
+                "uniques": item["uniques"],
             }
-        else:
-            for item in new_data[stat_type]:
-                timestamp = item["timestamp"]
-                if timestamp not in data[stat_type]:
-                    data[stat_type][timestamp] = {
-                        "count": item["count"],
-                        "uniques": item["uniques"],
-                    }
-                else:
-                    data[stat_type][timestamp]["count"] += item["count"]
-                    data[stat_type][timestamp]["uniques"] += item["uniques"]
-
-        # Convert the dictionary back to the original list structure before saving to the JSON file
-        output_data = {
-            stat_type: [
-                {"timestamp": k, "count": v["count"], "uniques": v["uniques"]}
-                for k, v in data[stat_type].items()
-            ]
-        }
 
-        with open(data_file_path, "w") as f:
-            json.dump(output_data, f)
 
-        return output_data
-    except requests.exceptions.RequestException as e:
-        print(f"Error fetching {stat_type} data for {repo}: {e}")
-        return data
+def stored_traffic_stats(repo, stat_type):
+    """
+    Returns the stored stats, only fetching from GitHub when nothing is stored yet
+    """
+    data = load_traffic_stats(repo, stat_type)
+    if not data[stat_type]:
+        data = fetch_traffic_stats(repo, stat_type)
+    return data
 
 
 # Dash functions
@@ -283,50 +499,64 @@ def create_chart(repo, stat_type, data):
     """
     Dash function to create a chart for the given repo and stat type
     """
-    timestamps = []
-    for item in data[stat_type]:
-        if "timestamp" in item:
-            try:
-                timestamp = datetime.strptime(item["timestamp"], "%Y-%m-%dT%H:%M:%SZ")
-                timestamps.append(timestamp)
-            except ValueError:
-                print(f"Invalid timestamp format for item: {item}")
-        else:
-            print(f"Timestamp key not found for item: {item}")
-            continue
-
-    counts = [item["count"] for item in data[stat_type]]
-    uniques = [item["uniques"] for item in data[stat_type]]
-
-    chart = go.Bar(
-        x=timestamps,
-        y=counts,
-        name="Total",
-        marker_color="rgba(75, 192, 192, 0.5)",
-        marker_line_color="rgba(75, 192, 192, 1)",
-        marker_line_width=1,
-    )
+    from dash import dcc
 
-    unique_chart = go.Bar(
-        x=timestamps,
-        y=uniques,
-        name="Unique",
-        marker_color="rgba(255, 99, 132, 0.5)",
-        marker_line_color="rgba(255, 99, 132, 1)",
-        marker_line_width=1,
+    from charts import create_figure
+
+    return dcc.Graph(
+        id={"type": "traffic-chart", "repo": repo, "stat_type": stat_type},
+        figure=create_figure(repo, stat_type, data, **get_chart_options()),
     )
 
-    # Calculate dynamic x-axis range based on data
-    x_range = [min(timestamps) - timedelta(days=1), max(timestamps) + timedelta(days=1)]
 
-    layout = go.Layout(
-        title=f"{repo} - {stat_type}",
-        xaxis=dict(title="Date", type="date", range=x_range),
-        yaxis=dict(title="Count", rangemode="tozero"),
-        barmode="group",
+def create_trends_table(matrix):
+    """
+    Dash function to create the last-week trends table, busiest repos first
+    """
+    from dash import html
+
+    def growth(value):
+        return "n/a" if value is None else f"{value:+.0%}"
+
+    rows = sorted(matrix.summary(), key=lambda row: row["views_7d"], reverse=True)
+    percentiles = matrix.percentiles()
+
+    header = html.Tr(
+        [
+            html.Th(title)
+            for title in ["Repo", "Views (7d)", "Views WoW", "Clones (7d)", "Clones WoW", "Recent spikes"]
+        ]
     )
+    body = [
+        html.Tr(
+            [
+                html.Td(row["repo"]),
+                html.Td(row["views_7d"]),
+                html.Td(growth(row["views_wow"])),
+                html.Td(row["clones_7d"]),
+                html.Td(growth(row["clones_wow"])),
+                html.Td(
+                    ", ".join(
+                        f"{date} ({stat_type})"
+                        for stat_type in stat_types
+                        for date in row[f"{stat_type}_spikes"]
+                    )
+                ),
+            ]
+        )
+        for row in rows
+    ]
 
-    return dcc.Graph(figure={"data": [chart, unique_chart], "layout": layout})
+    return html.Div(
+        [
+            html.H3("Trends"),
+            html.P(
+                "Total views per repo, p50 / p90 / p99: "
+                + " / ".join(str(int(value)) for value in percentiles[:, 0, 0])
+            ),
+            html.Table([html.Thead(header), html.Tbody(body)], className="table table-sm"),
+        ]
+    )
 
 
 # Function to get the latest data for all repos
@@ -334,13 +564,142 @@ def update_stats(repo_config_file):
     """
     Fetches the latest traffic stats for all repos in the repo_yaml_file
     """
-    create_repo_list(repo_config_file)
+    import requests
+
+    from repo_traffic import fetch_repo_traffic
+    from run_lease import FileLease
+
+    def update():
+        create_repo_list(repo_config_file)
+        repos = parse_repo_config_file(repo_config_file)
+        tokens = github_credentials()[0]
+        session = requests.Session()
+
+        # One merged record per repo with all its traffic endpoints
+        traffic = []
+        for repo in repos:
+            print(f"Fetching data for {repo}...")
+            traffic.append(fetch_repo_traffic(repo, tokens, session, popular=get_fetch_popular()))
+
+        # Write all repos in a single batch, adding to any existing counts
+        get_store().upsert_traffic(traffic, accumulate=True)
+        records = sum(len(repo.get(stat_type) or []) for repo in traffic for stat_type in stat_types)
+        return {"repos": len(repos), "records": records}
+
+    # An update started while another is running waits for it and reports its result
+    check_dirs([log_dir])
+    stats = FileLease("update", update_lease_file).run(update)
+    print(f"Updated {stats['records']} datapoints of {stats['repos']} repos")
+
+
+def export_static(repo_config_file, output_dir):
+    """
+    Exports the dashboard for all repos in the repo_yaml_file as a static site
+    """
+    from static_export import export_static_site
+
     repos = parse_repo_config_file(repo_config_file)
+    updated = export_static_site(app_name, repos, get_store(), output_dir)
+    print(f"Exported {len(updated)} of {len(repos)} repo pages to {output_dir}")
+
 
-    for repo in repos:
-        print(f"Fetching data for {repo}...")
-        fetch_traffic_stats(repo, "views")
-        fetch_traffic_stats(repo, "clones")
+@functools.lru_cache(maxsize=None)
+def load_config():
+    """
+    Reads the optional config.yaml next to this script
+    """
+    if not os.path.exists(config_file):
+        return {}
+    with open(config_file) as f:
+        return yaml.safe_load(f) or {}
+
+
+def get_reload_interval():
+    """
+    Returns the live reload interval from the dashboard section of config.yaml
+    """
+    dashboard = load_config().get("dashboard") or {}
+    return dashboard.get("reload_interval", default_reload_interval)
+
+
+def get_fetch_popular():
+    """
+    Returns whether --update also fetches the popular referrers and paths, github.popular in config.yaml
+    """
+    return bool((load_config().get("github") or {}).get("popular", False))
+
+
+def get_chart_options():
+    """
+    Returns the chart downsampling options from the dashboard section of config.yaml
+    """
+    dashboard = load_config().get("dashboard") or {}
+    return {
+        "max_points": dashboard.get("chart_points", default_chart_points),
+        "webgl_points": dashboard.get("webgl_points", default_webgl_points),
+    }
+
+
+def available_cpus():
+    """
+    Returns the number of CPUs this process may run on
+    """
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        import psutil
+
+        return psutil.cpu_count() or 1
+
+
+def get_server_options(overrides=None):
+    """
+    Builds the gunicorn options from the defaults, the server section of config.yaml and any overrides
+    """
+    options = dict(default_server_options)
+    options.update(load_config().get("server") or {})
+    options.update(overrides or {})
+
+    # Threaded workers share one process per CPU, sync workers need the usual 2n + 1
+    if options["worker_class"] == "gthread":
+        options["threads"] = options.get("threads") or default_threads
+    else:
+        options["threads"] = 1
+    if not options.get("workers"):
+        cpus = available_cpus()
+        options["workers"] = cpus if options["worker_class"] == "gthread" else 2 * cpus + 1
+
+    options.update(
+        {
+            "accesslog": access_log,
+            "errorlog": error_log,
+            "pidfile": pid_file,
+        }
+    )
+    return options
+
+
+def local_app_url():
+    """
+    Returns the local URL the app listens on, from the configured bind address
+    """
+    port = str(get_server_options()["bind"]).rpartition(":")[2] or "8050"
+    return f"http://127.0.0.1:{port}/"
+
+
+def build_app():
+    """
+    Builds the WSGI app served by gunicorn
+    """
+    import logging
+
+    from werkzeug.middleware.proxy_fix import ProxyFix
+
+    flask_app, dash_app = create_app(repo_yaml_file)
+    log_handler = logging.StreamHandler()
+    log_handler.setLevel(logging.INFO)
+    flask_app.logger.addHandler(log_handler)
+    return ProxyFix(flask_app, x_proto=1, x_host=1)
 
 
 def run_dash_app():
@@ -355,22 +714,9 @@ def run_dash_app():
         create_repo_list(repo_yaml_file)
         print(f"Repo YAML file created: {repo_yaml_file}")
 
-    flask_app, dash_app = create_app(repo_yaml_file)
-    log_handler = logging.StreamHandler()
-    log_handler.setLevel(logging.INFO)
-    flask_app.logger.addHandler(log_handler)
-    flask_app = ProxyFix(flask_app, x_proto=1, x_host=1)
-
-    # Flask server options
-    server_options = {
-        "bind": "0.0.0.0:8050",
-        "workers": 2,
-        "log-level": "debug",
-        "accesslog": access_log,
-        "errorlog": error_log,
-        "pidfile": pid_file,
-    }
-    StandaloneApplication(flask_app, server_options).run()
+    from server import StandaloneApplication
+
+    StandaloneApplication(build_app, get_server_options()).run()
 
 
 # Check if process is running
@@ -378,20 +724,65 @@ def is_process_running(pid):
     """
     Checks if a process is running
     """
+    import psutil
+
     try:
         process = psutil.Process(pid)
-        if process.status() == psutil.STATUS_RUNNING:
+        # An idle gunicorn master is sleeping rather than running
+        if process.status() != psutil.STATUS_ZOMBIE:
             return True
     except psutil.NoSuchProcess:
         pass
     return False
 
 
+def read_pid_file():
+    """
+    Returns the gunicorn master PID from the pidfile, or None if there isn't one
+    """
+    try:
+        with open(pid_file, "r") as f:
+            return int(f.read().strip())
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def is_app_ready():
+    """
+    Checks whether the GitHub Stats App answers its readiness probe
+    """
+    import requests
+
+    try:
+        response = requests.get(f"{local_app_url()}healthz", timeout=0.5)
+        return response.ok and response.json().get("app") == app_name
+    except (requests.exceptions.RequestException, ValueError):
+        return False
+
+
+def wait_until_ready(proc, timeout):
+    """
+    Polls the readiness probe until the app answers, the process exits or the timeout expires
+    """
+    deadline = time.monotonic() + timeout
+    delay = 0.05
+    while time.monotonic() < deadline:
+        if is_app_ready():
+            return True
+        if proc.poll() is not None:
+            return False
+        time.sleep(delay)
+        delay = min(delay * 2, 0.5)
+    return False
+
+
 # Kill process
 def kill_process(pid):
     """
     Kills a process by PID
     """
+    import psutil
+
     try:
         process = psutil.Process(pid)
         process.terminate()
@@ -416,29 +807,40 @@ def run_and_display(shutdown):
     """
     check_dirs(directory_list)
 
+    # gunicorn writes the master PID to pid_file itself
+    pid = read_pid_file()
+
     # Shuts down the Dash app if it's already running
     if shutdown:
+        if pid is None or not is_process_running(pid):
+            print("Dash app is not running")
+            return
         print("Shutting down Dash app...")
-        with open(pid_file, "r") as f:
-            pid = int(f.read())
         kill_process(pid)
         return
 
-    # Start the Dash app as a background process
-    print("Starting GitHub Stats App...")
-    cmd = ["python3", "github_stats.py", "--daemon"]
-    proc = subprocess.Popen(cmd)
-
-    # Wait for the app to start
-    time.sleep(10)
+    # Reuse an app that is already up instead of starting a second one
+    if pid is not None and is_process_running(pid) and is_app_ready():
+        print(f"GitHub Stats App is already running (PID {pid})")
+    else:
+        # Start the Dash app as a background process
+        print("Starting GitHub Stats App...")
+        start_time = time.monotonic()
+        cmd = [sys.executable, os.path.realpath(__file__), "--daemon"]
+        proc = subprocess.Popen(cmd)
+
+        # Wait for the app to answer its readiness probe
+        if not wait_until_ready(proc, startup_timeout):
+            print(f"GitHub Stats App did not become ready, see {error_log}")
+            kill_process(proc.pid)
+            sys.exit(1)
+        print(f"GitHub Stats App ready in {time.monotonic() - start_time:.2f}s")
 
     # Open the app in a web browser
-    print("Opening Dash app in web browser...")
-    webbrowser.open_new("http://127.0.0.1:8050/")
+    import webbrowser
 
-    # Write process PID to file
-    with open(pid_file, "w") as f:
-        f.write(str(proc.pid))
+    print("Opening Dash app in web browser...")
+    webbrowser.open_new(local_app_url())
 
 
 def display_usage():
@@ -450,6 +852,7 @@ def display_usage():
     print("  -r, --run\t\t\tRun the Dash app")
     print("  -s, --shutdown\t\t\tShutdown the Dash app")
     print("  -c, --create\t\t\tCreate the repo YAML file")
+    print("  -e, --export-static [DIR]\tExport the dashboard as a static site")
     sys.exit(1)
 
 
@@ -457,6 +860,7 @@ if __name__ == "__main__":
     """
     Main function, parse command line arguments and run the appropriate function
     """
+    args = parse_args()
     if args.list:
         list_github_repos(repo_yaml_file)
     elif args.update:
@@ -467,6 +871,8 @@ if __name__ == "__main__":
         run_and_display(shutdown=True)
     elif args.create:
         create_repo_list(repo_yaml_file)
+    elif args.export_static:
+        export_static(repo_yaml_file, args.export_static)
     elif args.daemon:
         run_dash_app()
     else:
@@ -0,0 +1,62 @@
+"""
+Live reload of the dashboard data
+
+Polls the store's fingerprint of every (repo, stat type) series, the mtime and
+size of its file for the JSON store, and hands only the series that changed
+to a callback, so a running dashboard picks up new data from --update without
+a restart or a full rebuild. Polling is driven by requests and rate limited,
+so each gunicorn worker keeps itself current without a background thread.
+"""
+import threading
+import time
+
+
+class StoreWatcher:
+    """
+    Detects changed series by comparing store fingerprints at most once per poll interval
+    """
+
+    def __init__(self, store, keys, on_change, poll_interval=10.0, clock=time.monotonic):
+        self.store = store
+        self.on_change = on_change
+        self.poll_interval = poll_interval
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.version = 0
+        self.checked = clock()
+        self.fingerprints = {key: store.fingerprint(*key) for key in keys}
+        # Stores that can't fingerprint a series cheaply (DynamoDB) can't be watched
+        self.enabled = bool(poll_interval) and None not in self.fingerprints.values()
+
+    def poll(self):
+        """
+        Reloads the series whose fingerprint changed since the last poll through
+        on_change, returning the changed keys
+        """
+        if not self.enabled or self.clock() - self.checked < self.poll_interval:
+            return []
+
+        with self.lock:
+            # Another thread may have polled while this one waited for the lock
+            if self.clock() - self.checked < self.poll_interval:
+                return []
+            self.checked = self.clock()
+
+            changed = {}
+            for key, fingerprint in self.fingerprints.items():
+                current = self.store.fingerprint(*key)
+                if current != fingerprint:
+                    changed[key] = current
+            if changed:
+                # Fingerprints are taken before reloading, so a write racing
+                # the reload is picked up again by the next poll
+                self.fingerprints.update(changed)
+                self.on_change(list(changed))
+                self.version += 1
+            return list(changed)
+
+    def client_fingerprints(self):
+        """
+        Returns the fingerprints keyed by "repo|stat_type", for the browser to echo back
+        """
+        return {f"{repo}|{stat_type}": fingerprint for (repo, stat_type), fingerprint in self.fingerprints.items()}
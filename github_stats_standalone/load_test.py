@@ -0,0 +1,426 @@
+#!/usr/bin/env python3
+"""
+Load test for the dashboard
+
+Starts the app under gunicorn on a free local port (or targets a running one
+with --url) and replays browser traffic from a number of virtual users: each
+loads the page, its assets (on a share of the page loads, the rest as if from
+the browser cache), the layout and callback graph, then zooms charts through
+_dash-update-component and polls for live reloads. Reports requests/s, p50/p95/p99 latency per request kind and
+the RSS of every gunicorn worker, and can save the report as JSON and compare
+it with an earlier one, e.g. across releases or server configurations:
+
+    python3 load_test.py --users 20 --duration 30 --output before.json
+    python3 load_test.py --users 20 --duration 30 --workers 4 --compare before.json
+
+The virtual users are threads of this process, so for a server with many
+workers the client may saturate first; compare runs from the same machine.
+"""
+import argparse
+import json
+import os
+import random
+import re
+import socket
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime, timedelta
+
+base_dir = os.path.dirname(os.path.realpath(__file__))
+startup_timeout = 120
+asset_pattern = re.compile(r'(?:src|href)="(/[^"]+)"')
+percentiles = (50, 95, 99)
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def serve(overrides, options):
+    """
+    Runs the app under gunicorn with the configured server options, the overrides and the given options
+    """
+    sys.path.insert(0, base_dir)
+    import github_stats
+    from server import StandaloneApplication
+
+    server_options = github_stats.get_server_options(overrides)
+    server_options.update(options)
+    StandaloneApplication(github_stats.build_app, server_options).run()
+
+
+def start_server(args):
+    """
+    Starts the app in a child process and returns the process, its URL and its server options once it answers
+    """
+    import multiprocessing
+
+    import requests
+
+    sys.path.insert(0, base_dir)
+    import github_stats
+
+    # Worker settings go through get_server_options, so e.g. sync workers get one thread
+    overrides = {
+        option: getattr(args, option)
+        for option in ("workers", "threads", "worker_class")
+        if getattr(args, option) is not None
+    }
+    options = {
+        "bind": f"127.0.0.1:{free_port()}",
+        # Keep clear of a running app's pidfile and logs, which need ./logs, and
+        # leave access logging out of the measurements; errors go to stderr
+        "pidfile": None,
+        "accesslog": None,
+        "errorlog": "-",
+        "loglevel": "warning",
+    }
+
+    process = multiprocessing.Process(target=serve, args=(overrides, options), daemon=True)
+    process.start()
+    url = f"http://{options['bind']}/"
+    deadline = time.monotonic() + startup_timeout
+    while time.monotonic() < deadline:
+        if not process.is_alive():
+            sys.exit(f"The app exited with code {process.exitcode} before it answered, see its errors above")
+        try:
+            if requests.get(f"{url}healthz", timeout=0.5).ok:
+                return process, url, {**github_stats.get_server_options(overrides), **options}
+        except requests.exceptions.RequestException:
+            pass
+        time.sleep(0.2)
+    process.terminate()
+    sys.exit(f"The app did not start within {startup_timeout}s")
+
+
+def components(node, found):
+    """
+    Collects the props of every component in a serialised Dash layout
+    """
+    if isinstance(node, dict):
+        if "props" in node and "type" in node:
+            found.append(node["props"])
+        for value in node.values():
+            components(value, found)
+    elif isinstance(node, list):
+        for value in node:
+            components(value, found)
+    return found
+
+
+class Recorder:
+    """
+    Collects request latencies by request kind, from all virtual users
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = {}
+        self.errors = {}
+        self.recording = False
+
+    def record(self, kind, seconds, ok):
+        if not self.recording:
+            return
+        with self.lock:
+            self.latencies.setdefault(kind, []).append(seconds * 1000)
+            if not ok:
+                self.errors[kind] = self.errors.get(kind, 0) + 1
+
+
+class VirtualUser:
+    """
+    Replays one browser's dashboard traffic in a loop until stopped
+    """
+
+    def __init__(self, url, recorder, interactions, think_time, cold_share, stop):
+        import requests
+
+        self.url = url
+        self.recorder = recorder
+        self.interactions = interactions
+        self.think_time = think_time
+        self.cold_share = cold_share
+        self.stop = stop
+        self.session = requests.Session()
+        self.assets_loaded = False
+
+    def request(self, kind, method, path, **kwargs):
+        import requests
+
+        start = time.perf_counter()
+        try:
+            response = self.session.request(method, f"{self.url}{path.lstrip('/')}", timeout=30, **kwargs)
+            # Dash answers 204 when a callback has nothing to update
+            ok = response.status_code in (200, 204)
+        except requests.exceptions.RequestException:
+            response, ok = None, False
+        self.recorder.record(kind, time.perf_counter() - start, ok)
+        return response if ok else None
+
+    def load_page(self):
+        index = self.request("index", "GET", "/")
+        if index is not None and (not self.assets_loaded or random.random() < self.cold_share):
+            for asset in dict.fromkeys(asset_pattern.findall(index.text)):
+                self.request("asset", "GET", asset)
+            self.assets_loaded = True
+        layout = self.request("layout", "GET", "/_dash-layout")
+        dependencies = self.request("dependencies", "GET", "/_dash-dependencies")
+        if layout is None or dependencies is None:
+            return None, None
+        return components(layout.json(), []), dependencies.json()
+
+    def zoom(self, dependency, chart):
+        # A random window of the chart's x range, or a double click back to the full range
+        x_range = chart["figure"]["layout"]["xaxis"].get("range")
+        relayout = {"xaxis.autorange": True}
+        if x_range and random.random() < 0.8:
+            start, end = (datetime.fromisoformat(str(bound)[:19]) for bound in x_range)
+            width = timedelta(days=random.randint(14, max((end - start).days, 14)))
+            window_start = start + (end - start - width) * random.random()
+            relayout = {
+                "xaxis.range[0]": window_start.isoformat(sep=" "),
+                "xaxis.range[1]": (window_start + width).isoformat(sep=" "),
+            }
+        chart_id = chart["id"]
+        changed = json.dumps(chart_id, separators=(",", ":"), sort_keys=True)
+        self.request("callback:zoom", "POST", "/_dash-update-component", json={
+            "output": dependency["output"],
+            "outputs": {"id": chart_id, "property": "figure"},
+            "inputs": [{"id": chart_id, "property": "relayoutData", "value": relayout}],
+            "state": [{"id": chart_id, "property": "id", "value": chart_id}],
+            "changedPropIds": [f"{changed}.relayoutData"],
+        })
+
+    def poll_reload(self, dependency, charts, fingerprints, n_intervals):
+        chart_ids = [chart["id"] for chart in charts]
+        self.request("callback:reload", "POST", "/_dash-update-component", json={
+            "output": dependency["output"],
+            "outputs": [
+                [{"id": chart_id, "property": "figure"} for chart_id in chart_ids],
+                {"id": "trends", "property": "children"},
+                {"id": "series-fingerprints", "property": "data"},
+            ],
+            "inputs": [{"id": "live-reload", "property": "n_intervals", "value": n_intervals}],
+            "state": [
+                {"id": "series-fingerprints", "property": "data", "value": fingerprints},
+                [{"id": chart_id, "property": "id", "value": chart_id} for chart_id in chart_ids],
+            ],
+            "changedPropIds": ["live-reload.n_intervals"],
+        })
+
+    def run(self):
+        while not self.stop.is_set():
+            props, dependencies = self.load_page()
+            if props is None:
+                continue
+            charts = [p for p in props if isinstance(p.get("id"), dict) and "figure" in p]
+            fingerprints = next((p["data"] for p in props if p.get("id") == "series-fingerprints"), None)
+            callbacks = {
+                i["property"]: d for d in dependencies for i in d["inputs"]
+                if i["property"] in ("relayoutData", "n_intervals")
+            }
+
+            for n in range(self.interactions):
+                if self.stop.wait(self.think_time):
+                    return
+                if charts and "relayoutData" in callbacks:
+                    self.zoom(callbacks["relayoutData"], random.choice(charts))
+                if fingerprints is not None and "n_intervals" in callbacks:
+                    self.poll_reload(callbacks["n_intervals"], charts, fingerprints, n + 1)
+
+
+def sample_rss(pid, peaks, stop, interval=0.5):
+    """
+    Tracks the peak and last RSS of the gunicorn master and each of its workers
+    """
+    import psutil
+
+    try:
+        master = psutil.Process(pid)
+    except psutil.NoSuchProcess:
+        return
+    while True:
+        try:
+            processes = [master, *master.children(recursive=True)]
+        except psutil.NoSuchProcess:
+            return
+        for process in processes:
+            try:
+                rss = process.memory_info().rss / 2 ** 20
+            except psutil.NoSuchProcess:
+                continue
+            peak = peaks.setdefault(process.pid, {"role": "master" if process is master else "worker"})
+            peak["peak_rss_mb"] = max(peak.get("peak_rss_mb", 0), rss)
+            peak["rss_mb"] = rss
+        if stop.wait(interval):
+            return
+
+
+def gunicorn_pid(process):
+    """
+    Returns the gunicorn master PID: the started child, or the running app's from its pidfile
+    """
+    if process is not None:
+        return process.pid
+    sys.path.insert(0, base_dir)
+    import github_stats
+
+    return github_stats.read_pid_file()
+
+
+def summarise(latencies, errors):
+    # statistics.quantiles needs two samples; one sample is its own percentile
+    cuts = statistics.quantiles(latencies, n=100, method="inclusive") if len(latencies) > 1 else latencies * 99
+    summary = {"requests": len(latencies), "errors": errors, "mean_ms": statistics.fmean(latencies)}
+    summary.update({f"p{p}_ms": cuts[p - 1] for p in percentiles})
+    return summary
+
+
+def build_report(args, url, server_options, recorder, elapsed, workers):
+    import dash
+    import plotly
+
+    kinds = {
+        kind: summarise(latencies, recorder.errors.get(kind, 0))
+        for kind, latencies in sorted(recorder.latencies.items())
+    }
+    all_latencies = [latency for latencies in recorder.latencies.values() for latency in latencies]
+    total = summarise(all_latencies, sum(recorder.errors.values())) if all_latencies else {"requests": 0}
+    total["requests_per_second"] = total["requests"] / elapsed
+
+    try:
+        release = subprocess.run(
+            ["git", "describe", "--always", "--dirty"], cwd=base_dir, capture_output=True, text=True
+        ).stdout.strip()
+    except OSError:
+        release = ""
+
+    return {
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "release": release,
+        "versions": {"python": sys.version.split()[0], "dash": dash.__version__, "plotly": plotly.__version__},
+        "url": url,
+        "server": {k: v for k, v in server_options.items() if k in ("workers", "threads", "worker_class")},
+        "users": args.users,
+        "duration": elapsed,
+        "think_time": args.think,
+        "cold_share": args.cold,
+        "total": total,
+        "requests": kinds,
+        "workers": [{"pid": pid, **sample} for pid, sample in sorted(workers.items())],
+    }
+
+
+def print_report(report, baseline=None):
+    def change(new, old):
+        if not old:
+            return ""
+        return f" ({(new - old) / old:+.0%})"
+
+    old_total = (baseline or {}).get("total", {})
+    old_kinds = (baseline or {}).get("requests", {})
+    total = report["total"]
+    print(
+        f"{report['users']} users for {report['duration']:.0f}s against {report['url']} "
+        f"({', '.join(f'{k}={v}' for k, v in report['server'].items())})"
+    )
+    print(
+        f"{total['requests']} requests, {total.get('errors', 0)} errors, "
+        f"{total['requests_per_second']:.1f} req/s"
+        f"{change(total['requests_per_second'], old_total.get('requests_per_second'))}"
+    )
+    print()
+    print(f"{'Request':<18}{'Count':>8}{'Errors':>8}" + "".join(f"{f'p{p}':>18}" for p in percentiles))
+    for name, kind in [*report["requests"].items(), ("total", total)]:
+        if not kind["requests"]:
+            continue
+        old = old_kinds.get(name, {}) if name != "total" else old_total
+        cells = "".join(
+            f"{kind[f'p{p}_ms']:>9.1f}ms{change(kind[f'p{p}_ms'], old.get(f'p{p}_ms')):<7}" for p in percentiles
+        )
+        print(f"{name:<18}{kind['requests']:>8}{kind['errors']:>8}{cells}")
+
+    if report["workers"]:
+        print()
+        print(f"{'Process':<18}{'Peak RSS':>12}{'RSS':>12}")
+        for worker in report["workers"]:
+            print(f"{worker['role']} {worker['pid']:<{17 - len(worker['role'])}}"
+                  f"{worker['peak_rss_mb']:>10.1f}MB{worker['rss_mb']:>10.1f}MB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the dashboard with virtual users")
+    parser.add_argument("--users", "-u", type=int, default=10, help="Concurrent virtual users (default: 10)")
+    parser.add_argument("--duration", "-d", type=float, default=30, help="Seconds to measure (default: 30)")
+    parser.add_argument("--warmup", type=float, default=3, help="Seconds of unmeasured load first (default: 3)")
+    parser.add_argument("--interactions", "-i", type=int, default=5,
+                        help="Chart zooms and reload polls per page load (default: 5)")
+    parser.add_argument("--think", type=float, default=0.0,
+                        help="Seconds a user pauses between interactions (default: 0)")
+    parser.add_argument("--cold", type=float, default=0.25,
+                        help="Share of page loads that fetch the assets, as from an empty cache (default: 0.25)")
+    parser.add_argument("--url", help="Test an already running app instead of starting one")
+    parser.add_argument("--workers", type=int, help="gunicorn workers of the started app")
+    parser.add_argument("--threads", type=int, help="Threads per gthread worker of the started app")
+    parser.add_argument("--worker-class", choices=("gthread", "sync"), help="gunicorn worker class of the started app")
+    parser.add_argument("--output", "-o", help="Save the report as JSON")
+    parser.add_argument("--compare", "-c", help="Show the changes from an earlier JSON report")
+    args = parser.parse_args()
+
+    process, server_options = None, {}
+    if args.url:
+        url = args.url.rstrip("/") + "/"
+    else:
+        process, url, server_options = start_server(args)
+
+    recorder = Recorder()
+    stop = threading.Event()
+    users = [VirtualUser(url, recorder, args.interactions, args.think, args.cold, stop) for _ in range(args.users)]
+    threads = [threading.Thread(target=user.run, daemon=True) for user in users]
+
+    workers = {}
+    sampler_stop = threading.Event()
+    pid = gunicorn_pid(process)
+    sampler = threading.Thread(target=sample_rss, args=(pid, workers, sampler_stop), daemon=True)
+    if pid:
+        sampler.start()
+
+    try:
+        for thread in threads:
+            thread.start()
+        time.sleep(args.warmup)
+        recorder.recording = True
+        start = time.perf_counter()
+        time.sleep(args.duration)
+        recorder.recording = False
+        elapsed = time.perf_counter() - start
+    finally:
+        stop.set()
+        for thread in threads:
+            thread.join()
+        sampler_stop.set()
+        if sampler.is_alive():
+            sampler.join()
+        if process is not None:
+            process.terminate()
+            process.join()
+
+    report = build_report(args, url, server_options, recorder, elapsed, workers)
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    print_report(report, baseline)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+"""
+Per-repo fetch of the GitHub traffic endpoints
+
+Each repo is one unit of work: its daily views and clones, and optionally its
+popular referrers and paths, are fetched back to back through the token pool
+and merged into one traffic record:
+
+    {"repo_name": "org/repo", "views": [...], "clones": [...],
+     "popular": {"date": "2023-04-14", "referrers": [...], "paths": [...]}}
+
+which StatsStore.upsert_traffic writes in one batch, so another endpoint
+costs a request per repo but no extra reads or writes of the store.
+"""
+import logging
+from datetime import datetime, timezone
+
+from stats_storage import popular_types, stat_types
+
+logger = logging.getLogger("GitHubStats")
+
+base_url = "https://api.github.com/repos/"
+
+
+def fetch_endpoint(repo, path, tokens, session):
+    """
+    Returns the decoded JSON of one of the repo's API endpoints
+    """
+    response = tokens.get(session, f"{base_url}{repo}/{path}", repo)
+    response.raise_for_status()
+    return response.json()
+
+
+def fetch_repo_traffic(repo, tokens, session, popular=False):
+    """
+    Fetches the repo's traffic endpoints into one merged record; an endpoint that
+    fails is logged and left out, so the others are still written
+    """
+    import requests
+
+    from token_pool import RateLimitExhausted
+
+    errors = (requests.exceptions.RequestException, RateLimitExhausted, ValueError, KeyError)
+    traffic = {"repo_name": repo}
+    for stat_type in stat_types:
+        try:
+            traffic[stat_type] = fetch_endpoint(repo, f"traffic/{stat_type}", tokens, session)[stat_type]
+        except errors as e:
+            logger.warning(f"Error fetching {stat_type} data for {repo}: {e}")
+
+    if popular:
+        # GitHub's top 10s over the last 14 days, kept only if both arrive
+        snapshot = {"date": datetime.now(timezone.utc).strftime("%Y-%m-%d")}
+        try:
+            for kind in popular_types:
+                snapshot[kind] = fetch_endpoint(repo, f"traffic/popular/{kind}", tokens, session)
+            traffic["popular"] = snapshot
+        except errors as e:
+            logger.warning(f"Error fetching popular {kind} for {repo}: {e}")
+
+    return traffic
@@ -0,0 +1,271 @@
+"""
+Single-flight leases for stats ingestion runs
+
+A run first takes a lease: one record, written only if no live run holds it,
+naming the run, its owner and an expiry the running process keeps pushing out
+with heartbeats. An overrunning hourly Lambda run and the next trigger, or
+two --update processes, can then never ingest at the same time and add the
+same datapoints twice. A caller that finds a run in flight waits for it and
+returns its result instead of repeating the work; if the holder dies, its
+heartbeats stop and the lease is taken over once it expires.
+
+DynamoDBLease keeps the record in a DynamoDB table behind conditional writes,
+FileLease in a local JSON file updated under an exclusive file lock.
+"""
+import json
+import logging
+import math
+import os
+import socket
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+logger = logging.getLogger("GitHubStats")
+
+
+class LeaseHeld(Exception):
+    """
+    Raised when another run still holds the lease after the caller waited as long as it may
+    """
+
+
+class RunLease:
+    """
+    Runs work at most once at a time, sharing the result of the run in flight with late callers
+
+    Subclasses store the lease record and implement its two conditional writes.
+    """
+
+    def __init__(self, name, ttl=60.0, poll_interval=2.0, clock=time.time, sleep=time.sleep):
+        self.name = name
+        self.ttl = ttl
+        self.poll_interval = poll_interval
+        self.clock = clock
+        self.sleep = sleep
+        self.owner = f"{socket.gethostname()}:{os.getpid()}"
+
+    def load(self):
+        """
+        Returns the lease record, or None if there is none
+        """
+        raise NotImplementedError
+
+    def put_if_free(self, record, now):
+        """
+        Writes the record if no run holds a live lease, returning whether it did
+        """
+        raise NotImplementedError
+
+    def put_if_owner(self, record):
+        """
+        Writes the record if the lease still belongs to its run, returning whether it did
+        """
+        raise NotImplementedError
+
+    @staticmethod
+    def is_free(current, now):
+        return current is None or current.get("state") != "running" or float(current["expires_at"]) < now
+
+    def record(self, run_id, state, **fields):
+        return {
+            "lease": self.name,
+            "run_id": run_id,
+            "owner": self.owner,
+            "state": state,
+            "expires_at": math.ceil(self.clock() + self.ttl),
+            **fields,
+        }
+
+    def heartbeat(self, run_id, started_at, stop):
+        # Push the expiry out a few times per TTL, so a live run never loses the lease
+        while not stop.wait(self.ttl / 3):
+            if not self.put_if_owner(self.record(run_id, "running", started_at=started_at)):
+                logger.warning(f"Lease {self.name} was taken over while run {run_id} was still going")
+                return
+
+    def wait_for(self, current, deadline):
+        """
+        Waits for the run in flight, returning (True, result) once it finishes and
+        (False, None) when the lease becomes free without a result
+        """
+        run_id = current["run_id"]
+        logger.info(f"Lease {self.name} is held by {current.get('owner')}, waiting for run {run_id}")
+        while True:
+            if deadline is not None and self.clock() >= deadline:
+                raise LeaseHeld(f"Lease {self.name} is still held by {current.get('owner')}")
+            self.sleep(self.poll_interval)
+            current = self.load()
+            if current is None or current["run_id"] != run_id:
+                return False, None
+            if current["state"] == "done":
+                return True, json.loads(current["result"])
+            if current["state"] != "running" or float(current["expires_at"]) < self.clock():
+                # The run failed or its holder died, so the work still needs doing
+                return False, None
+
+    def run(self, work, timeout=None):
+        """
+        Runs work under the lease and returns its (JSON serialisable) result, or
+        waits up to timeout seconds for the run in flight and returns that run's result
+        """
+        deadline = None if timeout is None else self.clock() + timeout
+        while True:
+            run_id = uuid.uuid4().hex
+            started_at = int(self.clock())
+            if self.put_if_free(self.record(run_id, "running", started_at=started_at), self.clock()):
+                break
+            current = self.load()
+            if current is None:
+                continue
+            finished, result = self.wait_for(current, deadline)
+            if finished:
+                logger.info(f"Reusing the result of run {current['run_id']} of {self.name}")
+                return result
+
+        stop = threading.Event()
+        beat = threading.Thread(target=self.heartbeat, args=(run_id, started_at, stop), daemon=True)
+        beat.start()
+        try:
+            result = work()
+        except BaseException:
+            stop.set()
+            beat.join()
+            self.put_if_owner(self.record(run_id, "failed", started_at=started_at, finished_at=int(self.clock())))
+            raise
+        stop.set()
+        beat.join()
+        finished = self.record(
+            run_id, "done", started_at=started_at, finished_at=int(self.clock()), result=json.dumps(result)
+        )
+        if not self.put_if_owner(finished):
+            logger.warning(f"Run {run_id} of {self.name} finished after losing its lease")
+        return result
+
+
+class FileLease(RunLease):
+    """
+    Keeps the lease record in a local JSON file, updated under an exclusive lock of a sidecar file
+    """
+
+    def __init__(self, name, path, **kwargs):
+        super().__init__(name, **kwargs)
+        self.path = path
+
+    @contextmanager
+    def locked(self):
+        import fcntl
+
+        with open(f"{self.path}.lock", "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def load(self):
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def save(self, record):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(record, f)
+        os.replace(tmp_path, self.path)
+
+    def put_if_free(self, record, now):
+        with self.locked():
+            if not self.is_free(self.load(), now):
+                return False
+            self.save(record)
+            return True
+
+    def put_if_owner(self, record):
+        with self.locked():
+            current = self.load()
+            if current is None or current["run_id"] != record["run_id"]:
+                return False
+            self.save(record)
+            return True
+
+
+class DynamoDBLease(RunLease):
+    """
+    Keeps the lease record as an item of a DynamoDB table, written with conditional puts
+    """
+
+    # Expired leases are deleted by DynamoDB's TTL
+    ttl_attribute = "expires_at"
+
+    def __init__(self, name, table_name, region_name=None, **kwargs):
+        from boto3 import resource
+
+        super().__init__(name, **kwargs)
+        self.table_name = table_name
+        self.dynamodb_resource = resource("dynamodb", region_name=region_name)
+        self.table = self.dynamodb_resource.Table(table_name)
+
+    def create_table_if_not_exists(self):
+        """
+        Creates the lease table on first use
+        """
+        from botocore.exceptions import ClientError
+
+        try:
+            self.table.load()
+            return self.table
+        except ClientError as e:
+            if e.response["Error"]["Code"] != "ResourceNotFoundException":
+                raise
+
+        try:
+            self.table = self.dynamodb_resource.create_table(
+                TableName=self.table_name,
+                KeySchema=[{"AttributeName": "lease", "KeyType": "HASH"}],
+                AttributeDefinitions=[{"AttributeName": "lease", "AttributeType": "S"}],
+                BillingMode="PAY_PER_REQUEST",
+            )
+            self.table.wait_until_exists()
+            self.dynamodb_resource.meta.client.update_time_to_live(
+                TableName=self.table_name,
+                TimeToLiveSpecification={"Enabled": True, "AttributeName": self.ttl_attribute},
+            )
+        except ClientError as e:
+            if e.response["Error"]["Code"] != "ResourceInUseException":
+                raise
+            self.table = self.dynamodb_resource.Table(self.table_name)
+        return self.table
+
+    def load(self):
+        # Strongly consistent, a waiter must see the result as soon as it is written
+        return self.table.get_item(Key={"lease": self.name}, ConsistentRead=True).get("Item")
+
+    def put(self, record, **condition):
+        from botocore.exceptions import ClientError
+
+        try:
+            self.table.put_item(Item=record, **condition)
+            return True
+        except ClientError as e:
+            if e.response["Error"]["Code"] != "ConditionalCheckFailedException":
+                raise
+            return False
+
+    def put_if_free(self, record, now):
+        return self.put(
+            record,
+            ConditionExpression="attribute_not_exists(lease) OR #state <> :running OR expires_at < :now",
+            ExpressionAttributeNames={"#state": "state"},
+            ExpressionAttributeValues={":running": "running", ":now": int(now)},
+        )
+
+    def put_if_owner(self, record):
+        return self.put(
+            record,
+            ConditionExpression="run_id = :run_id",
+            ExpressionAttributeValues={":run_id": record["run_id"]},
+        )
@@ -0,0 +1,37 @@
+"""
+gunicorn application serving the Dash app
+
+Kept apart from github_stats.py so the gunicorn import is only paid by the
+commands that start the server.
+"""
+import gc
+
+import gunicorn.app.base
+
+
+class StandaloneApplication(gunicorn.app.base.BaseApplication):
+    def __init__(self, app_factory, options=None):
+        self.options = options or {}
+        self.app_factory = app_factory
+        self.application = None
+        super().__init__()
+
+    def load_config(self):
+        config = {
+            key: value
+            for key, value in self.options.items()
+            if key in self.cfg.settings and value is not None
+        }
+        for key, value in config.items():
+            self.cfg.set(key.lower(), value)
+
+    def load(self):
+        # With preload_app this runs once in the master, before the workers fork
+        if self.application is None:
+            self.application = self.app_factory()
+            if self.cfg.preload_app:
+                # Keep the loaded objects out of later GC passes so the pages
+                # shared with the workers aren't dirtied by collections
+                gc.collect()
+                gc.freeze()
+        return self.application
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+Startup benchmark for the command line tools
+
+Runs each lightweight command several times in a fresh interpreter, without
+GitHub credentials, and reports the median wall time together with the total
+import time and heaviest imports from python -X importtime, so that a module
+pulling dash or matplotlib back into a light command shows up straight away.
+"""
+import argparse
+import os
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+base_dir = os.path.dirname(os.path.realpath(__file__))
+graph_data_dir = os.path.join(os.path.dirname(base_dir), "github_stats_lambda", "graph_data")
+
+# Name, script, arguments and extra environment of each command; they run in
+# a scratch directory, so the dbdata.py mirror is not left in the source tree,
+# and --list reads a small repo list written there rather than the user's own.
+# --shutdown is left out as it would stop a running app
+repo_yaml = "---\nmy-org:\n  api: [my-org/platform]\n  docs: [my-org/docs]\n"
+commands = [
+    ("github_stats.py --help", base_dir, "github_stats.py", ["--help"], {}),
+    ("github_stats.py --list", base_dir, "github_stats.py", ["--list"], {"GITHUB_STATS_REPO_FILE": "repo.yaml"}),
+    ("dbdata.py --help", graph_data_dir, "dbdata.py", ["--help"], {}),
+    ("dbdata.py --list", graph_data_dir, "dbdata.py", ["--list"], {"GITHUB_STATS_STORE": "memory://"}),
+]
+credential_variables = ("GITHUB_TOKEN", "GITHUB_TOKENS", "GITHUB_ORG_NAME", "GITHUB_TEAM_NAME")
+import_line = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+
+
+def command_env(extra_env):
+    env = {k: v for k, v in os.environ.items() if k not in credential_variables}
+    env.update(extra_env)
+    return env
+
+
+def time_command(cwd, argv, env, runs):
+    """
+    Returns the wall times of runs executions, or None if the command fails
+    """
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        result = subprocess.run(
+            [sys.executable, *argv], cwd=cwd, env=env,
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+        times.append(time.perf_counter() - start)
+        if result.returncode != 0:
+            return None
+    return times
+
+
+def import_profile(cwd, argv, env, top):
+    """
+    Returns the total import time and the slowest top-level imports of one run
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", *argv], cwd=cwd, env=env,
+        stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True,
+    )
+    total = 0
+    top_level = []
+    for line in result.stderr.splitlines():
+        match = import_line.match(line)
+        if not match:
+            continue
+        self_us, cumulative_us, indent, module = match.groups()
+        total += int(self_us)
+        if len(indent) == 1:
+            top_level.append((int(cumulative_us), module))
+    heaviest = sorted(top_level, reverse=True)[:top]
+    return total / 1000, [(module, us / 1000) for us, module in heaviest]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure the startup time of the command line tools")
+    parser.add_argument("--runs", "-n", type=int, default=5, help="Runs per command (default: 5)")
+    parser.add_argument("--top", "-t", type=int, default=3, help="Heaviest imports to show (default: 3)")
+    parser.add_argument(
+        "--budget", "-b", type=float, metavar="MS",
+        help="Exit with an error if any command's median exceeds this many milliseconds",
+    )
+    args = parser.parse_args()
+
+    over_budget = False
+    print(f"{'Command':<26}{'Median':>10}{'Imports':>10}  Heaviest imports")
+    scratch_dir = tempfile.TemporaryDirectory()
+    cwd = scratch_dir.name
+    with open(os.path.join(cwd, "repo.yaml"), "w") as f:
+        f.write(repo_yaml)
+    for name, script_dir, script, script_args, extra_env in commands:
+        argv = [os.path.join(script_dir, script), *script_args]
+        env = command_env(extra_env)
+        times = time_command(cwd, argv, env, args.runs)
+        if times is None:
+            print(f"{name:<26}{'failed':>10}")
+            over_budget = True
+            continue
+
+        median_ms = statistics.median(times) * 1000
+        import_ms, heaviest = import_profile(cwd, argv, env, args.top)
+        heaviest = ", ".join(f"{module} {ms:.0f}ms" for module, ms in heaviest)
+        print(f"{name:<26}{median_ms:>8.0f}ms{import_ms:>8.0f}ms  {heaviest}")
+        if args.budget is not None and median_ms > args.budget:
+            over_budget = True
+
+    scratch_dir.cleanup()
+    sys.exit(1 if over_budget else 0)
+
+
+if __name__ == "__main__":
+    main()
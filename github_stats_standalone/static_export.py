@@ -0,0 +1,202 @@
+"""
+Static snapshot export of the dashboard
+
+Renders an index page plus one page per repo (views and clones charts) that
+share a single copy of plotly.js, so the site can be served from any static
+file host. A manifest of per-repo fingerprints makes re-exports incremental:
+only the pages of repos whose stored data changed are rewritten.
+"""
+import hashlib
+import html
+import json
+import os
+
+import plotly
+import plotly.io as pio
+from plotly.offline import get_plotlyjs
+
+from charts import create_figure
+from stats_storage import stat_types
+
+manifest_file = "manifest.json"
+plotly_asset = "assets/plotly.min.js"
+
+page_template = """<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>{title}</title>
+{scripts}
+<style>
+body {{ font-family: sans-serif; margin: 2em auto; max-width: 1140px; }}
+h1 {{ text-align: center; color: #2986cc; }}
+table {{ border-collapse: collapse; width: 100%; }}
+td, th {{ border-bottom: 1px solid #ddd; padding: 4px 8px; text-align: left; }}
+</style>
+</head>
+<body>
+{body}
+</body>
+</html>
+"""
+
+
+def export_static_site(app_name, repos, store, output_dir):
+    """
+    Exports the dashboard for the repos to output_dir, returning the repos whose pages were rewritten
+    """
+    manifest = load_manifest(output_dir)
+    previous_repos = manifest.get("repos", {})
+    plotly_changed = manifest.get("plotly_version") != plotly.__version__
+
+    # Shared plotly.js, only rewritten when the plotly version changes
+    asset_path = os.path.join(output_dir, plotly_asset)
+    if plotly_changed or not os.path.exists(asset_path):
+        write_file(asset_path, get_plotlyjs())
+
+    updated = []
+    current_repos = {}
+    for repo in repos:
+        fingerprint, data = repo_fingerprint(store, repo)
+        entry = previous_repos.get(repo)
+        page_path = os.path.join(output_dir, repo_page(repo))
+
+        if entry and entry["fingerprint"] == fingerprint and not plotly_changed \
+                and os.path.exists(page_path):
+            current_repos[repo] = entry
+            continue
+
+        if data is None:
+            data = load_repo_data(store, repo)
+        write_file(page_path, render_repo_page(app_name, repo, data))
+        current_repos[repo] = {
+            "fingerprint": fingerprint,
+            "totals": {
+                stat_type: sum(item["count"] for item in data[stat_type])
+                for stat_type in stat_types
+            },
+        }
+        updated.append(repo)
+
+    # Drop pages of repos that are no longer in the repo list
+    for repo in set(previous_repos) - set(current_repos):
+        page_path = os.path.join(output_dir, repo_page(repo))
+        if os.path.exists(page_path):
+            os.remove(page_path)
+
+    if updated or set(previous_repos) != set(current_repos):
+        write_file(
+            os.path.join(output_dir, "index.html"),
+            render_index_page(app_name, current_repos),
+        )
+
+    manifest = {"plotly_version": plotly.__version__, "repos": current_repos}
+    write_file(os.path.join(output_dir, manifest_file), json.dumps(manifest, indent=2))
+
+    return updated
+
+
+# Helper functions
+def repo_page(repo):
+    """
+    Returns the site-relative path of the repo's page
+    """
+    return f"repos/{repo}.html"
+
+
+def load_manifest(output_dir):
+    """
+    Reads the manifest of a previous export, if any
+    """
+    try:
+        with open(os.path.join(output_dir, manifest_file), "r") as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def load_repo_data(store, repo):
+    """
+    Reads both stat types for the repo in the chart data format
+    """
+    return {
+        stat_type: [
+            {"timestamp": r["timestamp"], "count": r["count"], "uniques": r["uniques"]}
+            for r in store.read_range(repo, stat_type)
+        ]
+        for stat_type in stat_types
+    }
+
+
+def repo_fingerprint(store, repo):
+    """
+    Returns (fingerprint, data) for the repo; data is only loaded when the store
+    cannot fingerprint the repo without reading it
+    """
+    fingerprints = [store.fingerprint(repo, stat_type) for stat_type in stat_types]
+    if None not in fingerprints:
+        return "|".join(fingerprints), None
+
+    data = load_repo_data(store, repo)
+    digest = hashlib.sha1(json.dumps(data, sort_keys=True).encode()).hexdigest()
+    return digest, data
+
+
+def write_file(path, content):
+    """
+    Atomically writes a text file, creating its directory if needed
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        f.write(content)
+    os.replace(tmp_path, path)
+
+
+def render_repo_page(app_name, repo, data):
+    """
+    Renders the views and clones charts of one repo
+    """
+    depth = repo_page(repo).count("/")
+    charts = [
+        pio.to_html(
+            create_figure(repo, stat_type, data),
+            full_html=False,
+            include_plotlyjs=False,
+        )
+        for stat_type in stat_types
+    ]
+    body = "\n".join(
+        [
+            f'<h1>{html.escape(app_name)}</h1>',
+            f'<p><a href="{"../" * depth}index.html">All repos</a></p>',
+            *charts,
+        ]
+    )
+    return page_template.format(
+        title=html.escape(f"{app_name} - {repo}"),
+        scripts=f'<script src="{"../" * depth + plotly_asset}"></script>',
+        body=body,
+    )
+
+
+def render_index_page(app_name, repos):
+    """
+    Renders the list of repos with their total views and clones
+    """
+    rows = "\n".join(
+        f'<tr><td><a href="{html.escape(repo_page(repo))}">{html.escape(repo)}</a></td>'
+        + "".join(f"<td>{entry['totals'][stat_type]}</td>" for stat_type in stat_types)
+        + "</tr>"
+        for repo, entry in sorted(repos.items())
+    )
+    header = "".join(f"<th>{stat_type.title()}</th>" for stat_type in stat_types)
+    body = (
+        f"<h1>{html.escape(app_name)}</h1>\n"
+        f"<table>\n<tr><th>Repository</th>{header}</tr>\n{rows}\n</table>"
+    )
+    return page_template.format(
+        title=html.escape(app_name),
+        scripts="",
+        body=body,
+    )
@@ -0,0 +1,342 @@
+"""
+Tiered retention for GitHub traffic stats
+
+Daily datapoints older than a retention horizon are compacted out of the hot
+store into one compressed, columnar archive object per repo and year, a
+gzipped JSON document of the form:
+
+    {"repo_name": "org/repo", "year": 2022,
+     "views": {"day": [0, 1, ...], "count": [...], "uniques": [...]},
+     "clones": {"day": [...], "count": [...], "uniques": [...]}}
+
+where day is the day of the year. Objects live on local disk or in S3. Once
+archived, the hot items are expired: DynamoDB marks them with an expires_at
+TTL attribute and deletes them in the background (reads skip them straight
+away), the file and memory stores delete them outright. TieredStore reads
+across both tiers, so reports see the full history either way.
+"""
+import gzip
+import json
+import os
+from collections import defaultdict
+from datetime import date, timedelta
+
+from stats_storage import StatsAccumulator, StatsStore, in_range, stat_types
+
+archive_suffix = ".json.gz"
+
+# The GitHub traffic API returns the last 14 days, anything younger than this
+# may still be re-fetched and must stay in the hot store
+min_horizon_days = 15
+
+
+class LocalArchive:
+    """
+    Keeps archive objects as files under a directory, also the local stand-in for S3
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def path(self, key):
+        return os.path.join(self.directory, key)
+
+    def get(self, key):
+        try:
+            with open(self.path(key), "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def put(self, key, data):
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def keys(self, prefix=""):
+        for root, _, files in os.walk(self.path(prefix.rstrip("/")) if prefix else self.directory):
+            for file in files:
+                if file.endswith(archive_suffix):
+                    yield os.path.relpath(os.path.join(root, file), self.directory).replace(os.sep, "/")
+
+    def version(self, key):
+        try:
+            stat = os.stat(self.path(key))
+        except FileNotFoundError:
+            return "missing"
+        return f"{stat.st_mtime_ns}-{stat.st_size}"
+
+
+class S3Archive:
+    """
+    Keeps archive objects in an S3 bucket under an optional key prefix
+    """
+
+    def __init__(self, bucket, prefix="", region_name=None):
+        from boto3 import client
+
+        self.bucket = bucket
+        self.prefix = f"{prefix.strip('/')}/" if prefix.strip("/") else ""
+        self.client = client("s3", region_name=region_name)
+
+    def get(self, key):
+        try:
+            response = self.client.get_object(Bucket=self.bucket, Key=self.prefix + key)
+        except self.client.exceptions.NoSuchKey:
+            return None
+        return response["Body"].read()
+
+    def put(self, key, data):
+        self.client.put_object(
+            Bucket=self.bucket, Key=self.prefix + key, Body=data, ContentType="application/gzip"
+        )
+
+    def keys(self, prefix=""):
+        paginator = self.client.get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=self.prefix + prefix):
+            for item in page.get("Contents", []):
+                if item["Key"].endswith(archive_suffix):
+                    yield item["Key"][len(self.prefix):]
+
+    def version(self, key):
+        # A HEAD request per object costs about as much as reading it
+        return None
+
+
+def open_archive(spec, region_name=None):
+    """
+    Opens an archive from a spec such as "file://./archive" or "s3://bucket/prefix"
+    """
+    scheme, _, location = spec.partition("://")
+    if scheme == "file":
+        return StatsArchive(LocalArchive(location))
+    if scheme == "s3":
+        bucket, _, prefix = location.partition("/")
+        return StatsArchive(S3Archive(bucket, prefix, region_name=region_name))
+    raise ValueError(f"Unknown stats archive: {spec}")
+
+
+def encode_year(repo_name, year, series):
+    """
+    Compresses one repo-year of {stat_type: {date: (count, uniques)}} into an archive object
+    """
+    first_day = date(year, 1, 1).toordinal()
+    document = {"repo_name": repo_name, "year": year}
+    for stat_type in stat_types:
+        dates = sorted(series.get(stat_type, {}))
+        values = [series[stat_type][d] for d in dates]
+        document[stat_type] = {
+            "day": [date.fromisoformat(d).toordinal() - first_day for d in dates],
+            "count": [v[0] for v in values],
+            "uniques": [v[1] for v in values],
+        }
+    return gzip.compress(json.dumps(document, separators=(",", ":")).encode())
+
+
+def decode_year(data):
+    """
+    Expands an archive object back into {stat_type: {date: (count, uniques)}}
+    """
+    document = json.loads(gzip.decompress(data))
+    first_day = date(document["year"], 1, 1)
+    series = {}
+    for stat_type in stat_types:
+        columns = document.get(stat_type, {"day": [], "count": [], "uniques": []})
+        series[stat_type] = {
+            (first_day + timedelta(days=day)).isoformat(): (count, uniques)
+            for day, count, uniques in zip(columns["day"], columns["count"], columns["uniques"])
+        }
+    return series
+
+
+class StatsArchive:
+    """
+    Reads and writes the per repo, per year archive objects of a backend
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+
+    @staticmethod
+    def object_key(repo_name, year):
+        return f"{repo_name}/{year}{archive_suffix}"
+
+    def years(self, repo_name, start=None, end=None):
+        """
+        Returns the archived years of the repo that overlap the date range
+        """
+        years = []
+        for key in self.backend.keys(f"{repo_name}/"):
+            year = key[len(repo_name) + 1:-len(archive_suffix)]
+            if year.isdigit() and in_range(year, start and start[:4], end and end[:4]):
+                years.append(int(year))
+        return sorted(years)
+
+    def load_year(self, repo_name, year):
+        data = self.backend.get(self.object_key(repo_name, year))
+        return decode_year(data) if data else {stat_type: {} for stat_type in stat_types}
+
+    def merge_records(self, records):
+        """
+        Merges records into their repo-year objects, replacing archived datapoints
+        of the same date; returns the number of objects written
+        """
+        grouped = defaultdict(list)
+        for record in records:
+            grouped[(record["repo_name"], int(record["date"][:4]))].append(record)
+
+        for (repo_name, year), year_records in grouped.items():
+            series = self.load_year(repo_name, year)
+            for record in year_records:
+                series[record["stat_type"]][record["date"]] = (record["count"], record["uniques"])
+            self.backend.put(self.object_key(repo_name, year), encode_year(repo_name, year, series))
+        return len(grouped)
+
+    def read_range(self, repo_name, stat_type, start=None, end=None):
+        records = []
+        for year in self.years(repo_name, start, end):
+            series = self.load_year(repo_name, year)[stat_type]
+            for day in sorted(series):
+                if in_range(day, start, end):
+                    count, uniques = series[day]
+                    records.append({
+                        "repo_name": repo_name,
+                        "stat_type": stat_type,
+                        "date": day,
+                        "timestamp": f"{day}T00:00:00Z",
+                        "count": count,
+                        "uniques": uniques,
+                    })
+        return records
+
+    def aggregate(self, start=None, end=None, totals=None):
+        """
+        Adds the archived counts and uniques in the date range to a StatsAccumulator
+        """
+        totals = totals or StatsAccumulator()
+        for repo_name in self.list_repos():
+            for year in self.years(repo_name, start, end):
+                series = self.load_year(repo_name, year)
+                for stat_type in stat_types:
+                    for day, (count, uniques) in series[stat_type].items():
+                        if in_range(day, start, end):
+                            totals.add(repo_name, stat_type, count, uniques)
+        return totals
+
+    def list_repos(self):
+        return sorted(set(key.rpartition("/")[0] for key in self.backend.keys()))
+
+    def fingerprint(self, repo_name):
+        versions = [
+            self.backend.version(self.object_key(repo_name, year)) for year in self.years(repo_name)
+        ]
+        if None in versions:
+            return None
+        return ",".join(versions)
+
+
+class TieredStore(StatsStore):
+    """
+    Hot store for recent datapoints backed by the archive for older ones;
+    writes go to the hot store, reads merge both tiers
+    """
+
+    def __init__(self, hot, archive):
+        self.hot = hot
+        self.archive = archive
+
+    def upsert_many(self, records, accumulate=False):
+        self.hot.upsert_many(records, accumulate=accumulate)
+
+    def expire_many(self, records):
+        self.hot.expire_many(records)
+
+    def upsert_traffic(self, traffic, accumulate=False):
+        self.hot.upsert_traffic(traffic, accumulate=accumulate)
+
+    def upsert_records(self, records, popular=None, accumulate=False):
+        self.hot.upsert_records(records, popular, accumulate=accumulate)
+
+    def put_popular(self, popular):
+        self.hot.put_popular(popular)
+
+    def read_popular(self, repo_name):
+        # Only the latest snapshot is kept, and never archived
+        return self.hot.read_popular(repo_name)
+
+    def read_range(self, repo_name, stat_type, start=None, end=None):
+        archived = self.archive.read_range(repo_name, stat_type, start, end)
+        recent = self.hot.read_range(repo_name, stat_type, start, end)
+        if not archived:
+            return recent
+        # A datapoint still in the hot store wins over its archived copy
+        merged = {record["date"]: record for record in archived}
+        merged.update((record["date"], record) for record in recent)
+        return [merged[day] for day in sorted(merged)]
+
+    def aggregate(self, start=None, end=None):
+        totals = StatsAccumulator()
+        for repo_name, repo_totals in self.hot.aggregate(start, end).items():
+            for stat_type, values in repo_totals.items():
+                totals.add(repo_name, stat_type, values["count"], values["uniques"])
+
+        # As in read_range, a day in both tiers (e.g. after an interrupted
+        # compaction) counts once, from the hot store; only the archived span
+        # of each repo-year is looked up there, which normally finds nothing
+        for repo_name in self.archive.list_repos():
+            for year in self.archive.years(repo_name, start, end):
+                series = self.archive.load_year(repo_name, year)
+                for stat_type in stat_types:
+                    days = sorted(day for day in series[stat_type] if in_range(day, start, end))
+                    if not days:
+                        continue
+                    recent = {r["date"] for r in self.hot.read_range(repo_name, stat_type, days[0], days[-1])}
+                    for day in days:
+                        if day not in recent:
+                            count, uniques = series[stat_type][day]
+                            totals.add(repo_name, stat_type, count, uniques)
+        return totals.totals()
+
+    def list_repos(self):
+        return sorted(set(self.hot.list_repos()) | set(self.archive.list_repos()))
+
+    def fingerprint(self, repo_name, stat_type):
+        hot = self.hot.fingerprint(repo_name, stat_type)
+        archived = self.archive.fingerprint(repo_name)
+        if hot is None or archived is None:
+            return None
+        return f"{hot}+{archived}"
+
+
+def compact(store, archive, horizon_days, today=None):
+    """
+    Moves the datapoints of every repo older than horizon_days from the store
+    into the archive, then expires them from the store; safe to re-run, as
+    archived datapoints are replaced by date
+    """
+    if horizon_days < min_horizon_days:
+        raise ValueError(f"Retention horizon must be at least {min_horizon_days} days")
+    if isinstance(store, TieredStore):
+        store = store.hot
+
+    today = today or date.today()
+    end = (today - timedelta(days=horizon_days + 1)).isoformat()
+    summary = {"repos": 0, "records": 0, "objects": 0, "archived_through": end}
+
+    for repo_name in store.list_repos():
+        records = [
+            record
+            for stat_type in stat_types
+            for record in store.read_range(repo_name, stat_type, end=end)
+        ]
+        if not records:
+            continue
+        # Archive first, so an interrupted run never loses datapoints
+        summary["objects"] += archive.merge_records(records)
+        store.expire_many(records)
+        summary["repos"] += 1
+        summary["records"] += len(records)
+    return summary
@@ -0,0 +1,10 @@
+"""
+Shared setup for the tests of the standalone app's modules
+
+The app is a directory of flat scripts rather than a package, so its
+directory is put on the path the same way running github_stats.py does.
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,98 @@
+"""
+Downsampling of long histories and the zoom range of relayout events
+"""
+from datetime import datetime, timedelta
+
+import pytest
+
+pytest.importorskip("plotly")
+
+from charts import choose_resolution, create_figure, downsample, visible_range
+
+
+def daily(start, days):
+    first = datetime.fromisoformat(start)
+    return [(first + timedelta(days=day), day + 1, 1) for day in range(days)]
+
+
+def chart_data(points):
+    return {
+        "views": [
+            {"timestamp": timestamp.strftime("%Y-%m-%dT%H:%M:%SZ"), "count": count, "uniques": uniques}
+            for timestamp, count, uniques in points
+        ]
+    }
+
+
+def figure_type(figure):
+    return figure.data[0].type
+
+
+@pytest.mark.parametrize(
+    "relayout, expected",
+    [
+        (None, False),
+        ({"autosize": True}, False),
+        ({"yaxis.range[0]": 0, "yaxis.range[1]": 9}, False),
+        ({"xaxis.autorange": True}, None),
+        (
+            {"xaxis.range[0]": "2023-01-01 06:30:00.1234", "xaxis.range[1]": "2023-03-01"},
+            [datetime(2023, 1, 1, 6, 30), datetime(2023, 3, 1)],
+        ),
+        ({"xaxis.range": ["2023-01-01", "2023-02-01 00:00"]}, [datetime(2023, 1, 1), datetime(2023, 2, 1)]),
+    ],
+)
+def test_visible_range(relayout, expected):
+    assert visible_range(relayout) == expected
+
+
+@pytest.mark.parametrize(
+    "days, max_points, expected",
+    [(100, None, "day"), (100, 100, "day"), (101, 100, "week"), (700, 100, "week"), (701, 100, "month"), (10000, 10, "month")],
+)
+def test_choose_resolution(days, max_points, expected):
+    start = datetime(2020, 1, 1)
+    assert choose_resolution([start, start + timedelta(days=days - 1)], max_points) == expected
+
+
+def test_downsample_keeps_totals():
+    points = daily("2023-01-01", 90)
+    for resolution in ("day", "week", "month"):
+        buckets = downsample(points, resolution)
+        assert sum(count for _, count, _ in buckets) == sum(count for _, count, _ in points)
+        assert sum(uniques for _, _, uniques in buckets) == 90
+
+
+def test_downsample_buckets_start_on_monday_and_the_first():
+    points = daily("2023-01-01", 90)
+    weeks = downsample(points, "week")
+    assert weeks[0] == (datetime(2022, 12, 26), 1, 1)
+    assert all(start.weekday() == 0 for start, _, _ in weeks)
+    assert [start for start, _, _ in downsample(points, "month")] == [
+        datetime(2023, 1, 1),
+        datetime(2023, 2, 1),
+        datetime(2023, 3, 1),
+    ]
+
+
+def test_full_history_is_downsampled_to_the_budget():
+    figure = create_figure("org/a", "views", chart_data(daily("2020-01-01", 1000)), max_points=200)
+    assert figure.layout.title.text == "org/a - views (weekly totals)"
+    assert len(figure.data[0].x) <= 200
+
+
+def test_zoomed_range_is_daily_and_trimmed():
+    data = chart_data(daily("2020-01-01", 1000))
+    x_range = [datetime(2021, 1, 1), datetime(2021, 2, 1)]
+    figure = create_figure("org/a", "views", data, x_range=x_range, max_points=200)
+
+    assert figure.layout.title.text == "org/a - views"
+    x = [datetime.fromisoformat(str(timestamp)) for timestamp in figure.data[0].x]
+    # One visible width of data either side of the zoomed range
+    assert min(x) == datetime(2020, 12, 1) and max(x) == datetime(2021, 3, 4)
+
+
+def test_webgl_above_the_point_threshold():
+    data = chart_data(daily("2023-01-01", 50))
+    assert figure_type(create_figure("org/a", "views", data, webgl_points=49)) == "scattergl"
+    assert figure_type(create_figure("org/a", "views", data, webgl_points=50)) == "bar"
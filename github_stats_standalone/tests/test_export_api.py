@@ -0,0 +1,146 @@
+"""
+The /api export endpoints: formats, validation, ETags and gzip
+"""
+import csv
+import gzip
+import io
+import json
+
+import pytest
+
+flask = pytest.importorskip("flask")
+
+from export_api import create_export_blueprint
+from stats_storage import open_store
+
+repos = ["org/a", "org/b"]
+
+
+def record(repo_name, stat_type, date, count, uniques=1):
+    return {
+        "repo_name": repo_name,
+        "stat_type": stat_type,
+        "date": date,
+        "timestamp": f"{date}T00:00:00Z",
+        "count": count,
+        "uniques": uniques,
+    }
+
+
+@pytest.fixture
+def store():
+    store = open_store("memory://")
+    store.upsert_many([
+        record("org/a", "views", "2023-04-01", 10, 3),
+        record("org/a", "views", "2023-04-02", 7, 1),
+        record("org/a", "clones", "2023-04-01", 2, 1),
+        record("org/b", "views", "2023-04-02", 4, 4),
+    ])
+    return store
+
+
+@pytest.fixture
+def client(store):
+    app = flask.Flask(__name__)
+    app.register_blueprint(create_export_blueprint(repos, store))
+    return app.test_client()
+
+
+def ndjson(response):
+    return [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+
+
+def test_series_as_ndjson(client):
+    response = client.get("/api/stats/org/a/views")
+    assert response.status_code == 200
+    assert response.mimetype == "application/x-ndjson"
+    assert [(row["date"], row["count"], row["uniques"]) for row in ndjson(response)] == [
+        ("2023-04-01", 10, 3),
+        ("2023-04-02", 7, 1),
+    ]
+
+
+def test_series_date_range(client):
+    rows = ndjson(client.get("/api/stats/org/a/views?start=2023-04-02&end=2023-04-02"))
+    assert [row["date"] for row in rows] == ["2023-04-02"]
+
+
+def test_aggregates_as_csv(client):
+    response = client.get("/api/aggregates?stat_type=views", headers={"Accept": "text/csv"})
+    assert response.mimetype == "text/csv"
+    rows = list(csv.DictReader(io.StringIO(response.get_data(as_text=True))))
+    assert [(row["repo"], row["days"], row["count"], row["uniques"]) for row in rows] == [
+        ("org/a", "2", "17", "4"),
+        ("org/b", "1", "4", "4"),
+    ]
+
+
+def test_format_parameter_overrides_accept(client):
+    response = client.get("/api/repos?format=csv", headers={"Accept": "application/x-ndjson"})
+    assert response.get_data(as_text=True).splitlines() == ["repo", "org/a", "org/b"]
+
+
+@pytest.mark.parametrize(
+    "path",
+    [
+        "/api/stats/org/a/views?start=April",
+        "/api/stats/org/a/views?end=2023-13-01",
+        "/api/repos?format=xml",
+    ],
+)
+def test_bad_parameters_are_400(client, path):
+    assert client.get(path).status_code == 400
+
+
+@pytest.mark.parametrize(
+    "path",
+    [
+        "/api/stats/org/missing/views",
+        "/api/stats/org/a/stars",
+        "/api/aggregates?stat_type=stars",
+        "/api/popular/org/a/stars",
+    ],
+)
+def test_unknown_names_are_404(client, path):
+    assert client.get(path).status_code == 404
+
+
+def test_unchanged_series_is_304(client):
+    etag = client.get("/api/stats/org/a/views").headers["ETag"]
+    response = client.get("/api/stats/org/a/views", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.get_data() == b""
+
+
+def test_etag_changes_with_the_series(client, store):
+    etag = client.get("/api/stats/org/a/views").headers["ETag"]
+    # Another series changing leaves the ETag alone
+    store.upsert_many([record("org/b", "views", "2023-04-03", 1)])
+    assert client.get("/api/stats/org/a/views", headers={"If-None-Match": etag}).status_code == 304
+
+    store.upsert_many([record("org/a", "views", "2023-04-03", 1)])
+    response = client.get("/api/stats/org/a/views", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+
+
+def test_etag_depends_on_the_format(client):
+    ndjson_etag = client.get("/api/stats/org/a/views").headers["ETag"]
+    csv_etag = client.get("/api/stats/org/a/views?format=csv").headers["ETag"]
+    assert ndjson_etag != csv_etag
+
+
+def test_gzip_when_accepted(client):
+    plain = client.get("/api/aggregates")
+    response = client.get("/api/aggregates", headers={"Accept-Encoding": "gzip"})
+    assert "Content-Encoding" not in plain.headers
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert gzip.decompress(response.get_data()) == plain.get_data()
+
+
+def test_popular_rows_have_no_etag(client, store):
+    referrer = {"referrer": "github.com", "count": 3, "uniques": 2}
+    store.put_popular({"org/a": {"date": "2023-04-14", "referrers": [referrer], "paths": []}})
+    response = client.get("/api/popular/org/a/referrers")
+    assert ndjson(response) == [{"repo": "org/a", "date": "2023-04-14", **referrer}]
+    assert "ETag" not in response.headers
@@ -0,0 +1,107 @@
+"""
+StoreWatcher reloads only the series that changed, at most once per poll interval
+"""
+import threading
+
+from live_reload import StoreWatcher
+from stats_storage import MemoryStore, StatsStore, open_store
+
+keys = [("org/a", "views"), ("org/a", "clones"), ("org/b", "views")]
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def record(repo_name, stat_type, date, count, uniques=1):
+    return {
+        "repo_name": repo_name,
+        "stat_type": stat_type,
+        "date": date,
+        "timestamp": f"{date}T00:00:00Z",
+        "count": count,
+        "uniques": uniques,
+    }
+
+
+def watch(store, poll_interval=10.0):
+    clock = FakeClock()
+    reloads = []
+    watcher = StoreWatcher(store, keys, reloads.append, poll_interval=poll_interval, clock=clock)
+    return watcher, clock, reloads
+
+
+def test_reloads_only_changed_series():
+    store = MemoryStore()
+    watcher, clock, reloads = watch(store)
+    store.upsert_many([record("org/a", "clones", "2023-04-01", 1)])
+
+    clock.now = 10
+    assert watcher.poll() == [("org/a", "clones")]
+    assert reloads == [[("org/a", "clones")]]
+    assert watcher.version == 1
+
+    # Nothing changed since
+    clock.now = 20
+    assert watcher.poll() == []
+    assert watcher.version == 1
+
+
+def test_polls_are_rate_limited():
+    store = MemoryStore()
+    watcher, clock, reloads = watch(store)
+    store.upsert_many([record("org/b", "views", "2023-04-01", 1)])
+
+    clock.now = 9.9
+    assert watcher.poll() == []
+    clock.now = 10
+    assert watcher.poll() == [("org/b", "views")]
+    store.upsert_many([record("org/b", "views", "2023-04-02", 1)])
+    clock.now = 15
+    assert watcher.poll() == []
+    assert len(reloads) == 1
+
+
+def test_json_file_store_changes_are_seen(tmp_path):
+    store = open_store(f"file://{tmp_path}/traffic_stats")
+    store.upsert_many([record("org/a", "views", "2023-04-01", 1)])
+    watcher, clock, reloads = watch(store)
+
+    store.upsert_many([record("org/a", "views", "2023-04-02", 22)])
+    clock.now = 10
+    assert watcher.poll() == [("org/a", "views")]
+    assert watcher.client_fingerprints()["org/a|views"] == store.fingerprint("org/a", "views")
+
+
+def test_disabled_without_fingerprints_or_interval():
+    class UnversionedStore(MemoryStore):
+        fingerprint = StatsStore.fingerprint
+
+    assert not watch(UnversionedStore())[0].enabled
+    watcher, clock, reloads = watch(MemoryStore(), poll_interval=0)
+    assert not watcher.enabled
+    clock.now = 100
+    assert watcher.poll() == []
+
+
+def test_concurrent_polls_reload_once():
+    store = MemoryStore()
+    watcher, clock, reloads = watch(store)
+    started = threading.Barrier(4)
+
+    def poll():
+        started.wait()
+        watcher.poll()
+
+    store.upsert_many([record("org/a", "views", "2023-04-01", 1)])
+    clock.now = 10
+    threads = [threading.Thread(target=poll) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert reloads == [[("org/a", "views")]]
@@ -0,0 +1,98 @@
+"""
+Incremental static site export driven by the manifest of repo fingerprints
+"""
+import json
+import os
+
+import pytest
+
+pytest.importorskip("plotly")
+
+import static_export
+from static_export import export_static_site
+from stats_storage import MemoryStore
+
+repos = ["org/a", "org/b", "org/c"]
+
+
+def record(repo_name, stat_type, date, count, uniques=1):
+    return {
+        "repo_name": repo_name,
+        "stat_type": stat_type,
+        "date": date,
+        "timestamp": f"{date}T00:00:00Z",
+        "count": count,
+        "uniques": uniques,
+    }
+
+
+class UnversionedStore(MemoryStore):
+    """
+    A store that cannot fingerprint its series, so the export hashes the data
+    """
+
+    def fingerprint(self, repo_name, stat_type):
+        return None
+
+
+@pytest.fixture(params=[MemoryStore, UnversionedStore])
+def store(request):
+    store = request.param()
+    store.upsert_many([record(repo, "views", "2023-04-01", 1 + i) for i, repo in enumerate(repos)])
+    return store
+
+
+def export(store, output_dir, repos=repos):
+    return export_static_site("GitHub Stats App", repos, store, str(output_dir))
+
+
+def manifest(output_dir):
+    with open(output_dir / "manifest.json") as f:
+        return json.load(f)
+
+
+def test_first_export_writes_every_page(store, tmp_path):
+    assert export(store, tmp_path) == repos
+    for repo in repos:
+        assert (tmp_path / "repos" / f"{repo}.html").exists()
+    assert (tmp_path / "assets" / "plotly.min.js").exists()
+    assert manifest(tmp_path)["repos"]["org/b"]["totals"] == {"views": 2, "clones": 0}
+    assert 'href="repos/org/c.html"' in (tmp_path / "index.html").read_text()
+
+
+def test_unchanged_export_writes_nothing(store, tmp_path):
+    export(store, tmp_path)
+    index_mtime = os.stat(tmp_path / "index.html").st_mtime_ns
+    assert export(store, tmp_path) == []
+    assert os.stat(tmp_path / "index.html").st_mtime_ns == index_mtime
+
+
+def test_only_changed_repos_are_rewritten(store, tmp_path):
+    export(store, tmp_path)
+    store.upsert_many([record("org/b", "clones", "2023-04-02", 5)])
+
+    assert export(store, tmp_path) == ["org/b"]
+    assert manifest(tmp_path)["repos"]["org/b"]["totals"] == {"views": 2, "clones": 5}
+    assert "<td>5</td>" in (tmp_path / "index.html").read_text()
+
+
+def test_missing_page_is_rewritten(store, tmp_path):
+    export(store, tmp_path)
+    os.remove(tmp_path / "repos" / "org" / "a.html")
+    assert export(store, tmp_path) == ["org/a"]
+
+
+def test_removed_repo_is_dropped(store, tmp_path):
+    export(store, tmp_path)
+    assert export(store, tmp_path, repos=["org/a", "org/b"]) == []
+
+    assert not (tmp_path / "repos" / "org" / "c.html").exists()
+    assert sorted(manifest(tmp_path)["repos"]) == ["org/a", "org/b"]
+    assert "org/c" not in (tmp_path / "index.html").read_text()
+
+
+def test_plotly_upgrade_rewrites_every_page(store, tmp_path, monkeypatch):
+    export(store, tmp_path)
+    monkeypatch.setattr(static_export.plotly, "__version__", "0.0.0")
+    assert export(store, tmp_path) == repos
+    assert manifest(tmp_path)["plotly_version"] == "0.0.0"
@@ -0,0 +1,194 @@
+"""
+Pool of GitHub tokens with per-token rate limit budgets
+
+Each token (a personal access token, or a GitHub App installation token
+minted elsewhere) tracks its remaining quota and reset time from the
+X-RateLimit-* headers of its responses. Every request is routed to the
+eligible token with the most headroom, so a large sync spreads over all the
+quotas instead of stalling on one. Tokens can be scoped to repo patterns
+such as "my-org/*", for teams whose repos need a token with push access
+there; a token refused by GitHub is retried with the next eligible one. Org
+level requests, such as listing a team's repos, may use any token scoped to
+repos of the org.
+
+Tokens are read from GITHUB_TOKENS, a comma separated list of entries of the
+form "token" or "pattern|pattern=token", falling back to GITHUB_TOKEN.
+"""
+import fnmatch
+import logging
+import threading
+import time
+
+logger = logging.getLogger("GitHubStats")
+
+# The hourly REST API quota of a token, assumed until GitHub reports it
+default_limit = 5000
+
+
+class RateLimitExhausted(Exception):
+    """
+    Raised when every token for a repo is out of quota for longer than the pool may wait
+    """
+
+
+class PooledToken:
+    """
+    One token, the repos it may be used for and its last known rate limit budget
+    """
+
+    def __init__(self, token, repos=("*",)):
+        self.token = token
+        self.repos = tuple(repos)
+        self.limit = default_limit
+        self.remaining = None
+        self.reset = 0.0
+        self.in_flight = 0
+
+    @property
+    def name(self):
+        # Enough to tell tokens apart in logs without leaking them
+        return f"...{self.token[-4:]}"
+
+    def matches(self, repo):
+        """
+        Returns whether the token may be used for the repo; an org's own endpoints,
+        asked for as "my-org/", may use any token scoped to repos of that org
+        """
+        org_name, _, repo_name = repo.partition("/")
+        if not repo_name:
+            return any(fnmatch.fnmatchcase(org_name, pattern.partition("/")[0]) for pattern in self.repos)
+        return any(fnmatch.fnmatchcase(repo, pattern) for pattern in self.repos)
+
+    def headroom(self, now):
+        """
+        Returns the requests left before the reset, less those already in flight
+        """
+        remaining = self.limit if self.remaining is None or now >= self.reset else self.remaining
+        return remaining - self.in_flight
+
+
+class TokenPool:
+    """
+    Routes GitHub requests to the token with the most rate limit headroom
+    """
+
+    def __init__(self, tokens, max_wait=60.0, clock=time.time, sleep=time.sleep):
+        self.tokens = list(tokens)
+        self.max_wait = max_wait
+        self.clock = clock
+        self.sleep = sleep
+        self.lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, env, **kwargs):
+        """
+        Builds the pool from GITHUB_TOKENS, or the single GITHUB_TOKEN
+        """
+        tokens = []
+        for entry in (env.get("GITHUB_TOKENS") or "").split(","):
+            patterns, _, token = entry.strip().rpartition("=")
+            if token:
+                tokens.append(PooledToken(token, patterns.split("|") if patterns else ("*",)))
+        if not tokens and env.get("GITHUB_TOKEN"):
+            tokens.append(PooledToken(env["GITHUB_TOKEN"]))
+        return cls(tokens, **kwargs)
+
+    def __bool__(self):
+        return bool(self.tokens)
+
+    def acquire(self, repo, exclude=()):
+        """
+        Reserves the eligible token with the most headroom, waiting for a reset if
+        all are exhausted; returns None once every eligible token was excluded
+        """
+        while True:
+            with self.lock:
+                now = self.clock()
+                eligible = [t for t in self.tokens if t.matches(repo)]
+                if not eligible:
+                    raise ValueError(f"No GitHub token configured for {repo}")
+                candidates = [t for t in eligible if t not in exclude]
+                if not candidates:
+                    return None
+
+                best = max(candidates, key=lambda t: t.headroom(now))
+                if best.headroom(now) > 0:
+                    best.in_flight += 1
+                    return best
+                wait = min(t.reset for t in candidates) - now
+
+            if wait > self.max_wait:
+                raise RateLimitExhausted(
+                    f"All GitHub tokens for {repo} are rate limited for another {wait:.0f}s"
+                )
+            logger.info(f"All GitHub tokens for {repo} are rate limited, waiting {wait:.0f}s")
+            self.sleep(max(wait, 0.1))
+
+    def update(self, token, remaining=None, reset=None, limit=None):
+        """
+        Records a token's budget, e.g. from PyGithub's rate_limiting
+        """
+        with self.lock:
+            if limit is not None:
+                token.limit = int(limit)
+            if remaining is not None:
+                token.remaining = int(remaining)
+            if reset is not None:
+                token.reset = float(reset)
+
+    def release(self, token, response=None):
+        """
+        Returns a reserved token, recording the budget reported by the response
+        """
+        with self.lock:
+            token.in_flight -= 1
+        if response is None:
+            return
+
+        headers = response.headers
+        self.update(
+            token,
+            remaining=headers.get("X-RateLimit-Remaining"),
+            reset=headers.get("X-RateLimit-Reset"),
+            limit=headers.get("X-RateLimit-Limit"),
+        )
+        if response.status_code in (403, 429) and headers.get("Retry-After"):
+            # Secondary rate limit: back off this token for the time GitHub asks
+            self.update(token, remaining=0, reset=self.clock() + float(headers["Retry-After"]))
+
+    @staticmethod
+    def is_rate_limited(response):
+        return response.status_code == 429 or (
+            response.status_code == 403
+            and (response.headers.get("X-RateLimit-Remaining") == "0" or "Retry-After" in response.headers)
+        )
+
+    def get(self, session, url, repo, **kwargs):
+        """
+        GETs a GitHub API URL for the repo with the best token, moving on to another
+        token when one is rate limited or refused access
+        """
+        headers = kwargs.pop("headers", {})
+        refused = []
+        response = None
+        for _ in range(2 * len(self.tokens) + 1):
+            token = self.acquire(repo, exclude=refused)
+            if token is None:
+                break
+            response = None
+            try:
+                response = session.get(
+                    url, headers={**headers, "Authorization": f"token {token.token}"}, **kwargs
+                )
+            finally:
+                self.release(token, response)
+
+            if self.is_rate_limited(response):
+                logger.info(f"GitHub token {token.name} is rate limited")
+                continue
+            if response.status_code in (401, 403, 404):
+                # Traffic endpoints need push access, another token may have it
+                refused.append(token)
+                continue
+            return response
+        return response
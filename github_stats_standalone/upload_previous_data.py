@@ -1,57 +1,37 @@
 #!/usr/bin/env python3
 
 import os
-import boto3
 import json
 import math
-from datetime import datetime
-from decimal import Decimal
 
-AWS_REGION = "eu-west-1"
+from stats_storage import DynamoDBStore, make_record
+
+AWS_REGION = os.environ.get("AWS_REGION", "eu-west-1")
 DDB_TABLE_NAME = "github_stats"
 
 directory_path = "/Users/taylaand/code/personal/github/monitoring-github-stats/github_stats_standalone/traffic_stats_orig" \
                  "/aws-samples"
 
-# Set up the DynamoDB resource and the table
-dynamodb_resource = boto3.resource('dynamodb', region_name=AWS_REGION)
-table_name = DDB_TABLE_NAME  # Replace with the actual table name
-table = dynamodb_resource.Table(table_name)
+# Set up the DynamoDB store for the table
+store = DynamoDBStore(DDB_TABLE_NAME, region_name=AWS_REGION)
 
-def upload_previous_stats(repo_name, views_data, clones_data, table):
+def upload_previous_stats(repo_name, views_data, clones_data, store):
+    records = []
     for data_type, data in [("views", views_data), ("clones", clones_data)]:
         if data is None:
             continue
 
         for item in data:
-            item["repo_name"] = repo_name
-            item["stat_type"] = data_type
-            item["date"] = datetime.strptime(
-                item["timestamp"], "%Y-%m-%dT%H:%M:%SZ"
-            ).strftime("%Y-%m-%d")
+            record = make_record(repo_name, data_type, item)
 
             # Calculate unique value based on 10% of the non-unique count
-            uniques_value = math.ceil(item["count"] * 0.1)
-
-            # Update item in the DynamoDB table
-            table.update_item(
-                Key={
-                    "repo_name": item["repo_name"],
-                    "stat_type": f"{item['date']}_{item['stat_type']}"
-                },
-                UpdateExpression="SET #count = :count, #uniques = :uniques",
-                ExpressionAttributeNames={
-                    "#count": "count",
-                    "#uniques": "uniques"
-                },
-                ExpressionAttributeValues={
-                    ":count": Decimal(str(item["count"])),
-                    ":uniques": Decimal(str(uniques_value))
-                },
-                ReturnValues="UPDATED_NEW"
-            )
-
-def process_files_in_directory(directory, table):
+            record["uniques"] = math.ceil(item["count"] * 0.1)
+            records.append(record)
+
+    # Overwrite the items in the DynamoDB table in one batch
+    store.upsert_many(records)
+
+def process_files_in_directory(directory, store):
     files = os.listdir(directory)
 
     for file in files:
@@ -73,8 +53,8 @@ def process_files_in_directory(directory, table):
             views_data = data["views"]
             clones_data = None
 
-        upload_previous_stats(repo_name, views_data, clones_data, table)
+        upload_previous_stats(repo_name, views_data, clones_data, store)
 
 # Replace 'directory_path' with the actual directory containing your JSON files
-# process_files_in_directory(directory_path, table)
-process_files_in_directory(directory_path, table)
+# process_files_in_directory(directory_path, store)
+process_files_in_directory(directory_path, store)